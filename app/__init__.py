@@ -1,6 +1,6 @@
 from flask import Flask
 from flask_login import LoginManager
-from app.models import db, User
+from app.models import db
 from config import Config
 from datetime import timedelta, datetime, date
 
@@ -12,6 +12,10 @@ def create_app(config_class=Config):
 
     # Initialize extensions
     db.init_app(app)
+    if app.config['DB_STATEMENT_CACHE_SIZE'] and app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgresql+pg8000'):
+        # Reuse prepared statements on each Postgres connection, see app/statement_cache.py
+        from app import statement_cache
+        statement_cache.install(app)
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
     login_manager.login_message = 'Please log in to access this page.'
@@ -23,53 +27,35 @@ def create_app(config_class=Config):
         date=date
     )
 
-    @login_manager.user_loader
-    def load_user(user_id):
-        return User.query.get(int(user_id))
+    # One query per request for the user and their doctor/patient profile, see app/profiles.py
+    from app import profiles
+    login_manager.user_loader(profiles.load_user)
+    profiles.install(app)
+
+    # Per-request SQL and render timings when INSTRUMENTATION is on
+    from app import profiling
+    profiling.install(app)
+
+    # {% cache %} tag for template fragments, invalidated by model changes
+    from app import fragments
+    fragments.install(app)
+
+    # Content-hashed static URLs served with long-lived caching, see app/http_cache.py
+    from app import http_cache
+    http_cache.install(app)
 
     # Register blueprints
     from app.routes import register_blueprints
     register_blueprints(app)
 
-    # Create database and default admin
-    with app.app_context():
-        db.create_all()
-        create_default_admin()
-        create_default_departments()
+    # Register CLI commands
+    from app.cli import register_commands
+    register_commands(app)
 
-    return app
-
-def create_default_admin():
-    """Create default admin user if not exists"""
-    admin = User.query.filter_by(role='admin', username='admin').first()
-    if not admin:
-        admin = User(
-            username='admin',
-            email='admin@hospital.com',
-            role='admin'
-        )
-        admin.set_password('admin123')
-        db.session.add(admin)
-        db.session.commit()
-        print("Default admin created - Username: admin, Password: admin123")
+    # Create and seed the database on the first request rather than at import time,
+    # see app/bootstrap.py (deployments can run `flask init-db` and turn this off)
+    if app.config['AUTO_INIT_DB']:
+        from app.bootstrap import ensure_ready
+        app.before_request(lambda: ensure_ready(app))
 
-def create_default_departments():
-    """Create default departments if not exists"""
-    from app.models import Department
-    
-    departments = [
-        {'name': 'Cardiology', 'description': 'Heart and cardiovascular system'},
-        {'name': 'Neurology', 'description': 'Brain and nervous system'},
-        {'name': 'Orthopedics', 'description': 'Bones and muscles'},
-        {'name': 'Pediatrics', 'description': 'Children healthcare'},
-        {'name': 'Dermatology', 'description': 'Skin conditions'},
-        {'name': 'General Medicine', 'description': 'General health issues'},
-    ]
-    
-    for dept_data in departments:
-        dept = Department.query.filter_by(name=dept_data['name']).first()
-        if not dept:
-            dept = Department(**dept_data)
-            db.session.add(dept)
-    
-    db.session.commit()
+    return app
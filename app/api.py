@@ -0,0 +1,187 @@
+"""Versioned JSON API (``/api/v1``) for mobile and kiosk clients.
+
+Listings return ``{"items": [...], "next_cursor": ..., "prev_cursor": ...}``
+and accept the same filters and keyset cursors as the HTML pages. Queries
+select only the serialized columns (see app/serializers.py). Clients
+authenticate with the same session cookie as the web UI, obtained from
+``POST /api/v1/session``.
+"""
+from datetime import date, timedelta
+from functools import wraps
+from flask import Blueprint, jsonify, request, current_app
+from flask_login import login_user, logout_user, current_user
+from app.models import db, User, Patient, Doctor, Appointment
+from app.queries import appointment_filters, doctor_filters
+from app.pagination import keyset_paginate
+from app import reports, schedules, serializers, stats, timeline
+from app.slots import free_slots
+from app.profiles import current_doctor, current_patient
+
+api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# Upper bound for ?per_page= and for ?days= on slot lookups
+MAX_PER_PAGE = 100
+MAX_SLOT_DAYS = 31
+
+
+def error(message, status):
+    return jsonify({'error': message}), status
+
+
+def api_login_required(*roles):
+    """Like login_required plus a role check, but answers with JSON 401/403 instead of redirecting"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not current_user.is_authenticated:
+                return error('Authentication required', 401)
+            if roles and current_user.role not in roles:
+                return error('Forbidden', 403)
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+def _per_page():
+    per_page = request.args.get('per_page', type=int) or current_app.config['ITEMS_PER_PAGE']
+    return max(1, min(per_page, MAX_PER_PAGE))
+
+
+def _page_response(page, serializer, **extra):
+    return jsonify(items=serializer.dump_all(page.items),
+                   next_cursor=page.next_cursor,
+                   prev_cursor=page.prev_cursor,
+                   **extra)
+
+
+@api_bp.errorhandler(404)
+def not_found(e):
+    return error('Not found', 404)
+
+
+# ============== SESSION ==============
+
+@api_bp.route('/session', methods=['POST'])
+def create_session():
+    data = request.get_json(silent=True) or {}
+    user = User.query.filter_by(username=data.get('username')).first()
+    if not user or not user.check_password(data.get('password') or ''):
+        return error('Invalid username or password', 401)
+    if not user.is_active:
+        return error('Account deactivated', 403)
+    login_user(user)
+    if db.session.is_modified(user):
+        db.session.commit()  # password re-hashed with the current parameters
+    return jsonify(id=user.id, username=user.username, role=user.role)
+
+
+@api_bp.route('/session', methods=['DELETE'])
+def delete_session():
+    logout_user()
+    return '', 204
+
+
+# ============== RESOURCES ==============
+
+@api_bp.route('/appointments')
+@api_login_required()
+def appointments():
+    """Appointments visible to the current user, newest first"""
+    query = appointment_filters(serializers.appointments_query(),
+                                request.args.get('search', ''),
+                                request.args.get('status', ''),
+                                request.args.get('date_from', ''))
+    # The profile was loaded with the user, see app/profiles.py
+    if current_user.role == 'doctor':
+        query = query.filter(Appointment.doctor_id == getattr(current_doctor(), 'id', None))
+    elif current_user.role == 'patient':
+        query = query.filter(Appointment.patient_id == getattr(current_patient(), 'id', None))
+
+    page = keyset_paginate(query,
+                           [Appointment.appointment_date, Appointment.appointment_time, Appointment.id],
+                           cursor=request.args.get('cursor'),
+                           per_page=_per_page(),
+                           descending=True)
+    return _page_response(page, serializers.appointment)
+
+
+@api_bp.route('/doctors')
+@api_login_required()
+def doctors():
+    """Active doctors, each with their availability windows for the next 7 days"""
+    query = serializers.doctors_query().join(User, Doctor.user_id == User.id).filter(User.is_active == True)
+    query = doctor_filters(query, request.args.get('search', ''), request.args.get('department', ''))
+    page = keyset_paginate(query, [Doctor.id], cursor=request.args.get('cursor'), per_page=_per_page())
+
+    # One range query for the whole page instead of one per doctor
+    today = date.today()
+    windows = schedules.load([row.id for row in page.items], today, today + timedelta(days=7))
+
+    items = []
+    for row in page.items:
+        item = serializers.doctor.dump(row)
+        item['availability'] = serializers.availability.dump_all(windows.get(row.id, []))
+        items.append(item)
+    return jsonify(items=items, next_cursor=page.next_cursor, prev_cursor=page.prev_cursor)
+
+
+@api_bp.route('/doctors/<int:doctor_id>/slots')
+@api_login_required()
+def doctor_slots(doctor_id):
+    """Open booking slots, ``?from=YYYY-MM-DD&days=7``"""
+    if not db.session.query(Doctor.id).filter_by(id=doctor_id).first():
+        return error('Not found', 404)
+    try:
+        start = date.fromisoformat(request.args['from']) if request.args.get('from') else date.today()
+    except ValueError:
+        return error('Invalid from date', 400)
+    days = max(1, min(request.args.get('days', 7, type=int), MAX_SLOT_DAYS))
+
+    slots = free_slots(doctor_id, start, start + timedelta(days=days - 1))
+    return jsonify(doctor_id=doctor_id,
+                   slots=[{'date': day.isoformat(), 'times': [t.strftime('%H:%M') for t in times]}
+                          for day, times in slots.items()])
+
+
+@api_bp.route('/patients/<int:patient_id>/history')
+@api_login_required()
+def patient_history(patient_id):
+    """Completed visits with treatments, newest first (doctors, admins and the patient).
+
+    The first page also carries the cached summary; later pages are fetched with ``next_cursor`` as the client scrolls.
+    """
+    patient = db.session.query(Patient.id, Patient.user_id).filter_by(id=patient_id).first()
+    if not patient:
+        return error('Not found', 404)
+    if current_user.role == 'patient' and patient.user_id != current_user.id:
+        return error('Forbidden', 403)
+
+    cursor = request.args.get('cursor')
+    per_page = _per_page() if request.args.get('per_page') else None
+    page = timeline.visit_rows(patient_id, cursor=cursor, per_page=per_page)
+    extra = {} if cursor else {'summary': timeline.summary(patient_id)}
+    return _page_response(page, serializers.visit, patient_id=patient_id, **extra)
+
+
+@api_bp.route('/dashboard/stats')
+@api_login_required('admin')
+def dashboard_stats():
+    """The admin dashboard totals, from the precomputed counters"""
+    today_key = stats.appointments_on(date.today())
+    counts = stats.read([stats.DOCTORS, stats.PATIENTS, stats.APPOINTMENTS, today_key])
+    return jsonify(total_doctors=counts[stats.DOCTORS],
+                   total_patients=counts[stats.PATIENTS],
+                   total_appointments=counts[stats.APPOINTMENTS],
+                   today_appointments=counts[today_key])
+
+
+@api_bp.route('/reports/appointments')
+@api_login_required('admin')
+def appointment_report():
+    """Appointment volumes, no-show rate and lead time per day, department and top doctor, from the rollups"""
+    try:
+        start, end, department_id = reports.parse_range(request.args)
+    except ValueError as e:
+        return error(str(e), 400)
+    reports.refresh_if_stale()
+    return jsonify(reports.report(start, end, department_id))
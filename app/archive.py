@@ -0,0 +1,129 @@
+"""Hot/cold tiering of appointment history.
+
+``appointments`` and ``treatments`` would otherwise grow with every visit
+ever made, and every listing, dashboard and index over them with it.
+Completed and cancelled appointments dated more than ``ARCHIVE_AFTER_DAYS``
+days ago are moved, with their treatments, to ``archived_appointments``
+and ``archived_treatments``: tables with the same columns and ids, plus
+``archived_at``. :func:`run` moves ``ARCHIVE_BATCH_SIZE`` appointments per
+transaction, so it runs online next to booking traffic; the job worker
+calls it every ``ARCHIVE_INTERVAL`` seconds and ``flask archive-appointments``
+runs it by hand. The hot tables then hold open bookings and recent history
+only, whatever the age of the hospital.
+
+Reads of history go to both tiers (:data:`TIERS`): patient timelines and
+dashboards, prescriptions, exports, and the roster, report and counter
+aggregates. Each tier is queried on its own and the results are merged,
+rather than through a ``UNION ALL`` subquery, which SQLite materialises in
+full when it is joined or correlated. Screens of current activity (the
+admin appointment list, schedules, ``/api/v1/appointments``) read the hot
+tier only.
+"""
+from datetime import date, datetime, timedelta
+from flask import current_app
+from sqlalchemy import delete, insert, literal, tuple_
+from app.models import db, Appointment, ArchivedAppointment, ArchivedTreatment, Treatment
+
+# (appointment model, treatment model) of each tier, hot first
+TIERS = [(Appointment, Treatment), (ArchivedAppointment, ArchivedTreatment)]
+
+CLOSED = ('Completed', 'Cancelled')
+
+# Archival scan order, matching ix_appointments_date_time_id
+ORDER = [Appointment.appointment_date, Appointment.appointment_time, Appointment.id]
+
+
+def horizon():
+    """Appointments dated before this day are archived, or None when archiving is off"""
+    days = current_app.config['ARCHIVE_AFTER_DAYS']
+    return date.today() - timedelta(days=days) if days else None
+
+
+def get(appointment_id, load=None):
+    """The appointment with this id from whichever tier holds it, or None; ``load(model)`` builds the query"""
+    for model, _ in TIERS:
+        query = load(model) if load else model.query
+        appointment = query.filter(model.id == appointment_id).first()
+        if appointment is not None:
+            return appointment
+    return None
+
+
+def _copy(source, target, where, archived_at):
+    columns = [column.name for column in source.__table__.columns]
+    db.session.execute(insert(target).from_select(
+        columns + ['archived_at'],
+        db.select(*source.__table__.columns, literal(archived_at, db.DateTime)).where(where)))
+
+
+def _reuses_ids(model):
+    """Whether the database may hand out the highest id of ``model``'s table again once it is deleted.
+
+    SQLite does for tables created without AUTOINCREMENT, i.e. by releases before archiving.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return False
+    sql = db.session.execute(db.text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                             {'name': model.__tablename__}).scalar()
+    return 'AUTOINCREMENT' not in (sql or '').upper()
+
+
+def archive_batch(before, batch_size, after=None):
+    """Move up to ``batch_size`` closed appointments dated before ``before`` and their treatments, and commit.
+
+    ``after`` is the :data:`ORDER` key the previous batch stopped at. Returns ``(moved, last key scanned)``.
+    """
+    conditions = [Appointment.appointment_date < before, Appointment.status.in_(CLOSED)]
+    # On tables that reuse ids, the newest appointment and treatment stay, so that no id of the
+    # archive is handed out again
+    if _reuses_ids(Appointment):
+        conditions.append(Appointment.id < db.select(db.func.max(Appointment.id)).scalar_subquery())
+    if _reuses_ids(Treatment):
+        newest = db.select(Treatment.appointment_id).where(
+            Treatment.id == db.select(db.func.max(Treatment.id)).scalar_subquery())
+        conditions.append(Appointment.id.not_in(newest))
+    query = (db.select(*ORDER)
+             .where(*conditions)
+             .order_by(*ORDER)
+             .limit(batch_size)
+             # Skip rows a request is changing; they are picked up by the next run
+             .with_for_update(skip_locked=True))
+    if after is not None:
+        query = query.where(tuple_(*ORDER) > tuple_(*after))
+    keys = db.session.execute(query).all()
+    if not keys:
+        db.session.rollback()
+        return 0, None
+    ids = [key.id for key in keys]
+    archived_at = datetime.utcnow()
+    moving = Appointment.id.in_(ids)
+
+    _copy(Appointment, ArchivedAppointment, moving, archived_at)
+    _copy(Treatment, ArchivedTreatment, Treatment.appointment_id.in_(ids), archived_at)
+    db.session.execute(delete(Treatment).where(Treatment.appointment_id.in_(ids))
+                       .execution_options(synchronize_session=False))
+    db.session.execute(delete(Appointment).where(moving).execution_options(synchronize_session=False))
+    db.session.commit()
+    return len(ids), tuple(keys[-1])
+
+
+def run(batch_size=None, before=None):
+    """Archive every closed appointment older than the horizon (or ``before``), a batch at a time.
+
+    Returns the number of appointments moved.
+    """
+    before = before or horizon()
+    if before is None:
+        return 0
+    batch_size = batch_size or current_app.config['ARCHIVE_BATCH_SIZE']
+    moved, after = 0, None
+    while True:
+        count, after = archive_batch(before, batch_size, after)
+        moved += count
+        if count < batch_size:
+            return moved
+
+
+def counts():
+    """``(hot, archived)`` appointment counts"""
+    return tuple(db.session.query(db.func.count(model.id)).scalar() for model, _ in TIERS)
@@ -0,0 +1,140 @@
+"""Database initialisation and seeding, kept off the cold-start path.
+
+``create_app`` no longer touches the database. Schema creation and seeding
+run from ``flask init-db`` / ``flask seed`` at deploy time or, unless
+``AUTO_INIT_DB`` is off, from a guard that runs before the first request
+each process serves. The guard costs one ``SELECT`` against the
+``schema_version`` table; it only creates tables and seeds when the stamp
+is missing or older than :data:`SCHEMA_VERSION`, and later requests skip
+it entirely. On an existing database it adds the missing tables and
+columns and nothing else: search indexing and the roster and report
+backfills read whole tables and are left to ``flask init-db``.
+"""
+import os
+import threading
+from sqlalchemy import inspect
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError, OperationalError, ProgrammingError
+from app.models import db, User, Department, Appointment, DoctorPatient, ReportWatermark, SchemaVersion
+from app import reports, roster, search
+from app.schema import add_missing_columns, apply_indexes
+
+# Bump whenever a deployed database needs init_db() to run again (new tables or columns, search structures, ...)
+# 2: updated_at on departments, doctors and patients
+# 3: doctor_patients roster
+# 4: doctor_weekly_schedules
+# 5: appointment and department daily rollups
+# 6: treatments.updated_at
+# 7: jobs table, appointments.reminder_sent_at
+# 8: archived_appointments and archived_treatments
+SCHEMA_VERSION = 8
+
+DEFAULT_DEPARTMENTS = [
+    {'name': 'Cardiology', 'description': 'Heart and cardiovascular system'},
+    {'name': 'Neurology', 'description': 'Brain and nervous system'},
+    {'name': 'Orthopedics', 'description': 'Bones and muscles'},
+    {'name': 'Pediatrics', 'description': 'Children healthcare'},
+    {'name': 'Dermatology', 'description': 'Skin conditions'},
+    {'name': 'General Medicine', 'description': 'General health issues'},
+]
+
+_lock = threading.Lock()
+
+
+def _ensure_sqlite_dir(app):
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite' and url.database and url.database != ':memory:':
+        os.makedirs(os.path.dirname(os.path.abspath(url.database)), exist_ok=True)
+
+
+def current_version():
+    """The stamped schema version, or None if the database has not been initialised"""
+    try:
+        return db.session.query(db.func.max(SchemaVersion.version)).scalar()
+    except (OperationalError, ProgrammingError):
+        # No schema_version table yet
+        db.session.rollback()
+        return None
+
+
+def init_db(app, backfill=True):
+    """Create missing tables and columns, then stamp the schema version.
+
+    With ``backfill``, also create missing non-unique indexes, build the search
+    structures and fill the roster and report rollups from existing appointments. That reads whole tables, so the
+    request-time guard leaves it to ``flask init-db`` on existing databases.
+    """
+    _ensure_sqlite_dir(app)
+    db.create_all()
+    add_missing_columns(db.engine)
+    if backfill:
+        # Indexes declared since the database was created; unique ones may need duplicate rows
+        # resolved first and are left to `flask apply-indexes`. No transaction may stay open
+        # while Postgres builds them concurrently
+        db.session.commit()
+        apply_indexes(db.engine, unique=False)
+        # Appointments that predate the roster
+        if db.session.query(Appointment.id).first() and not db.session.query(DoctorPatient.doctor_id).first():
+            roster.rebuild()
+        if db.session.get(ReportWatermark, reports.WATERMARK) is None:
+            reports.refresh(full=True)
+        search.install(app)
+    if current_version() != SCHEMA_VERSION:
+        db.session.add(SchemaVersion(version=SCHEMA_VERSION))
+        db.session.commit()
+
+
+def create_default_admin():
+    """Create default admin user if not exists"""
+    admin = User.query.filter_by(role='admin', username='admin').first()
+    if not admin:
+        admin = User(
+            username='admin',
+            email='admin@hospital.com',
+            role='admin'
+        )
+        admin.set_password('admin123')
+        db.session.add(admin)
+        db.session.commit()
+        print("Default admin created - Username: admin, Password: admin123")
+
+
+def create_default_departments():
+    """Create default departments if not exists"""
+    names = [dept['name'] for dept in DEFAULT_DEPARTMENTS]
+    existing = {name for (name,) in db.session.query(Department.name).filter(Department.name.in_(names))}
+    missing = [dept for dept in DEFAULT_DEPARTMENTS if dept['name'] not in existing]
+    if missing:
+        db.session.add_all(Department(**dept) for dept in missing)
+        db.session.commit()
+
+
+def seed():
+    create_default_admin()
+    create_default_departments()
+
+
+def ensure_ready(app):
+    """Initialise and seed the database once per process if its schema stamp is out of date"""
+    if app.extensions.get('db_ready'):
+        return
+    with _lock:
+        if app.extensions.get('db_ready'):
+            return
+        _ensure_sqlite_dir(app)
+        version = current_version()
+        if version is None or version < SCHEMA_VERSION:
+            # A new database has nothing to backfill; an existing one gets only its schema here
+            fresh = not inspect(db.engine).has_table(User.__tablename__)
+            try:
+                init_db(app, backfill=fresh)
+                seed()
+                if not fresh:
+                    app.logger.warning('Database schema upgraded to version %d; run `flask init-db` to build '
+                                       'search indexes and backfill the roster and reports', SCHEMA_VERSION)
+            except (IntegrityError, OperationalError, ProgrammingError):
+                # Another process may have initialised the database at the same time
+                db.session.rollback()
+                if (current_version() or 0) < SCHEMA_VERSION:
+                    raise
+        app.extensions['db_ready'] = True
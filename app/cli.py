@@ -0,0 +1,192 @@
+import click
+from flask.cli import with_appcontext
+from app.models import db
+
+
+def register_commands(app):
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(seed_command)
+    app.cli.add_command(apply_indexes_command)
+    app.cli.add_command(reconcile_stats_command)
+    app.cli.add_command(rebuild_roster_command)
+    app.cli.add_command(refresh_reports_command)
+    app.cli.add_command(rebuild_search_index_command)
+    app.cli.add_command(import_data_command)
+    app.cli.add_command(export_prescriptions_command)
+    app.cli.add_command(run_jobs_command)
+    app.cli.add_command(archive_appointments_command)
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """Create tables and search indexes, and seed the default admin and departments"""
+    from flask import current_app
+    from app.bootstrap import init_db, seed, SCHEMA_VERSION
+
+    init_db(current_app)
+    seed()
+    click.echo(f'Database initialised (schema version {SCHEMA_VERSION}).')
+
+
+@click.command('seed')
+@with_appcontext
+def seed_command():
+    """Create the default admin user and departments if they are missing"""
+    from app.bootstrap import seed
+
+    seed()
+    click.echo('Default data seeded.')
+
+
+@click.command('apply-indexes')
+@with_appcontext
+def apply_indexes_command():
+    """Create missing indexes on an existing database"""
+    from sqlalchemy.exc import IntegrityError
+    from app.schema import apply_indexes
+
+    try:
+        created = apply_indexes(db.engine)
+    except IntegrityError as exc:
+        raise click.ClickException(
+            f'Could not create a unique index because existing rows violate it: {exc.orig}. '
+            'Resolve the duplicate rows (e.g. double-booked appointment slots) and run the command again.'
+        )
+    if created:
+        for name in created:
+            click.echo(f'Created index {name}')
+    else:
+        click.echo('All indexes already exist.')
+
+
+@click.command('reconcile-stats')
+@with_appcontext
+def reconcile_stats_command():
+    """Recount dashboard counters and correct any drift"""
+    from app.stats import reconcile_all
+
+    changes = reconcile_all()
+    if changes:
+        for key, (old, new) in changes.items():
+            click.echo(f'{key}: {old} -> {new}')
+    else:
+        click.echo('All counters are accurate.')
+
+
+@click.command('rebuild-roster')
+@with_appcontext
+def rebuild_roster_command():
+    """Recompute every doctor's patient roster from appointments"""
+    from app.roster import rebuild
+
+    click.echo(f'{rebuild()} roster entries.')
+
+
+@click.command('refresh-reports')
+@click.option('--full', is_flag=True, help='Rebuild every rollup instead of only changed days')
+@with_appcontext
+def refresh_reports_command(full):
+    """Fold changed appointments into the analytics rollups"""
+    from app.reports import refresh
+
+    recomputed = refresh(full=full)
+    click.echo('Rebuilt all rollups.' if recomputed is None else f'{recomputed} doctor-days recomputed.')
+
+
+@click.command('rebuild-search-index')
+@with_appcontext
+def rebuild_search_index_command():
+    """Re-index doctors and patients for search"""
+    from flask import current_app
+    from app.search import rebuild
+
+    rebuild(current_app)
+    click.echo(f'Search backend: {current_app.extensions["search_backend"]}')
+
+
+@click.command('import-data')
+@click.argument('kind', type=click.Choice(['patients', 'doctors', 'appointments']))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension')
+@click.option('--batch-size', type=int, help='Rows per batch/commit (default IMPORT_BATCH_SIZE)')
+@click.option('--workers', type=int, help='Password hashing processes (default IMPORT_HASH_WORKERS)')
+@click.option('--errors', 'errors_path', type=click.Path(dir_okay=False, writable=True),
+              help='Write every rejected row to this CSV file')
+@with_appcontext
+def import_data_command(kind, path, fmt, batch_size, workers, errors_path):
+    """Bulk import patients, doctors or appointments from a CSV or JSONL file"""
+    import csv
+    from app.importer import import_records, format_for
+
+    with open(path, newline='', encoding='utf-8-sig') as lines:
+        report = import_records(lines, kind, fmt or format_for(path), batch_size=batch_size, workers=workers)
+
+    click.echo(report.summary())
+    for line, message in report.errors[:20]:
+        click.echo(f'  line {line}: {message}', err=True)
+    if len(report.errors) > 20:
+        click.echo(f'  ... and {len(report.errors) - 20} more', err=True)
+    if errors_path and report.errors:
+        with open(errors_path, 'w', newline='') as out:
+            writer = csv.writer(out)
+            writer.writerow(['line', 'error'])
+            writer.writerows(report.errors)
+        click.echo(f'Wrote {len(report.errors)} errors to {errors_path}')
+    if report.errors:
+        raise SystemExit(1)
+
+
+@click.command('export-prescriptions')
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+@click.option('--from', 'date_from', type=click.DateTime(['%Y-%m-%d']), help='First appointment date')
+@click.option('--to', 'date_to', type=click.DateTime(['%Y-%m-%d']), help='Last appointment date')
+@click.option('--doctor', 'doctor_id', type=int, help='Doctor id')
+@click.option('--patient', 'patient_id', type=int, help='Patient id')
+@click.option('--workers', type=int, help='PDF rendering processes (default PDF_WORKERS)')
+@with_appcontext
+def export_prescriptions_command(path, date_from, date_to, doctor_id, patient_id, workers):
+    """Write the prescriptions of completed visits as PDFs into a ZIP file"""
+    from app.prescriptions import BatchExport
+
+    export = BatchExport(workers=workers, date_from=date_from and date_from.date(),
+                         date_to=date_to and date_to.date(), doctor_id=doctor_id, patient_id=patient_id)
+    with open(path, 'wb') as out:
+        for chunk in export.chunks():
+            out.write(chunk)
+    click.echo(export.summary())
+
+
+@click.command('run-jobs')
+@click.option('--burst', is_flag=True, help='Exit once no job is due instead of waiting for more')
+@click.option('--batch-size', type=int, help='Jobs claimed at a time (default JOB_BATCH_SIZE)')
+@with_appcontext
+def run_jobs_command(burst, batch_size):
+    """Run background jobs (notifications, reminders, prescription rendering, archiving)"""
+    from app.jobs import work, status_counts
+
+    try:
+        counts = work(burst=burst, batch_size=batch_size)
+    except KeyboardInterrupt:
+        counts = None
+    if counts is not None:
+        click.echo(f"{counts['done']} jobs done, {counts['retried']} to retry, {counts['failed']} failed.")
+    queue = status_counts()
+    click.echo(f"Queue: {queue.get('pending', 0)} pending, {queue.get('running', 0)} running, "
+               f"{queue.get('failed', 0)} failed.")
+
+
+@click.command('archive-appointments')
+@click.option('--batch-size', type=int, help='Appointments moved per transaction (default ARCHIVE_BATCH_SIZE)')
+@click.option('--before', type=click.DateTime(['%Y-%m-%d']),
+              help='Archive appointments dated before this day (default ARCHIVE_AFTER_DAYS ago)')
+@with_appcontext
+def archive_appointments_command(batch_size, before):
+    """Move old completed and cancelled appointments to the archive tables"""
+    from app import archive
+
+    if before is None and archive.horizon() is None:
+        raise click.ClickException('Archiving is off (ARCHIVE_AFTER_DAYS=0); pass --before to archive anyway.')
+    moved = archive.run(batch_size=batch_size, before=before and before.date())
+    hot, archived = archive.counts()
+    click.echo(f'{moved} appointments archived. Appointments: {hot} current, {archived} archived.')
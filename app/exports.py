@@ -0,0 +1,82 @@
+"""Streaming CSV / NDJSON exports.
+
+Rows are read with ``yield_per``, which uses a server-side cursor on
+Postgres and incremental fetching on SQLite, and are written out in chunks
+through a generator response. Memory use therefore stays constant however
+many rows are exported, and the header goes out before the first batch is
+fetched.
+
+A list of queries is exported as one file, one query after the other; this
+is how the archive tier (app/archive.py) is appended to the hot tables.
+"""
+import csv
+import io
+import json
+from datetime import date
+from itertools import chain
+from flask import Response, stream_with_context
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Rows fetched per round-trip and written per chunk
+EXPORT_BATCH_SIZE = 1000
+
+# Spreadsheet apps evaluate cells starting with these characters as formulas
+_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _csv_cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _drain(buffer):
+    chunk = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return chunk
+
+
+def _csv_chunks(rows, serializer):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    fields = list(serializer.fields)
+    writer.writerow(fields)
+    yield _drain(buffer)
+
+    count = 0
+    for row in rows:
+        record = serializer.dump(row)
+        writer.writerow([_csv_cell(record[name]) for name in fields])
+        count += 1
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield _drain(buffer)
+    yield _drain(buffer)
+
+
+def _ndjson_chunks(rows, serializer):
+    lines = []
+    for count, row in enumerate(rows, 1):
+        lines.append(json.dumps(serializer.dump(row), separators=(',', ':')))
+        # Send the first record on its own so the client sees data right away
+        if count == 1 or len(lines) == EXPORT_BATCH_SIZE:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def stream_export(query, serializer, name, fmt):
+    """Stream ``query``, or a list of queries (selected through ``serializer``), as a download named ``name``"""
+    queries = query if isinstance(query, (list, tuple)) else [query]
+    rows = chain.from_iterable(query.yield_per(EXPORT_BATCH_SIZE) for query in queries)
+    chunks = _csv_chunks(rows, serializer) if fmt == 'csv' else _ndjson_chunks(rows, serializer)
+    filename = f'{name}-{date.today().isoformat()}.{fmt}'
+    return Response(stream_with_context(chunks), mimetype=FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
@@ -0,0 +1,419 @@
+"""Cache rendered template fragments.
+
+Wrap the expensive part of a template in a ``cache`` tag::
+
+    {% cache 'doctor-card', doctor.id, depends=['doctors:%d' % doctor.id] %}
+        ...
+    {% endcache %}
+
+or, where a call block reads better, the ``cached`` macro::
+
+    {% call cached('doctor-card', doctor.id, depends=['doctors:%d' % doctor.id]) %}...{% endcall %}
+
+The key is the fragment name and the values after it, plus the template's
+source, so editing the template invalidates its fragments. Anything else
+the block shows (the current user, today's date) has to be part of the key.
+
+``depends`` names tags the fragment is rebuilt for when they change.
+Committing an insert, update or delete of a row bumps these tags:
+
+* ``<table>`` for any row of the table, e.g. ``departments``
+* ``<table>:<id>`` for that row, e.g. ``doctors:12``
+* ``<table>:<column>:<value>`` for each foreign key, e.g.
+  ``doctor_availability:doctor_id:12`` for any availability of doctor 12
+
+Bulk ``Query.update()``/``delete()`` statements bypass this and must call
+:func:`invalidate` with the tags they affect.
+
+Data that is not rendered in one place, such as a summary shown by a page
+and returned by the API, can be cached the same way with
+:func:`cached_value`; the value is stored as JSON.
+
+``FRAGMENT_CACHE`` selects the backend: ``lru`` keeps up to
+``FRAGMENT_CACHE_SIZE`` fragments in each process, ``filesystem`` shares
+them between the processes of one host through ``FRAGMENT_CACHE_DIR``, and
+``null`` turns caching off. Fragments expire after ``FRAGMENT_CACHE_TIMEOUT``
+seconds; with ``lru`` a change made in one process reaches the others only
+then.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from itertools import chain
+
+from flask import current_app, g, has_app_context, has_request_context, request
+from jinja2 import nodes, pass_context
+from jinja2.ext import Extension
+from markupsafe import Markup
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from app.models import db
+from app.profiling import request_stats
+
+
+class LRUBackend:
+    """Fragments in process memory; the least recently used are dropped beyond ``max_entries``"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] is not None and entry[0] < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, timeout=None):
+        expires = time.monotonic() + timeout if timeout else None
+        with self.lock:
+            self.entries[key] = (expires, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class FileSystemBackend:
+    """One file per fragment under ``directory``, shared by every process that uses it.
+
+    Each file holds the expiry time (0 = none) on its first line. Every
+    ``PRUNE_INTERVAL`` writes, expired files are removed and the oldest ones
+    beyond ``max_entries``.
+    """
+
+    PRUNE_INTERVAL = 256
+
+    def __init__(self, directory, max_entries):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest())
+
+    def get(self, key):
+        try:
+            with open(self._path(key), encoding='utf-8') as f:
+                expires = float(f.readline())
+                if expires and expires < time.time():
+                    return None
+                return f.read()
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key, value, timeout=None):
+        expires = time.time() + timeout if timeout else 0
+        # Write to a temporary file and rename it, so readers never see half a fragment
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(f'{expires}\n{value}')
+            os.replace(tmp, self._path(key))
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return
+        self.writes += 1
+        if self.writes % self.PRUNE_INTERVAL == 0:
+            self.prune()
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def prune(self):
+        now = time.time()
+        files = []
+        for entry in os.scandir(self.directory):
+            try:
+                with open(entry.path, encoding='utf-8') as f:
+                    expires = float(f.readline())
+                if expires and expires < now:
+                    os.remove(entry.path)
+                else:
+                    files.append((entry.stat().st_mtime, entry.path))
+            except (OSError, ValueError):
+                continue
+        files.sort()
+        for _, path in files[:max(0, len(files) - self.max_entries)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+
+class FragmentCache:
+    """Looks fragments up in ``backend`` and counts hits and misses per fragment name"""
+
+    def __init__(self, backend, timeout):
+        self.backend = backend
+        self.timeout = timeout
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def _tag_versions(self, tags):
+        # Fragments of one page share tags (every card of a department), so each is read once per request
+        seen = g.setdefault('_fragment_tag_versions', {}) if has_request_context() else {}
+        versions = []
+        for tag in tags:
+            version = seen.get(tag) or self.backend.get('tag:' + tag)
+            if version is None:
+                version = uuid.uuid4().hex
+                self.backend.set('tag:' + tag, version)
+            seen[tag] = version
+            versions.append(version)
+        return versions
+
+    def bump(self, tags):
+        # A tag without a stored version gets a new one when next read, so every fragment
+        # built on the old version is never found again
+        for tag in tags:
+            self.backend.delete('tag:' + tag)
+
+    def _count(self, name, hit, elapsed=0.0):
+        with self.lock:
+            counts = self.counts.setdefault(name, [0, 0, 0.0])
+            counts[0 if hit else 1] += 1
+            counts[2] += elapsed
+        stats = request_stats()
+        if stats is not None:
+            if hit:
+                stats.fragment_hits += 1
+            else:
+                stats.fragment_misses += 1
+
+    def _key(self, source_version, keys, depends):
+        script_root = request.script_root if has_request_context() else ''
+        return 'fragment:' + hashlib.sha1(repr(
+            (source_version, script_root, list(keys), self._tag_versions(depends or ()))
+        ).encode()).hexdigest()
+
+    def render(self, source_version, keys, depends, timeout, caller):
+        name = str(keys[0])
+        key = self._key(source_version, keys, depends)
+        value = self.backend.get(key)
+        if value is not None:
+            self._count(name, hit=True)
+            return Markup(value)
+        start = time.perf_counter()
+        value = caller()
+        self._count(name, hit=False, elapsed=time.perf_counter() - start)
+        self.backend.set(key, str(value), self.timeout if timeout is None else timeout)
+        return value
+
+    def value(self, keys, depends, timeout, load):
+        name = str(keys[0])
+        key = self._key('value', keys, depends)
+        value = self.backend.get(key)
+        if value is not None:
+            self._count(name, hit=True)
+            return json.loads(value)
+        start = time.perf_counter()
+        value = load()
+        self._count(name, hit=False, elapsed=time.perf_counter() - start)
+        self.backend.set(key, json.dumps(value), self.timeout if timeout is None else timeout)
+        return value
+
+    def summary(self):
+        """One row per fragment name, most requested first"""
+        rows = []
+        with self.lock:
+            counts = {name: list(values) for name, values in self.counts.items()}
+        for name, (hits, misses, render_time) in counts.items():
+            rows.append({
+                'name': name,
+                'hits': hits,
+                'misses': misses,
+                'hit_rate': hits / (hits + misses),
+                'render_ms': render_time * 1000 / misses if misses else 0.0,
+            })
+        return sorted(rows, key=lambda row: row['hits'] + row['misses'], reverse=True)
+
+
+def _render(source_version, keys, depends, timeout, caller):
+    cache = current_app.extensions.get('fragment_cache')
+    if cache is None:
+        return caller()
+    return cache.render(source_version, keys, depends, timeout, caller)
+
+
+def cached_value(*keys, load, depends=None, timeout=None):
+    """``load()``, cached under ``keys`` until a tag in ``depends`` changes; it must return JSON-serialisable data"""
+    cache = current_app.extensions.get('fragment_cache')
+    if cache is None:
+        return load()
+    return cache.value(keys, depends, timeout, load)
+
+
+class FragmentCacheExtension(Extension):
+    """The ``{% cache name, key... [, depends=tags] [, timeout=seconds] %}`` tag"""
+
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_source_versions={})
+
+    def preprocess(self, source, name, filename=None):
+        # Runs on every (re)compile, so an edited template stops matching its old fragments
+        if name is not None:
+            self.environment.fragment_source_versions[name] = hashlib.sha1(source.encode()).hexdigest()[:12]
+        return source
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        keys = [parser.parse_expression()]
+        options = {'depends': nodes.Const(None), 'timeout': nodes.Const(None)}
+        while parser.stream.skip_if('comma'):
+            if parser.stream.current.type == 'name' and parser.stream.look().type == 'assign':
+                option = parser.stream.expect('name')
+                if option.value not in options:
+                    parser.fail(f"unknown cache option '{option.value}'", option.lineno)
+                parser.stream.expect('assign')
+                options[option.value] = parser.parse_expression()
+            else:
+                keys.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        version = self.environment.fragment_source_versions.get(parser.name, parser.name)
+        call = self.call_method('_cache', [nodes.Const(version), nodes.List(keys),
+                                           options['depends'], options['timeout']])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _cache(self, version, keys, depends, timeout, caller):
+        return _render(version, keys, depends, timeout, caller)
+
+
+@pass_context
+def cached(context, *keys, depends=None, timeout=None, caller=None):
+    """Macro form of the ``cache`` tag, for ``{% call cached(name, key...) %}``"""
+    versions = context.environment.fragment_source_versions
+    return _render(versions.get(context.name, context.name), keys, depends, timeout, caller)
+
+
+class Deferred:
+    """A list or mapping loaded by ``load`` on first use.
+
+    Pass data that only cached fragments read as ``Deferred(load)`` so a
+    request whose fragments are all cached never queries for it.
+    """
+
+    def __init__(self, load):
+        self.load = load
+        self.loaded = None
+
+    def _value(self):
+        if self.loaded is None:
+            self.loaded = self.load()
+        return self.loaded
+
+    def __getitem__(self, key):
+        return self._value()[key]
+
+    def __iter__(self):
+        return iter(self._value())
+
+    def __len__(self):
+        return len(self._value())
+
+    def get(self, key, default=None):
+        return self._value().get(key, default)
+
+
+def row_tags(obj):
+    """The tags an insert, update or delete of ``obj`` bumps"""
+    state = inspect(obj)
+    table = state.mapper.local_table
+    tags = {table.name}
+    # Read from the attributes: rows inserted by the flush get their identity key only after it
+    primary_key = state.mapper.primary_key_from_instance(obj)
+    if len(primary_key) == 1 and primary_key[0] is not None:
+        tags.add(f'{table.name}:{primary_key[0]}')
+    for column in table.columns:
+        if not column.foreign_keys:
+            continue
+        history = state.attrs[state.mapper.get_property_by_column(column).key].history
+        # Both sides of a changed foreign key, e.g. a doctor moved to another department
+        for value in chain(history.added or (), history.unchanged or (), history.deleted or ()):
+            if value is not None:
+                tags.add(f'{table.name}:{column.name}:{value}')
+    return tags
+
+
+def invalidate(*tags):
+    """Bump ``tags`` when the current transaction commits"""
+    db.session.info.setdefault('fragment_tags', set()).update(tags)
+
+
+def _collect(session, flush_context):
+    if not has_app_context() or 'fragment_cache' not in current_app.extensions:
+        return
+    tags = session.info.setdefault('fragment_tags', set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if obj in session.dirty and not session.is_modified(obj, include_collections=False):
+            continue
+        tags.update(row_tags(obj))
+
+
+def _bump(session):
+    tags = session.info.pop('fragment_tags', None)
+    if tags and has_app_context():
+        cache = current_app.extensions.get('fragment_cache')
+        if cache is not None:
+            cache.bump(tags)
+
+
+def _discard(session, transaction):
+    # Only once the outermost transaction ends without a commit: a savepoint rolled back by
+    # begin_nested() (e.g. a lost insert race) leaves the outer transaction's changes to be committed
+    if transaction.parent is None:
+        session.info.pop('fragment_tags', None)
+
+
+def install(app):
+    """Register the ``cache`` tag and ``cached`` macro, and the cache selected by FRAGMENT_CACHE"""
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.globals['cached'] = cached
+    kind = app.config['FRAGMENT_CACHE']
+    if kind == 'lru':
+        backend = LRUBackend(app.config['FRAGMENT_CACHE_SIZE'])
+    elif kind == 'filesystem':
+        backend = FileSystemBackend(app.config['FRAGMENT_CACHE_DIR'], app.config['FRAGMENT_CACHE_SIZE'])
+    else:
+        return
+    app.extensions['fragment_cache'] = FragmentCache(backend, app.config['FRAGMENT_CACHE_TIMEOUT'])
+    # Tags collected at flush are bumped only once the data is committed; bumping earlier would let
+    # another request cache the old rows under the new version
+    for name, listener in (('after_flush', _collect), ('after_commit', _bump), ('after_transaction_end', _discard)):
+        if not event.contains(Session, name, listener):
+            event.listen(Session, name, listener)
@@ -0,0 +1,138 @@
+"""Conditional GET for rendered pages, and content-hashed URLs for static files.
+
+Pages whose content follows from a few timestamps (dashboards, printed
+prescriptions) return :func:`conditional` instead of rendering directly::
+
+    return conditional(render, appointment.updated_at, treatment.created_at)
+
+The version values, the viewer, today's date and the deployed templates
+make up a weak ETag. A browser revalidating with that ETag in
+``If-None-Match`` (or with an ``If-Modified-Since`` no older than
+``last_modified``) gets an empty 304 and ``render`` never runs. Responses
+are ``private, no-cache``: the browser keeps its copy but asks every time,
+which is what polling clients do anyway.
+
+``url_for('static', filename=...)`` adds a ``v`` parameter with a digest of
+the file's content. Requests carrying the current digest are served as
+cacheable for a year and ``immutable``, so browsers stop revalidating
+``main.css`` and ``main.js``; a changed file gets a new URL.
+"""
+import hashlib
+import os
+import threading
+from datetime import date, timezone
+
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+from werkzeug.security import safe_join
+
+from app.models import db
+
+STATIC_MAX_AGE = 365 * 24 * 3600
+
+
+class Digests:
+    """Content digests of the static files, and of all templates and static files together"""
+
+    def __init__(self, app):
+        self.static_folder = app.static_folder
+        self.template_folder = os.path.join(app.root_path, app.template_folder)
+        self.files = {}
+        self.release = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _hash_file(path):
+        digest = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def static(self, filename):
+        """Digest of a static file, or None if there is no such file"""
+        if filename in self.files and not current_app.debug:
+            return self.files[filename]
+        path = safe_join(self.static_folder, filename)
+        digest = self._hash_file(path)[:12] if path and os.path.isfile(path) else None
+        self.files[filename] = digest
+        return digest
+
+    def templates_and_static(self):
+        """Changes whenever a deployment changes what a page can render"""
+        if self.release is None or current_app.debug:
+            with self.lock:
+                digest = hashlib.sha1()
+                for folder in (self.template_folder, self.static_folder):
+                    for root, dirs, files in os.walk(folder):
+                        dirs.sort()
+                        for name in sorted(files):
+                            path = os.path.join(root, name)
+                            digest.update(os.path.relpath(path, folder).encode())
+                            digest.update(self._hash_file(path).encode())
+                self.release = digest.hexdigest()[:12]
+        return self.release
+
+
+def latest(*aggregates):
+    """Run single-value selects such as ``max(updated_at)`` or ``count(id)`` in one round trip"""
+    return tuple(db.session.execute(db.select(*(query.scalar_subquery() for query in aggregates))).one())
+
+
+def _not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    return bool(last_modified and request.if_modified_since and last_modified <= request.if_modified_since)
+
+
+def conditional(render, *version, last_modified=None):
+    """``render()`` with an ETag for ``version``, or 304 if the client already has that version"""
+    if current_app.debug or '_flashes' in session:
+        # Templates may change in place while debugging, and a page showing a one-off flash
+        # message must not become the copy later 304s refer to
+        return render()
+    digests = current_app.extensions['http_cache']
+    user = (current_user.get_id(), current_user.username) if current_user.is_authenticated else None
+    etag = hashlib.sha1(repr((digests.templates_and_static(), user, date.today(), version)).encode()).hexdigest()
+    if last_modified is not None:
+        # Stored timestamps are naive UTC; HTTP dates have whole seconds
+        last_modified = last_modified.replace(tzinfo=timezone.utc, microsecond=0)
+
+    if _not_modified(etag, last_modified):
+        response = current_app.response_class(status=304)
+    else:
+        response = make_response(render())
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+    return response
+
+
+def _versioned_static_url(endpoint, values):
+    if endpoint == 'static' and 'filename' in values and 'v' not in values:
+        digest = current_app.extensions['http_cache'].static(values['filename'])
+        if digest:
+            values['v'] = digest
+
+
+def _cache_static(response):
+    if request.endpoint != 'static' or response.status_code not in (200, 304):
+        return response
+    version = request.args.get('v')
+    # An old digest still gets the current file, but only with Flask's default revalidation
+    if version and version == current_app.extensions['http_cache'].static(request.view_args['filename']):
+        response.cache_control.public = True
+        response.cache_control.max_age = STATIC_MAX_AGE
+        response.cache_control.immutable = True
+        response.cache_control.no_cache = None
+    return response
+
+
+def install(app):
+    """Add digests to static URLs and long-lived caching to the static files they point at"""
+    app.extensions['http_cache'] = Digests(app)
+    app.url_defaults(_versioned_static_url)
+    app.after_request(_cache_static)
@@ -0,0 +1,334 @@
+"""Bulk import of patients, doctors and historical appointments from CSV or JSONL.
+
+Records are processed in batches of ``IMPORT_BATCH_SIZE``. Each batch is
+validated in memory, inserted with executemany-style bulk INSERTs and
+committed once. Username/email uniqueness is checked against sets loaded
+once at the start, not with a query per row, and password hashing (the
+dominant cost) runs in a process pool. Invalid rows are reported with their
+line number and skipped; the rest of the file is still imported.
+
+Columns (``*`` = required):
+
+* patients: username*, email*, password*, full_name*, date_of_birth, gender,
+  phone, address, blood_group, emergency_contact
+* doctors: username*, email*, password*, full_name*, department* (name or id),
+  specialization*, phone, qualification, experience_years
+* appointments: patient_username*, doctor_username*, appointment_date*,
+  appointment_time*, status (default Completed), reason, diagnosis,
+  prescription, notes; Completed rows with a diagnosis get a treatment
+"""
+import csv
+import json
+import os
+import time as timer
+from collections import Counter
+from contextlib import contextmanager
+from datetime import date, datetime
+from itertools import islice, repeat
+from flask import current_app
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+from werkzeug.security import generate_password_hash
+from app.models import db, User, Department, Doctor, Patient, Appointment, Treatment
+from app.slots import ACTIVE_STATUSES
+from app.passwords import hash_method
+from app.pools import process_pool
+from app import roster, stats
+from app.fragments import invalidate
+
+KINDS = ('patients', 'doctors', 'appointments')
+FORMATS = ('csv', 'jsonl')
+STATUSES = ('Booked', 'Completed', 'Cancelled')
+
+REQUIRED = {
+    'patients': ('username', 'email', 'password', 'full_name'),
+    'doctors': ('username', 'email', 'password', 'full_name', 'department', 'specialization'),
+    'appointments': ('patient_username', 'doctor_username', 'appointment_date', 'appointment_time'),
+}
+PROFILE_FIELDS = {
+    'patients': ('full_name', 'date_of_birth', 'gender', 'phone', 'address', 'blood_group', 'emergency_contact'),
+    'doctors': ('full_name', 'specialization', 'phone', 'qualification', 'experience_years'),
+}
+
+
+class ImportReport:
+    def __init__(self, kind):
+        self.kind = kind
+        self.rows = 0
+        self.imported = 0
+        self.errors = []
+        self.started = timer.perf_counter()
+        self.finished = None
+
+    def error(self, line, message):
+        self.errors.append((line, message))
+
+    @property
+    def elapsed(self):
+        return (self.finished or timer.perf_counter()) - self.started
+
+    @property
+    def rate(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        return (f'{self.kind}: imported {self.imported} of {self.rows} rows in {self.elapsed:.1f}s '
+                f'({self.rate:.0f} rows/s), {len(self.errors)} errors')
+
+
+def format_for(filename):
+    """Guess the format from a file name, defaulting to CSV"""
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+def _clean(record):
+    return {key.strip(): (str(value).strip() or None) if value is not None else None
+            for key, value in record.items() if key}
+
+
+def read_records(lines, fmt):
+    """Yield ``(line_number, record)`` from an iterable of text lines; unreadable records are ``None``"""
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for record in reader:
+            yield reader.line_num, _clean(record)
+        return
+    for number, text in enumerate(lines, 1):
+        text = text.strip()
+        if not text:
+            continue
+        try:
+            record = json.loads(text)
+        except ValueError:
+            record = None
+        yield number, _clean(record) if isinstance(record, dict) else None
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _hash_serially(passwords, method):
+    return [generate_password_hash(password, method) for password in passwords]
+
+
+@contextmanager
+def password_hasher(workers=0):
+    """Yield a function hashing a list of passwords with the configured method, using ``workers`` processes (0 = one per CPU)"""
+    workers = workers or os.cpu_count() or 1
+    method = hash_method()
+    if workers <= 1:
+        yield lambda passwords: _hash_serially(passwords, method)
+        return
+    executor = process_pool(workers)
+    if executor is None:
+        yield lambda passwords: _hash_serially(passwords, method)
+        return
+    with executor:
+        yield lambda passwords: list(executor.map(generate_password_hash, passwords, repeat(method),
+                                                  chunksize=max(1, len(passwords) // (workers * 4))))
+
+
+def _check(record, kind, model):
+    if record is None:
+        raise ValueError('Unreadable record')
+    missing = [name for name in REQUIRED[kind] if not record.get(name)]
+    if missing:
+        raise ValueError(f'Missing required field(s): {", ".join(missing)}')
+    # String length limits are enforced by Postgres, so catch them before they fail a whole batch
+    for name, value in record.items():
+        column = model.__table__.c.get(name)
+        if column is None:
+            column = User.__table__.c.get(name)
+        length = getattr(column.type, 'length', None) if column is not None else None
+        if value and length and len(value) > length:
+            raise ValueError(f'{name} is longer than {length} characters')
+
+
+def _person_row(record, kind, departments):
+    """Validate a patient/doctor record and return ``(user, profile)`` column dicts"""
+    model = Patient if kind == 'patients' else Doctor
+    _check(record, kind, model)
+    user = {'username': record['username'], 'email': record['email'],
+            'password': record['password'], 'role': kind[:-1], 'is_active': True}
+    profile = {name: record.get(name) for name in PROFILE_FIELDS[kind]}
+
+    if kind == 'patients':
+        if profile['date_of_birth']:
+            try:
+                profile['date_of_birth'] = date.fromisoformat(profile['date_of_birth'])
+            except ValueError:
+                raise ValueError('date_of_birth must be YYYY-MM-DD')
+    else:
+        department = record['department']
+        department_id = departments.get(department.lower()) or (
+            int(department) if department.isdigit() and int(department) in departments.values() else None)
+        if department_id is None:
+            raise ValueError(f'Unknown department: {department}')
+        profile['department_id'] = department_id
+        try:
+            profile['experience_years'] = int(profile['experience_years'] or 0)
+        except ValueError:
+            raise ValueError('experience_years must be a whole number')
+    return user, profile
+
+
+def _import_people(records, report, kind, batch_size, hasher):
+    profile_model = Patient if kind == 'patients' else Doctor
+    counter_key = stats.PATIENTS if kind == 'patients' else stats.DOCTORS
+    usernames, emails = set(), set()
+    for username, email in db.session.query(User.username, User.email):
+        usernames.add(username)
+        emails.add(email)
+    departments = {name.lower(): dept_id for dept_id, name in db.session.query(Department.id, Department.name)}
+
+    for batch in _batches(records, batch_size):
+        accepted = []
+        for line, record in batch:
+            report.rows += 1
+            try:
+                user, profile = _person_row(record, kind, departments)
+                if user['username'] in usernames:
+                    raise ValueError(f'Username already exists: {user["username"]}')
+                if user['email'] in emails:
+                    raise ValueError(f'Email already registered: {user["email"]}')
+            except ValueError as exc:
+                report.error(line, str(exc))
+                continue
+            usernames.add(user['username'])
+            emails.add(user['email'])
+            accepted.append((line, user, profile))
+        if not accepted:
+            continue
+
+        hashes = hasher([user.pop('password') for _, user, _ in accepted])
+        for (_, user, _), password_hash in zip(accepted, hashes):
+            user['password_hash'] = password_hash
+        try:
+            user_ids = db.session.scalars(
+                insert(User).returning(User.id, sort_by_parameter_order=True),
+                [user for _, user, _ in accepted]
+            ).all()
+            for (_, _, profile), user_id in zip(accepted, user_ids):
+                profile['user_id'] = user_id
+            db.session.execute(insert(profile_model), [profile for _, _, profile in accepted])
+            stats.increment(counter_key, len(accepted))
+            db.session.commit()
+        except SQLAlchemyError as exc:
+            db.session.rollback()
+            for line, _, _ in accepted:
+                report.error(line, f'Batch rejected by the database: {getattr(exc, "orig", exc)}')
+            continue
+        report.imported += len(accepted)
+
+
+def _parse_time(value):
+    for fmt in ('%H:%M', '%H:%M:%S'):
+        try:
+            return datetime.strptime(value, fmt).time()
+        except ValueError:
+            pass
+    raise ValueError('appointment_time must be HH:MM')
+
+
+def _appointment_row(record):
+    _check(record, 'appointments', Appointment)
+    try:
+        appointment_date = date.fromisoformat(record['appointment_date'])
+    except ValueError:
+        raise ValueError('appointment_date must be YYYY-MM-DD')
+    appointment_time = _parse_time(record['appointment_time'])
+    status = (record.get('status') or 'Completed').capitalize()
+    if status not in STATUSES:
+        raise ValueError(f'status must be one of {", ".join(STATUSES)}')
+    return {'appointment_date': appointment_date, 'appointment_time': appointment_time,
+            'status': status, 'reason': record.get('reason')}
+
+
+def _import_appointments(records, report, batch_size):
+    doctors = dict(db.session.query(User.username, Doctor.id).join(Doctor, Doctor.user_id == User.id))
+    # Active slots per doctor, loaded the first time a doctor appears in the file
+    booked = {}
+
+    for batch in _batches(records, batch_size):
+        # One lookup per batch for the patients it mentions
+        wanted = {record['patient_username'] for _, record in batch if record and record.get('patient_username')}
+        patients = dict(db.session.query(User.username, Patient.id).join(Patient, Patient.user_id == User.id)
+                        .filter(User.username.in_(wanted))) if wanted else {}
+
+        accepted = []
+        for line, record in batch:
+            report.rows += 1
+            try:
+                row = _appointment_row(record)
+                row['patient_id'] = patients.get(record['patient_username'])
+                row['doctor_id'] = doctors.get(record['doctor_username'])
+                if row['patient_id'] is None:
+                    raise ValueError(f'Unknown patient: {record["patient_username"]}')
+                if row['doctor_id'] is None:
+                    raise ValueError(f'Unknown doctor: {record["doctor_username"]}')
+                if row['status'] in ACTIVE_STATUSES:
+                    if row['doctor_id'] not in booked:
+                        booked[row['doctor_id']] = set(db.session.query(
+                            Appointment.appointment_date, Appointment.appointment_time
+                        ).filter(Appointment.doctor_id == row['doctor_id'],
+                                 Appointment.status.in_(ACTIVE_STATUSES)).all())
+                    slot = (row['appointment_date'], row['appointment_time'])
+                    if slot in booked[row['doctor_id']]:
+                        raise ValueError('The doctor already has an appointment in this slot')
+                    booked[row['doctor_id']].add(slot)
+            except ValueError as exc:
+                report.error(line, str(exc))
+                continue
+            treatment = None
+            if row['status'] == 'Completed' and record.get('diagnosis'):
+                treatment = {'diagnosis': record['diagnosis'], 'prescription': record.get('prescription'),
+                             'notes': record.get('notes')}
+            accepted.append((line, row, treatment))
+        if not accepted:
+            continue
+
+        try:
+            appointment_ids = db.session.scalars(
+                insert(Appointment).returning(Appointment.id, sort_by_parameter_order=True),
+                [row for _, row, _ in accepted]
+            ).all()
+            treatments = [dict(treatment, appointment_id=appointment_id)
+                          for (_, _, treatment), appointment_id in zip(accepted, appointment_ids) if treatment]
+            if treatments:
+                db.session.execute(insert(Treatment), treatments)
+            stats.increment(stats.APPOINTMENTS, len(accepted))
+            # Per-day counters that already exist are adjusted; missing ones are counted on first read
+            for day, count in Counter(row['appointment_date'] for _, row, _ in accepted).items():
+                stats.increment(stats.appointments_on(day), count, create=False)
+            roster.refresh((row['doctor_id'], row['patient_id']) for _, row, _ in accepted)
+            # Bulk inserts bypass the fragment cache's change tracking; this drops cached patient summaries
+            invalidate(*{f"appointments:patient_id:{row['patient_id']}" for _, row, _ in accepted})
+            db.session.commit()
+        except SQLAlchemyError as exc:
+            db.session.rollback()
+            for line, row, _ in accepted:
+                booked.get(row['doctor_id'], set()).discard((row['appointment_date'], row['appointment_time']))
+                report.error(line, f'Batch rejected by the database: {getattr(exc, "orig", exc)}')
+            continue
+        report.imported += len(accepted)
+
+
+def import_records(lines, kind, fmt, batch_size=None, workers=None):
+    """Import ``kind`` records from an iterable of CSV/JSONL text lines and return an :class:`ImportReport`"""
+    batch_size = batch_size or current_app.config['IMPORT_BATCH_SIZE']
+    workers = current_app.config['IMPORT_HASH_WORKERS'] if workers is None else workers
+    report = ImportReport(kind)
+    records = read_records(lines, fmt)
+    if kind == 'appointments':
+        _import_appointments(records, report, batch_size)
+    else:
+        with password_hasher(workers) as hasher:
+            _import_people(records, report, kind, batch_size, hasher)
+    report.finished = timer.perf_counter()
+    return report
@@ -0,0 +1,269 @@
+"""Background jobs stored in the database and run by ``flask run-jobs``.
+
+Request handlers only :func:`enqueue` a row in ``jobs`` in the same
+transaction as the change that calls for the work, so a job exists exactly
+when its change was committed and the request does not wait for email or
+rendering. A worker process claims due jobs ``JOB_BATCH_SIZE`` at a time
+(``FOR UPDATE SKIP LOCKED`` on Postgres, so several workers can share the
+queue) and hands each kind's payloads to its handler as one list, which
+loads what it needs in a query per batch. The handler's own writes commit
+together with the jobs being marked done.
+
+A batch whose handler raises is retried after ``JOB_RETRY_DELAY`` seconds,
+doubled per attempt, with each job run on its own from then on so one bad
+payload cannot hold back the rest; after ``JOB_MAX_ATTEMPTS`` attempts a
+job is marked failed and keeps its last error. Jobs left running by a
+worker that died are retried after ``JOB_TIMEOUT`` seconds, so handlers
+must tolerate running twice.
+
+Periodic jobs (:data:`PERIODIC`) are scheduled by the worker: once when it
+starts and again after each run. ``key`` keeps at most one of them pending.
+``flask run-jobs --burst`` runs what is due and exits, for cron.
+"""
+import json
+import os
+import socket
+import time as timer
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
+from app.models import db, Appointment, Doctor, Job, Patient, User
+
+HANDLERS = {}
+
+
+def handler(kind):
+    """Register a function taking a list of payloads as the handler for ``kind``"""
+    def register(function):
+        HANDLERS[kind] = function
+        return function
+    return register
+
+
+def enqueue(kind, payload=None, run_at=None):
+    """Add a job to the current transaction; the caller commits"""
+    job = Job(kind=kind, payload=json.dumps(payload or {}), run_at=run_at or datetime.utcnow())
+    db.session.add(job)
+    return job
+
+
+def enqueue_many(kind, payloads):
+    """Add one job per payload with a single statement; the caller commits"""
+    if payloads:
+        now = datetime.utcnow()
+        db.session.execute(insert(Job), [{'kind': kind, 'payload': json.dumps(payload), 'status': 'pending',
+                                          'attempts': 0, 'run_at': now, 'created_at': now}
+                                         for payload in payloads])
+
+
+def schedule(kind, delay=0):
+    """Schedule a periodic job unless one is already pending, and commit"""
+    job = enqueue(kind, run_at=datetime.utcnow() + timedelta(seconds=delay))
+    job.key = kind
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+
+
+def release_stale():
+    """Return jobs claimed by a worker that stopped before ``JOB_TIMEOUT`` seconds to the queue"""
+    cutoff = datetime.utcnow() - timedelta(seconds=current_app.config['JOB_TIMEOUT'])
+    released = db.session.execute(
+        update(Job).where(Job.status == 'running', Job.locked_at < cutoff)
+        .values(status='pending', locked_by=None, run_at=datetime.utcnow())
+    ).rowcount
+    db.session.commit()
+    return released
+
+
+def claim(worker, limit):
+    """Mark up to ``limit`` due jobs as running for ``worker`` and return them, oldest first"""
+    now = datetime.utcnow()
+    ids = db.session.execute(
+        db.select(Job.id).where(Job.status == 'pending', Job.run_at <= now)
+        .order_by(Job.run_at, Job.id).limit(limit)
+        .with_for_update(skip_locked=True)
+    ).scalars().all()
+    if not ids:
+        db.session.rollback()
+        return []
+    # The status check skips jobs another worker claimed in between (SQLite has no row locks)
+    db.session.execute(
+        update(Job).where(Job.id.in_(ids), Job.status == 'pending')
+        .values(status='running', locked_by=worker, locked_at=now, attempts=Job.attempts + 1, key=None)
+    )
+    db.session.commit()
+    return db.session.execute(
+        db.select(Job.id, Job.kind, Job.payload, Job.attempts)
+        .where(Job.id.in_(ids), Job.locked_by == worker, Job.status == 'running')
+        .order_by(Job.run_at, Job.id)
+    ).all()
+
+
+def _finish(worker, ids, **values):
+    db.session.execute(update(Job).where(Job.id.in_(ids), Job.locked_by == worker)
+                       .values(locked_by=None, **values))
+
+
+def run_batch(worker, kind, jobs):
+    """Run one kind's jobs through its handler; returns ``{'done'|'retried'|'failed': count}``"""
+    ids = [job.id for job in jobs]
+    outcome = Counter()
+    try:
+        HANDLERS[kind]([json.loads(job.payload) for job in jobs])
+        _finish(worker, ids, status='done', finished_at=datetime.utcnow(), last_error=None)
+        db.session.commit()
+        outcome['done'] = len(jobs)
+    except Exception as exc:
+        db.session.rollback()
+        current_app.logger.exception('Job %s failed (ids %s)', kind, ids)
+        error = f'{type(exc).__name__}: {exc}'
+        config = current_app.config
+        for job in jobs:
+            if job.attempts >= config['JOB_MAX_ATTEMPTS']:
+                _finish(worker, [job.id], status='failed', finished_at=datetime.utcnow(), last_error=error)
+                outcome['failed'] += 1
+            else:
+                delay = config['JOB_RETRY_DELAY'] * 2 ** (job.attempts - 1)
+                _finish(worker, [job.id], status='pending', last_error=error,
+                        run_at=datetime.utcnow() + timedelta(seconds=delay))
+                outcome['retried'] += 1
+        db.session.commit()
+    if kind in PERIODIC:
+        schedule(kind, current_app.config[PERIODIC[kind]])
+    return outcome
+
+
+def work(burst=False, batch_size=None):
+    """Run jobs until interrupted, or with ``burst`` until none are due; returns ``{status: count}``"""
+    config = current_app.config
+    batch_size = batch_size or config['JOB_BATCH_SIZE']
+    worker = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+    counts = Counter()
+    release_stale()
+    for kind in PERIODIC:
+        schedule(kind)
+    while True:
+        jobs = claim(worker, batch_size)
+        if not jobs:
+            if burst:
+                return counts
+            timer.sleep(config['JOB_POLL_INTERVAL'])
+            release_stale()
+            continue
+        groups = {}
+        for job in jobs:
+            # First attempts run together; retried jobs run alone
+            groups.setdefault((job.kind, job.id if job.attempts > 1 else None), []).append(job)
+        for (kind, _), group in groups.items():
+            if kind not in HANDLERS:
+                _finish(worker, [job.id for job in group], status='failed', finished_at=datetime.utcnow(),
+                        last_error=f'No handler for {kind!r}')
+                db.session.commit()
+                counts['failed'] += len(group)
+                continue
+            counts.update(run_batch(worker, kind, group))
+
+
+def status_counts():
+    """``{status: number of jobs}``"""
+    return dict(db.session.execute(db.select(Job.status, db.func.count()).group_by(Job.status)).tuples().all())
+
+
+# ============== HANDLERS ==============
+
+# Chunk size for IN lists, below SQLite's bound parameter limit
+CHUNK_SIZE = 400
+
+
+@handler('notify_appointments')
+def notify_appointments(payloads):
+    """Tell patients about appointments booked, cancelled or coming up; payloads are ``{appointment_id, event}``"""
+    from app import notifications
+
+    rows = {}
+    ids = sorted({payload['appointment_id'] for payload in payloads})
+    for start in range(0, len(ids), CHUNK_SIZE):
+        rows.update((row.id, row) for row in db.session.execute(
+            db.select(Appointment.id, Appointment.status, Appointment.appointment_date,
+                      Appointment.appointment_time, User.email, Patient.full_name.label('patient_name'),
+                      Doctor.full_name.label('doctor_name'))
+            .join(Patient, Patient.id == Appointment.patient_id)
+            .join(User, User.id == Patient.user_id)
+            .join(Doctor, Doctor.id == Appointment.doctor_id)
+            .where(Appointment.id.in_(ids[start:start + CHUNK_SIZE]))))
+    messages = []
+    for payload in payloads:
+        row = rows.get(payload['appointment_id'])
+        # Skip deleted appointments, and reminders of ones no longer booked
+        if row is None or (payload['event'] == 'reminder' and row.status != 'Booked'):
+            continue
+        messages.append(notifications.appointment_message(
+            payload['event'], row.email, row.patient_name, row.doctor_name,
+            row.appointment_date, row.appointment_time))
+    if messages:
+        notifications.sender().send(messages)
+
+
+@handler('scan_reminders')
+def scan_reminders(payloads):
+    """Queue a reminder for each booked appointment starting within ``REMINDER_LEAD_HOURS``"""
+    now = datetime.now()
+    until = now + timedelta(hours=current_app.config['REMINDER_LEAD_HOURS'])
+    # One range scan of ix_appointments_date_time_id over the days the window touches
+    rows = db.session.execute(
+        db.select(Appointment.id, Appointment.appointment_date, Appointment.appointment_time)
+        .where(Appointment.appointment_date >= now.date(), Appointment.appointment_date <= until.date(),
+               Appointment.status == 'Booked', Appointment.reminder_sent_at.is_(None))
+    ).all()
+    due = [row.id for row in rows if now <= datetime.combine(row.appointment_date, row.appointment_time) <= until]
+    for start in range(0, len(due), CHUNK_SIZE):
+        # Only appointments this scan marked, so a concurrent scan cannot remind twice;
+        # updated_at is kept since nothing shown to users changed
+        marked = db.session.execute(
+            update(Appointment)
+            .where(Appointment.id.in_(due[start:start + CHUNK_SIZE]), Appointment.reminder_sent_at.is_(None))
+            .values(reminder_sent_at=datetime.utcnow(), updated_at=Appointment.updated_at)
+            .returning(Appointment.id)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+        enqueue_many('notify_appointments', [{'appointment_id': id, 'event': 'reminder'} for id in marked])
+
+
+@handler('prerender_prescriptions')
+def prerender_prescriptions(payloads):
+    """Render the prescription PDFs of completed visits into the export cache; payloads are ``{appointment_id}``"""
+    from app.prescriptions import BatchExport
+
+    ids = sorted({payload['appointment_id'] for payload in payloads})
+    for start in range(0, len(ids), CHUNK_SIZE):
+        BatchExport(workers=1, appointment_ids=ids[start:start + CHUNK_SIZE]).prerender()
+
+
+@handler('prune_jobs')
+def prune_jobs(payloads):
+    """Delete finished jobs older than ``JOB_RETENTION_DAYS``; failed ones are kept"""
+    cutoff = datetime.utcnow() - timedelta(days=current_app.config['JOB_RETENTION_DAYS'])
+    db.session.execute(db.delete(Job).where(Job.status == 'done', Job.finished_at < cutoff))
+
+
+@handler('archive_appointments')
+def archive_appointments(payloads):
+    """Move closed appointments older than ``ARCHIVE_AFTER_DAYS`` to the archive tables"""
+    from app import archive
+
+    moved = archive.run()
+    if moved:
+        current_app.logger.info('Archived %d appointments', moved)
+
+
+# Periodic job kinds and the setting holding their interval in seconds
+PERIODIC = {
+    'scan_reminders': 'REMINDER_SCAN_INTERVAL',
+    'prune_jobs': 'JOB_PRUNE_INTERVAL',
+    'archive_appointments': 'ARCHIVE_INTERVAL',
+}
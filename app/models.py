@@ -1,7 +1,7 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from app import passwords
 
 db = SQLAlchemy()
 
@@ -21,10 +21,15 @@ class User(UserMixin, db.Model):
     doctor = db.relationship('Doctor', backref='user', uselist=False, cascade='all, delete-orphan')
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = passwords.hash_password(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        """Verify ``password``, re-hashing it if the configured method or cost has changed since it was set"""
+        if not passwords.verify_password(self.password_hash, password):
+            return False
+        if passwords.needs_rehash(self.password_hash):
+            self.password_hash = passwords.hash_password(password)
+        return True
     
     def __repr__(self):
         return f'<User {self.username}>'
@@ -37,6 +42,7 @@ class Department(db.Model):
     name = db.Column(db.String(100), unique=True, nullable=False)
     description = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     doctors = db.relationship('Doctor', backref='department', lazy=True)
@@ -49,7 +55,7 @@ class Doctor(db.Model):
     __tablename__ = 'doctors'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     department_id = db.Column(db.Integer, db.ForeignKey('departments.id'), nullable=False)
     full_name = db.Column(db.String(120), nullable=False)
     specialization = db.Column(db.String(100), nullable=False)
@@ -57,10 +63,12 @@ class Doctor(db.Model):
     qualification = db.Column(db.String(200))
     experience_years = db.Column(db.Integer)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     appointments = db.relationship('Appointment', backref='doctor', lazy=True)
     availability = db.relationship('DoctorAvailability', backref='doctor', lazy=True, cascade='all, delete-orphan')
+    weekly_schedule = db.relationship('DoctorWeeklySchedule', backref='doctor', lazy=True, cascade='all, delete-orphan')
     
     def __repr__(self):
         return f'<Doctor {self.full_name}>'
@@ -70,15 +78,17 @@ class Patient(db.Model):
     __tablename__ = 'patients'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     full_name = db.Column(db.String(120), nullable=False)
     date_of_birth = db.Column(db.Date)
     gender = db.Column(db.String(10))
-    phone = db.Column(db.String(20))
+    phone = db.Column(db.String(20), index=True)
     address = db.Column(db.Text)
     blood_group = db.Column(db.String(5))
     emergency_contact = db.Column(db.String(20))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Indexed for latest-change lookups across all patients
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     # Relationships
     appointments = db.relationship('Appointment', backref='patient', lazy=True)
@@ -89,6 +99,10 @@ class Patient(db.Model):
 
 class DoctorAvailability(db.Model):
     __tablename__ = 'doctor_availability'
+    __table_args__ = (
+        # Availability is always read per doctor over a date range
+        db.Index('ix_doctor_availability_doctor_date', 'doctor_id', 'date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'), nullable=False)
@@ -101,8 +115,48 @@ class DoctorAvailability(db.Model):
         return f'<Availability {self.doctor_id} on {self.date}>'
 
 
+class DoctorWeeklySchedule(db.Model):
+    """Working hours repeated every week; DoctorAvailability rows override single dates"""
+    __tablename__ = 'doctor_weekly_schedules'
+    __table_args__ = (
+        # One window per doctor and weekday, read per doctor
+        db.Index('uq_doctor_weekly_schedules_doctor_weekday', 'doctor_id', 'weekday', unique=True),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'), nullable=False)
+    weekday = db.Column(db.Integer, nullable=False)  # 0 = Monday, as date.weekday()
+    start_time = db.Column(db.Time, nullable=False)
+    end_time = db.Column(db.Time, nullable=False)
+
+    def __repr__(self):
+        return f'<WeeklySchedule {self.doctor_id} weekday {self.weekday}>'
+
+
 class Appointment(db.Model):
     __tablename__ = 'appointments'
+    __table_args__ = (
+        # Doctor schedule lookups and slot checks: (doctor_id, appointment_date[, appointment_time, status])
+        db.Index('ix_appointments_doctor_date_time_status',
+                 'doctor_id', 'appointment_date', 'appointment_time', 'status'),
+        # Patient dashboards and history: (patient_id, status[, appointment_date])
+        db.Index('ix_appointments_patient_status_date', 'patient_id', 'status', 'appointment_date'),
+        # At most one active appointment per doctor slot, enforced by the database so that
+        # concurrent bookings cannot both succeed (partial index: cancelled rows may repeat)
+        db.Index('uq_appointments_active_slot', 'doctor_id', 'appointment_date', 'appointment_time',
+                 unique=True,
+                 sqlite_where=db.text("status IN ('Booked', 'Completed')"),
+                 postgresql_where=db.text("status IN ('Booked', 'Completed')")),
+        # Admin appointment listing keyset: (appointment_date, appointment_time, id)
+        db.Index('ix_appointments_date_time_id', 'appointment_date', 'appointment_time', 'id'),
+        # Admin dashboard "recent appointments"
+        db.Index('ix_appointments_created_at', 'created_at'),
+        # Incremental report refresh: rows changed since the last watermark
+        db.Index('ix_appointments_updated_at', 'updated_at'),
+        # Ids of rows moved to the archive (app/archive.py) must never be handed out again;
+        # without AUTOINCREMENT SQLite reuses the highest id once it is deleted
+        {'sqlite_autoincrement': True},
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'), nullable=False)
@@ -113,6 +167,7 @@ class Appointment(db.Model):
     reason = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    reminder_sent_at = db.Column(db.DateTime)  # set when app.jobs queues the reminder
     
     # Relationships
     treatment = db.relationship('Treatment', backref='appointment', uselist=False, cascade='all, delete-orphan')
@@ -123,13 +178,183 @@ class Appointment(db.Model):
 
 class Treatment(db.Model):
     __tablename__ = 'treatments'
+    # Archived ids must not be reused, as for appointments; they also name cached prescription PDFs
+    __table_args__ = {'sqlite_autoincrement': True}
     
     id = db.Column(db.Integer, primary_key=True)
-    appointment_id = db.Column(db.Integer, db.ForeignKey('appointments.id'), nullable=False)
+    appointment_id = db.Column(db.Integer, db.ForeignKey('appointments.id'), nullable=False, index=True)
     diagnosis = db.Column(db.Text, nullable=False)
     prescription = db.Column(db.Text)
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Names cached prescription PDFs (app/prescriptions.py); NULL on rows from before it was added
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     def __repr__(self):
         return f'<Treatment for Appointment {self.appointment_id}>'
+
+
+class ArchivedAppointment(db.Model):
+    """A completed or cancelled appointment moved out of ``appointments`` by app.archive; same columns and ids"""
+    __tablename__ = 'archived_appointments'
+    __table_args__ = (
+        # Patient history: (patient_id, status, appointment_date)
+        db.Index('ix_archived_appointments_patient_status_date', 'patient_id', 'status', 'appointment_date'),
+        # Report recomputation and prescription exports per doctor: (doctor_id, appointment_date)
+        db.Index('ix_archived_appointments_doctor_date', 'doctor_id', 'appointment_date'),
+        # Exports in date order: (appointment_date, appointment_time, id)
+        db.Index('ix_archived_appointments_date_time_id', 'appointment_date', 'appointment_time', 'id'),
+        # Incremental report refresh: rows changed, then archived, since the last watermark
+        db.Index('ix_archived_appointments_updated_at', 'updated_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'), nullable=False)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'), nullable=False)
+    appointment_date = db.Column(db.Date, nullable=False)
+    appointment_time = db.Column(db.Time, nullable=False)
+    status = db.Column(db.String(20))
+    reason = db.Column(db.Text)
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    reminder_sent_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime)
+
+    # The same relationships as Appointment, so history templates render either
+    patient = db.relationship('Patient')
+    doctor = db.relationship('Doctor')
+    treatment = db.relationship('ArchivedTreatment', uselist=False)
+
+    def __repr__(self):
+        return f'<ArchivedAppointment {self.id} - {self.status}>'
+
+
+class ArchivedTreatment(db.Model):
+    """The treatment of an archived appointment; same columns and ids as ``treatments``"""
+    __tablename__ = 'archived_treatments'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    appointment_id = db.Column(db.Integer, db.ForeignKey('archived_appointments.id'), nullable=False, index=True)
+    diagnosis = db.Column(db.Text, nullable=False)
+    prescription = db.Column(db.Text)
+    notes = db.Column(db.Text)
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<ArchivedTreatment for Appointment {self.appointment_id}>'
+
+
+class DoctorPatient(db.Model):
+    """A patient on a doctor's roster, maintained from appointments by app.roster"""
+    __tablename__ = 'doctor_patients'
+    __table_args__ = (
+        # Doctor dashboard roster keyset: (doctor_id, last_appointment_date, patient_id)
+        db.Index('ix_doctor_patients_doctor_last', 'doctor_id', 'last_appointment_date', 'patient_id'),
+    )
+
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'), primary_key=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'), primary_key=True)
+    last_appointment_date = db.Column(db.Date, nullable=False)  # any status
+    last_visit_date = db.Column(db.Date)  # latest completed appointment
+    visit_count = db.Column(db.Integer, nullable=False, default=0)  # completed appointments
+
+    patient = db.relationship('Patient')
+
+    def __repr__(self):
+        return f'<DoctorPatient {self.doctor_id}:{self.patient_id}>'
+
+
+class AppointmentDailyStat(db.Model):
+    """One doctor's appointments on one day, rolled up by app.reports"""
+    __tablename__ = 'appointment_daily_stats'
+
+    day = db.Column(db.Date, primary_key=True)
+    doctor_id = db.Column(db.Integer, primary_key=True)
+    department_id = db.Column(db.Integer)
+    booked = db.Column(db.Integer, nullable=False, default=0)  # any status
+    completed = db.Column(db.Integer, nullable=False, default=0)
+    cancelled = db.Column(db.Integer, nullable=False, default=0)
+    pending = db.Column(db.Integer, nullable=False, default=0)  # still Booked; no-shows once the day has passed
+    lead_days = db.Column(db.Integer, nullable=False, default=0)  # sum of days from booking to appointment
+
+    def __repr__(self):
+        return f'<AppointmentDailyStat {self.day} doctor {self.doctor_id}>'
+
+
+class DepartmentDailyStat(db.Model):
+    """AppointmentDailyStat summed per department, so charts read a few rows per day"""
+    __tablename__ = 'department_daily_stats'
+
+    day = db.Column(db.Date, primary_key=True)
+    department_id = db.Column(db.Integer, primary_key=True)
+    booked = db.Column(db.Integer, nullable=False, default=0)
+    completed = db.Column(db.Integer, nullable=False, default=0)
+    cancelled = db.Column(db.Integer, nullable=False, default=0)
+    pending = db.Column(db.Integer, nullable=False, default=0)
+    lead_days = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<DepartmentDailyStat {self.day} department {self.department_id}>'
+
+
+class ReportWatermark(db.Model):
+    """When app.reports last folded changed appointments into the rollups"""
+    __tablename__ = 'report_watermarks'
+
+    name = db.Column(db.String(64), primary_key=True)
+    value = db.Column(db.DateTime)  # appointments updated after this (less reports.OVERLAP) are re-read
+    refreshed_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<ReportWatermark {self.name}={self.value}>'
+
+
+class StatCounter(db.Model):
+    """Precomputed dashboard counter, maintained incrementally by app.stats"""
+    __tablename__ = 'stat_counters'
+    
+    key = db.Column(db.String(64), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+    reconciled_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<StatCounter {self.key}={self.value}>'
+
+
+class Job(db.Model):
+    """Deferred work run by the job worker, see app.jobs"""
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        # Worker claims: due pending jobs in run_at order
+        db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(64), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')  # JSON
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, running, done, failed
+    key = db.Column(db.String(64), unique=True)  # at most one pending job per key; cleared when claimed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(128))
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind} {self.status}>'
+
+
+class SchemaVersion(db.Model):
+    """Schema version the database was last initialised for, see app.bootstrap"""
+    __tablename__ = 'schema_version'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<SchemaVersion {self.version}>'
@@ -0,0 +1,103 @@
+"""Patient notifications and the senders that deliver them.
+
+Messages are built and sent by background jobs (app/jobs.py), never in the
+request that caused them. A sender takes a list of :class:`Message` and
+delivers the whole batch, raising if it could not, so the job is retried.
+``NOTIFICATION_SENDER`` selects one:
+
+- ``file`` appends each message as a JSON line to ``NOTIFICATION_OUTBOX``,
+  a stand-in for development and benchmarks;
+- ``smtp`` sends through ``SMTP_HOST``:``SMTP_PORT`` over one connection
+  per batch, e.g. to a local debugging server
+  (``python -m aiosmtpd -n -l localhost:1025``);
+- ``null`` drops them;
+- ``package.module:factory`` calls ``factory(app)`` for any other sender.
+"""
+import json
+import os
+import smtplib
+from collections import namedtuple
+from datetime import datetime
+from email.message import EmailMessage
+from flask import current_app
+from werkzeug.utils import import_string
+
+Message = namedtuple('Message', 'to subject body')
+
+
+class FileSender:
+    """Appends messages to a JSON lines file"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, messages):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        sent_at = datetime.utcnow().isoformat()
+        with open(self.path, 'a', encoding='utf-8') as out:
+            out.writelines(json.dumps(dict(message._asdict(), sent_at=sent_at)) + '\n' for message in messages)
+
+
+class SmtpSender:
+    """Sends messages as plain-text email, one SMTP session per batch"""
+
+    def __init__(self, host, port, sender, timeout=30):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.timeout = timeout
+
+    def send(self, messages):
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            for message in messages:
+                email = EmailMessage()
+                email['From'] = self.sender
+                email['To'] = message.to
+                email['Subject'] = message.subject
+                email.set_content(message.body)
+                smtp.send_message(email)
+
+
+class NullSender:
+    def send(self, messages):
+        pass
+
+
+def create_sender(app):
+    name = app.config['NOTIFICATION_SENDER']
+    if name == 'file':
+        return FileSender(app.config['NOTIFICATION_OUTBOX'])
+    if name == 'smtp':
+        return SmtpSender(app.config['SMTP_HOST'], app.config['SMTP_PORT'], app.config['MAIL_FROM'])
+    if name == 'null':
+        return NullSender()
+    return import_string(name)(app)
+
+
+def sender():
+    """The configured sender, created once per app"""
+    app = current_app._get_current_object()
+    if 'notification_sender' not in app.extensions:
+        app.extensions['notification_sender'] = create_sender(app)
+    return app.extensions['notification_sender']
+
+
+SUBJECTS = {
+    'booked': 'Appointment confirmed',
+    'cancelled': 'Appointment cancelled',
+    'reminder': 'Appointment reminder',
+}
+
+INTROS = {
+    'booked': 'Your appointment is confirmed.',
+    'cancelled': 'Your appointment has been cancelled. You can book another time from your dashboard.',
+    'reminder': 'This is a reminder of your upcoming appointment.',
+}
+
+
+def appointment_message(event, email, patient_name, doctor_name, appointment_date, appointment_time):
+    """The message telling a patient about an appointment being booked, cancelled or coming up"""
+    when = f'{appointment_date:%A %d %B %Y} at {appointment_time:%H:%M}'
+    body = (f'Dear {patient_name},\n\n{INTROS[event]}\n\n'
+            f'Doctor: Dr. {doctor_name}\nDate: {when}\n\nHealthCare Plus')
+    return Message(email, f'{SUBJECTS[event]}: {when}', body)
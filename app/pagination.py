@@ -0,0 +1,134 @@
+"""Keyset (cursor) pagination.
+
+Pages are selected with a row-value comparison against the sort key of the
+last row already shown, e.g. ``(appointment_date, appointment_time, id) <
+(:d, :t, :id)``, instead of OFFSET. With an index on the sort key the
+database seeks straight to the page, so page 10,000 costs the same as page 1.
+Cursors are opaque URL-safe tokens carrying the sort key and the direction.
+"""
+import base64
+import json
+from datetime import date, time, datetime
+from sqlalchemy import tuple_
+
+
+class Page:
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def _encode_value(value):
+    if isinstance(value, (date, time, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _decode_value(column, value):
+    python_type = column.type.python_type
+    if python_type in (date, time, datetime):
+        return python_type.fromisoformat(value)
+    return python_type(value)
+
+
+def encode_cursor(values, direction):
+    payload = json.dumps({'k': [_encode_value(v) for v in values], 'd': direction}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, columns):
+    """Return ``(values, direction)`` or ``(None, 'next')`` for a missing or malformed cursor"""
+    if not token:
+        return None, 'next'
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if len(payload['k']) != len(columns):
+            return None, 'next'
+        values = [_decode_value(col, v) for col, v in zip(columns, payload['k'])]
+        direction = 'prev' if payload.get('d') == 'prev' else 'next'
+        return values, direction
+    except (ValueError, TypeError, KeyError):
+        return None, 'next'
+
+
+def keyset_paginate(query, columns, cursor=None, per_page=24, descending=False):
+    """Return a :class:`Page` of ``query`` ordered by ``columns``.
+
+    ``columns`` must end with a unique column (normally the primary key) so
+    the sort key is a total order.
+    """
+    values, direction = decode_cursor(cursor, columns)
+    key = tuple_(*columns)
+    # Walking backwards flips both the comparison and the sort order
+    forward = direction == 'next'
+    scan_descending = descending if forward else not descending
+
+    if values is not None:
+        bound = tuple_(*values)
+        query = query.filter(key < bound if scan_descending else key > bound)
+
+    order = [col.desc() if scan_descending else col.asc() for col in columns]
+    rows = query.order_by(*order).limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not forward:
+        rows.reverse()
+
+    def key_of(item):
+        return [getattr(item, col.key) for col in columns]
+
+    if forward:
+        has_next, has_prev = has_more, values is not None
+    else:
+        has_next, has_prev = values is not None, has_more
+
+    next_cursor = prev_cursor = None
+    if rows and has_next:
+        next_cursor = encode_cursor(key_of(rows[-1]), 'next')
+    if rows and has_prev:
+        prev_cursor = encode_cursor(key_of(rows[0]), 'prev')
+
+    return Page(rows, next_cursor=next_cursor, prev_cursor=prev_cursor)
+
+
+def keyset_paginate_merged(sources, cursor=None, per_page=24, descending=False):
+    """Return a :class:`Page` of several queries read as one sequence.
+
+    ``sources`` are ``(query, columns)`` pairs whose sort keys have the same
+    types, such as the same table in two tiers. Each query is paginated on
+    its own from the same cursor and the rows are merged, so a page costs one
+    query per source.
+    """
+    columns = sources[0][1]
+    values, direction = decode_cursor(cursor, columns)
+    forward = direction == 'next'
+    pages = [(keyset_paginate(query, cols, cursor, per_page, descending), cols) for query, cols in sources]
+    rows = sorted(((tuple(getattr(item, col.key) for col in cols), item)
+                   for page, cols in pages for item in page.items),
+                  key=lambda pair: pair[0], reverse=descending)
+    # Another page exists if a source had more rows, or the merged rows overflow this one
+    has_more = len(rows) > per_page or any(page.has_next if forward else page.has_prev for page, _ in pages)
+    rows = rows[:per_page] if forward else rows[-per_page:]
+
+    if forward:
+        has_next, has_prev = has_more, values is not None
+    else:
+        has_next, has_prev = values is not None, has_more
+
+    next_cursor = prev_cursor = None
+    if rows and has_next:
+        next_cursor = encode_cursor(rows[-1][0], 'next')
+    if rows and has_prev:
+        prev_cursor = encode_cursor(rows[0][0], 'prev')
+
+    return Page([item for _, item in rows], next_cursor=next_cursor, prev_cursor=prev_cursor)
@@ -0,0 +1,91 @@
+"""Password hashing and verification off the request thread.
+
+Hashing is deliberately slow (scrypt takes around 0.1 s of CPU), so a burst
+of logins would otherwise keep every request thread of a worker busy.
+``hash_password`` and ``verify_password`` hand the work to a process pool
+of ``PASSWORD_HASH_WORKERS`` processes (app/pools.py), which bounds how
+many hashes run at once and spreads them over all cores. The pool runs
+only Werkzeug's own functions.
+
+``PASSWORD_HASH_METHOD`` selects the algorithm and cost in Werkzeug's
+notation, e.g. ``scrypt:32768:8:1`` or ``pbkdf2:sha256:600000``. Stored
+hashes made with other parameters are re-hashed on the next successful
+login (see ``User.check_password``).
+"""
+import os
+import threading
+from concurrent.futures.process import BrokenProcessPool
+from flask import current_app
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+from app.pools import process_pool
+
+# Werkzeug's defaults for a method given without its parameters
+DEFAULT_PARAMETERS = {
+    'scrypt': ['32768', '8', '1'],
+    'pbkdf2': ['sha256', str(DEFAULT_PBKDF2_ITERATIONS)],
+}
+
+_executor = None
+_executor_key = None
+_lock = threading.Lock()
+
+
+def hash_method():
+    """The configured method with all of its parameters, as it appears in a stored hash"""
+    name, *params = current_app.config['PASSWORD_HASH_METHOD'].split(':')
+    defaults = DEFAULT_PARAMETERS.get(name, [])
+    if name == 'pbkdf2' and len(params) == 1:
+        params.append(defaults[1])
+    return ':'.join([name] + (params or defaults))
+
+
+def _pool():
+    global _executor, _executor_key
+    workers = current_app.config['PASSWORD_HASH_WORKERS'] or os.cpu_count() or 1
+    if workers <= 1:
+        return None
+    # A pool inherited through fork (e.g. a preloading server) belongs to the parent process
+    key = (os.getpid(), workers)
+    if _executor_key != key:
+        with _lock:
+            if _executor_key != key:
+                if _executor is not None and _executor_key[0] == key[0]:
+                    _executor.shutdown(wait=False)
+                _executor = process_pool(workers)
+                if _executor is None:
+                    return None
+                _executor_key = key
+    return _executor
+
+
+def _run(fn, *args):
+    executor = _pool()
+    if executor is None:
+        return fn(*args)
+    try:
+        return executor.submit(fn, *args).result()
+    except BrokenProcessPool:
+        # A pool process died (e.g. killed for memory); start a new pool on the next call
+        _discard(executor)
+        return fn(*args)
+
+
+def _discard(executor):
+    global _executor, _executor_key
+    with _lock:
+        if _executor is executor:
+            _executor = _executor_key = None
+    executor.shutdown(wait=False)
+
+
+def hash_password(password):
+    return _run(generate_password_hash, password, hash_method())
+
+
+def verify_password(password_hash, password):
+    return _run(check_password_hash, password_hash, password)
+
+
+def needs_rehash(password_hash):
+    """True if ``password_hash`` was made with a different algorithm or cost than configured"""
+    return password_hash.partition('$')[0] != hash_method()
@@ -0,0 +1,167 @@
+"""A minimal PDF writer for text documents.
+
+The project has no PDF dependency and prescriptions are text, so this
+writes PDF 1.4 files directly: A4 pages, the standard Helvetica and
+Courier fonts (every viewer provides them, so nothing is embedded),
+Flate-compressed page contents and WinAnsi (Windows-1252) text; other
+characters are printed as ``?``.
+"""
+import re
+import zlib
+
+# A4 in points
+PAGE_WIDTH = 595.28
+PAGE_HEIGHT = 841.89
+
+FONTS = {'regular': 'Helvetica', 'bold': 'Helvetica-Bold', 'mono': 'Courier'}
+
+# Advance widths (1/1000 em) of characters 32-126, from the Adobe font metrics
+_HELVETICA = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+]
+_HELVETICA_BOLD = [
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611,
+    975, 722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333, 278, 333, 584, 556,
+    333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+    611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584,
+]
+_WIDTHS = {'regular': _HELVETICA, 'bold': _HELVETICA_BOLD}
+
+
+def _clean(text):
+    # Tabs and stray control characters have no glyph in the standard fonts
+    return re.sub(r'[\x00-\x1f\x7f]', ' ', text.replace('\t', '    '))
+
+
+def text_width(text, font, size):
+    """Width of ``text`` in points"""
+    if font == 'mono':
+        return len(text) * 600 * size / 1000
+    widths = _WIDTHS[font]
+    return sum(widths[ord(char) - 32] if 32 <= ord(char) <= 126 else 556 for char in text) * size / 1000
+
+
+def wrap(text, font, size, width):
+    """Split ``text`` into lines no wider than ``width``; newlines are kept, long words are broken"""
+    lines = []
+    for paragraph in str(text).splitlines() or ['']:
+        line = ''
+        for word in _clean(paragraph).split(' '):
+            candidate = f'{line} {word}' if line else word
+            if text_width(candidate, font, size) <= width:
+                line = candidate
+                continue
+            if line:
+                lines.append(line)
+            while text_width(word, font, size) > width:
+                cut = len(word) - 1
+                while cut > 1 and text_width(word[:cut], font, size) > width:
+                    cut -= 1
+                lines.append(word[:cut])
+                word = word[cut:]
+            line = word
+        lines.append(line)
+    return lines
+
+
+def _escape(text):
+    return _clean(text).replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def _color(rgb):
+    return ' '.join(f'{channel / 255:.3f}' for channel in rgb)
+
+
+class Document:
+    """Text laid out top to bottom on A4 pages; a new page starts when one is full.
+
+    ``y`` is the baseline of the last line written, in points from the bottom of the page.
+    """
+
+    def __init__(self, margin=50):
+        self.margin = margin
+        self.width = PAGE_WIDTH - 2 * margin
+        self.pages = []
+        self.new_page()
+
+    def new_page(self):
+        self.ops = []
+        self.pages.append(self.ops)
+        self.y = PAGE_HEIGHT - self.margin
+
+    def ensure(self, height):
+        """Start a new page unless ``height`` points fit above the bottom margin"""
+        if self.y - height < self.margin:
+            self.new_page()
+
+    def space(self, points):
+        self.y -= points
+
+    def rect(self, x, y, width, height, color):
+        self.ops.append(f'{_color(color)} rg {x:.2f} {y:.2f} {width:.2f} {height:.2f} re f')
+
+    def rule(self, color=(229, 231, 235), thickness=1):
+        self.ops.append(f'{_color(color)} RG {thickness} w {self.margin:.2f} {self.y:.2f} m '
+                        f'{PAGE_WIDTH - self.margin:.2f} {self.y:.2f} l S')
+
+    def text_at(self, x, y, text, font='regular', size=11, color=(17, 24, 39)):
+        """One line of text with its baseline at ``(x, y)``"""
+        self.ops.append(f'BT /{font} {size} Tf {_color(color)} rg 1 0 0 1 {x:.2f} {y:.2f} Tm '
+                        f'({_escape(text)}) Tj ET')
+
+    def paragraph(self, text, font='regular', size=11, color=(17, 24, 39), leading=None, align='left'):
+        """Wrapped text below the current position"""
+        leading = leading or size * 1.4
+        for line in wrap(text, font, size, self.width):
+            self.ensure(leading)
+            self.y -= leading
+            x = self.margin
+            if align == 'right':
+                x += self.width - text_width(line, font, size)
+            self.text_at(x, self.y, line, font, size, color)
+
+    def build(self):
+        """The document as PDF bytes"""
+        objects = []
+
+        def add(body):
+            objects.append(body)
+            return len(objects)
+
+        catalog, pages = add(None), add(None)
+        fonts = ' '.join(
+            f'/{name} {add(f"<< /Type /Font /Subtype /Type1 /BaseFont /{base} /Encoding /WinAnsiEncoding >>".encode())} 0 R'
+            for name, base in FONTS.items())
+        kids = []
+        for ops in self.pages:
+            stream = zlib.compress('\n'.join(ops).encode('cp1252', 'replace'))
+            contents = add(b'<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream' % (len(stream), stream))
+            kids.append(add(
+                f'<< /Type /Page /Parent {pages} 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] '
+                f'/Resources << /Font << {fonts} >> >> /Contents {contents} 0 R >>'.encode()))
+        objects[catalog - 1] = f'<< /Type /Catalog /Pages {pages} 0 R >>'.encode()
+        objects[pages - 1] = (f'<< /Type /Pages /Kids [{" ".join(f"{kid} 0 R" for kid in kids)}] '
+                              f'/Count {len(kids)} >>').encode()
+
+        out = bytearray(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        offsets = []
+        for number, body in enumerate(objects, 1):
+            offsets.append(len(out))
+            out += b'%d 0 obj\n%s\nendobj\n' % (number, body)
+        xref = len(out)
+        out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+        out += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+        out += b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, catalog, xref)
+        return bytes(out)
+
+
+def page_count(data):
+    """Number of pages in a PDF written by :class:`Document`"""
+    return data.count(b'/Type /Page /')
@@ -0,0 +1,25 @@
+"""Process pools for CPU-bound work: password hashing, bulk import, PDF rendering.
+
+Pools are often created lazily from a request thread, and forking a
+multi-threaded server copies locks other threads hold (logging, database
+drivers) into the child, where nobody will release them. Workers are
+therefore started with ``forkserver`` (``spawn`` where it is unavailable),
+from a clean single-threaded process. Tasks must be module-level functions
+with picklable arguments, and the main module should keep its side effects
+under ``if __name__ == '__main__'``.
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+
+def start_method():
+    return 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+def process_pool(workers):
+    """A ``ProcessPoolExecutor`` of ``workers`` processes, or None where processes cannot be started"""
+    try:
+        return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(start_method()))
+    except (OSError, NotImplementedError):
+        # Runtimes without multiprocessing support (e.g. some serverless platforms)
+        return None
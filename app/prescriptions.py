@@ -0,0 +1,300 @@
+"""Prescriptions as PDF files, exported in bulk as a streamed ZIP archive.
+
+:func:`render` lays one prescription out with app/pdf.py. A
+:class:`BatchExport` selects the completed visits matching a filter (date
+range, doctor, patient), renders the documents it has not rendered before
+in a pool of ``PDF_WORKERS`` processes and streams each PDF into the ZIP as
+soon as it is ready, so the download starts at once and memory stays flat
+for thousands of prescriptions.
+
+Rendered files are kept under ``PRESCRIPTION_CACHE_DIR``, named after the
+treatment and the latest ``updated_at`` of the treatment, appointment,
+patient and doctor it prints; editing any of them renders the document
+again, and the previous file is removed. Completing a visit queues a job
+(app/jobs.py) that renders its document ahead of the next export.
+
+Exports cover both tiers (app/archive.py): the archive first, then the hot
+tables. Archiving keeps treatment ids and ``updated_at``, so documents
+already rendered stay cached when their visit is archived.
+"""
+import glob
+import os
+import time as timer
+import zipfile
+from contextlib import contextmanager
+from datetime import date, datetime
+from itertools import chain
+from flask import current_app
+from sqlalchemy import func
+from app.models import Appointment, ArchivedAppointment, ArchivedTreatment, Doctor, Patient, Treatment
+from app.serializers import Serializer
+from app.pools import process_pool
+from app.pdf import PAGE_HEIGHT, PAGE_WIDTH, Document, page_count, text_width
+
+# Bump when render() changes so cached files from the old layout are not served
+LAYOUT_VERSION = 1
+
+# Visits fetched per round-trip and handed to the workers at once
+BATCH_SIZE = 500
+
+ACCENT = (79, 70, 229)
+MUTED = (107, 114, 128)
+
+def _document_fields(model, treatment_model):
+    return dict(
+        treatment_id=treatment_model.id,
+        appointment_id=model.id,
+        appointment_date=model.appointment_date,
+        created_at=model.created_at,
+        patient_name=Patient.full_name,
+        date_of_birth=Patient.date_of_birth,
+        gender=Patient.gender,
+        address=Patient.address,
+        doctor_id=Doctor.id,
+        doctor_name=Doctor.full_name,
+        specialization=Doctor.specialization,
+        qualification=Doctor.qualification,
+        diagnosis=treatment_model.diagnosis,
+        prescription=treatment_model.prescription,
+        notes=treatment_model.notes,
+        # Treatments from before updated_at existed only have created_at
+        treatment_changed=func.coalesce(treatment_model.updated_at, treatment_model.created_at),
+        appointment_changed=model.updated_at,
+        patient_changed=Patient.updated_at,
+        doctor_changed=Doctor.updated_at,
+    )
+
+
+document = Serializer(**_document_fields(Appointment, Treatment))
+archived_document = Serializer(**_document_fields(ArchivedAppointment, ArchivedTreatment))
+
+
+def parse_filters(args):
+    """``{date_from, date_to, doctor_id, patient_id}`` from ``from``, ``to``, ``doctor`` and ``patient`` arguments.
+
+    Raises ValueError for malformed dates.
+    """
+    try:
+        date_from = date.fromisoformat(args['from']) if args.get('from') else None
+        date_to = date.fromisoformat(args['to']) if args.get('to') else None
+    except ValueError:
+        raise ValueError('dates must be YYYY-MM-DD')
+    return {'date_from': date_from, 'date_to': date_to,
+            'doctor_id': args.get('doctor', type=int), 'patient_id': args.get('patient', type=int)}
+
+
+def query(date_from=None, date_to=None, doctor_id=None, patient_id=None, appointment_ids=None, archived=False):
+    """Prescription documents of completed visits, oldest first, from the archive with ``archived``"""
+    model, treatment_model, serializer = ((ArchivedAppointment, ArchivedTreatment, archived_document) if archived
+                                          else (Appointment, Treatment, document))
+    q = (serializer.select()
+         .select_from(treatment_model)
+         .join(model, treatment_model.appointment_id == model.id)
+         .join(Patient, model.patient_id == Patient.id)
+         .join(Doctor, model.doctor_id == Doctor.id)
+         .filter(model.status == 'Completed'))
+    if date_from:
+        q = q.filter(model.appointment_date >= date_from)
+    if date_to:
+        q = q.filter(model.appointment_date <= date_to)
+    if doctor_id:
+        q = q.filter(model.doctor_id == doctor_id)
+    if patient_id:
+        q = q.filter(model.patient_id == patient_id)
+    if appointment_ids is not None:
+        q = q.filter(model.id.in_(appointment_ids))
+    return q.order_by(model.appointment_date, model.id)
+
+
+def prescription_id(doc):
+    """The number printed on the prescription, as on the print page"""
+    return f"RX-{doc['appointment_id']}-{doc['created_at'][:10].replace('-', '')}"
+
+
+def render(doc):
+    """One prescription, from a dumped :data:`document` row, as PDF bytes"""
+    pdf = Document()
+    band = 90
+    pdf.rect(0, PAGE_HEIGHT - band, PAGE_WIDTH, band, ACCENT)
+    pdf.text_at(pdf.margin, PAGE_HEIGHT - 42, 'HealthCare Plus', 'bold', 20, (255, 255, 255))
+    pdf.text_at(pdf.margin, PAGE_HEIGHT - 60, 'Excellence in Medical Care', 'regular', 10, (224, 231, 255))
+    number = '#' + prescription_id(doc)
+    right = PAGE_WIDTH - pdf.margin
+    pdf.text_at(right - text_width('PRESCRIPTION ID', 'bold', 8), PAGE_HEIGHT - 40, 'PRESCRIPTION ID',
+                'bold', 8, (224, 231, 255))
+    pdf.text_at(right - text_width(number, 'bold', 11), PAGE_HEIGHT - 56, number, 'bold', 11, (255, 255, 255))
+    pdf.y = PAGE_HEIGHT - band - 16
+
+    pdf.paragraph('Doctor', 'bold', 12, ACCENT)
+    pdf.paragraph(doc['doctor_name'], 'bold', 14)
+    pdf.paragraph(' / '.join(filter(None, [doc['specialization'], doc['qualification']])), size=10, color=MUTED)
+    pdf.paragraph(f"Reg No: HCP-DOC-{doc['doctor_id']}", size=9, color=MUTED)
+    pdf.space(14)
+
+    pdf.paragraph('Patient', 'bold', 12, ACCENT)
+    pdf.paragraph(doc['patient_name'], 'bold', 14)
+    # Date of birth rather than age, so a stored file stays correct
+    born = date.fromisoformat(doc['date_of_birth']).strftime('%d %B %Y') if doc['date_of_birth'] else 'N/A'
+    pdf.paragraph(f"Born {born} / {doc['gender'] or 'N/A'}", size=10, color=MUTED)
+    pdf.paragraph(f"Date: {date.fromisoformat(doc['appointment_date']).strftime('%d %B, %Y')}", size=10, color=MUTED)
+    pdf.paragraph(f"Address: {doc['address'] or 'N/A'}", size=10, color=MUTED)
+    pdf.space(16)
+    pdf.rule()
+    pdf.space(10)
+
+    pdf.paragraph('DIAGNOSIS', 'bold', 9, MUTED)
+    pdf.paragraph(doc['diagnosis'], size=13)
+    pdf.space(14)
+    pdf.paragraph('Rx', 'bold', 26, ACCENT)
+    pdf.paragraph(doc['prescription'] or '', 'mono', 11, leading=18)
+    if doc['notes']:
+        pdf.space(14)
+        pdf.paragraph('ADVICE / NOTES', 'bold', 9, MUTED)
+        pdf.paragraph(doc['notes'], size=11)
+
+    pdf.space(30)
+    pdf.ensure(60)
+    pdf.rule()
+    pdf.paragraph('This prescription is valid for 30 days from the date of issue.', size=9, color=MUTED)
+    pdf.paragraph('Generated electronically by HealthCare Plus HMS.', size=9, color=MUTED)
+    # Surname only; full_name may be blank
+    pdf.paragraph(f"Dr. {(doc['doctor_name'].split() or [''])[-1]}", 'bold', 14, ACCENT, align='right')
+    pdf.paragraph("Doctor's Signature", size=8, color=MUTED, align='right')
+    return pdf.build()
+
+
+def _render_all(docs):
+    return [render(doc) for doc in docs]
+
+
+@contextmanager
+def renderer(workers=0):
+    """Yield a function rendering a list of documents, in order, using ``workers`` processes (0 = one per CPU)"""
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1:
+        yield _render_all
+        return
+    executor = process_pool(workers)
+    if executor is None:
+        yield _render_all
+        return
+    with executor:
+        yield lambda docs: executor.map(render, docs, chunksize=max(1, len(docs) // (workers * 4)))
+
+
+class _Stream:
+    """Write-only file object collecting what zipfile writes, drained after each member"""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+class BatchExport:
+    """A ZIP of prescription PDFs for ``filters`` (see :func:`query`), with counts and timing once streamed"""
+
+    def __init__(self, cache_dir=None, workers=None, **filters):
+        self.filters = filters
+        self.cache_dir = cache_dir or current_app.config['PRESCRIPTION_CACHE_DIR']
+        self.workers = current_app.config['PDF_WORKERS'] if workers is None else workers
+        self.documents = self.pages = self.rendered = 0
+        self.seconds = 0.0
+
+    @property
+    def pages_per_second(self):
+        return self.pages / self.seconds if self.seconds else 0.0
+
+    def summary(self):
+        return (f'{self.documents} prescriptions, {self.pages} pages ({self.rendered} rendered, '
+                f'{self.documents - self.rendered} from cache) in {self.seconds:.1f}s: '
+                f'{self.pages_per_second:.0f} pages/s')
+
+    def _path(self, doc):
+        changed = max(value for value in (doc['treatment_changed'], doc['appointment_changed'],
+                                          doc['patient_changed'], doc['doctor_changed']) if value)
+        stamp = changed.replace('-', '').replace(':', '').replace('.', '').replace('T', '')
+        return os.path.join(self.cache_dir, f"{doc['treatment_id']}-{stamp}-v{LAYOUT_VERSION}.pdf")
+
+    def _cached(self, path):
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _store(self, path, data, treatment_id):
+        # Write then rename, so a concurrent export never reads half a file
+        tmp = f'{path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+            for stale in glob.glob(os.path.join(self.cache_dir, f'{treatment_id}-*.pdf')):
+                if stale != path:
+                    os.remove(stale)
+        except OSError:
+            # The cache is an optimisation; the export goes on without it
+            pass
+
+    def _documents(self, render_batch):
+        """``(doc, pdf bytes)`` in query order, archive first, rendering cache misses a batch at a time"""
+        batch = []
+        for row in chain.from_iterable(query(archived=archived, **self.filters).yield_per(BATCH_SIZE)
+                                       for archived in (True, False)):
+            # Both serializers have the same fields
+            batch.append(document.dump(row))
+            if len(batch) == BATCH_SIZE:
+                yield from self._complete(batch, render_batch)
+                batch = []
+        if batch:
+            yield from self._complete(batch, render_batch)
+
+    def _complete(self, batch, render_batch):
+        paths = [self._path(doc) for doc in batch]
+        found = [self._cached(path) for path in paths]
+        missing = [doc for doc, data in zip(batch, found) if data is None]
+        rendered = iter(render_batch(missing) if missing else ())
+        for doc, path, data in zip(batch, paths, found):
+            if data is None:
+                data = next(rendered)
+                self._store(path, data, doc['treatment_id'])
+                self.rendered += 1
+            yield doc, data
+
+    def prerender(self):
+        """Render the documents missing from the cache without building an archive; returns how many"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with renderer(self.workers) as render_batch:
+            for _ in self._documents(render_batch):
+                pass
+        return self.rendered
+
+    def chunks(self):
+        """The ZIP archive as an iterator of byte chunks, one or more per prescription"""
+        started = timer.perf_counter()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        stream = _Stream()
+        # PDF contents are already compressed
+        with renderer(self.workers) as render_batch, zipfile.ZipFile(stream, 'w', zipfile.ZIP_STORED) as archive:
+            for doc, data in self._documents(render_batch):
+                archive.writestr(f'{prescription_id(doc)}.pdf', data)
+                self.documents += 1
+                self.pages += page_count(data)
+                yield stream.drain()
+        yield stream.drain()
+        self.seconds = timer.perf_counter() - started
+        current_app.logger.info('Prescription export: %s', self.summary())
+
+    def filename(self):
+        return f'prescriptions-{datetime.utcnow():%Y%m%d-%H%M%S}.zip'
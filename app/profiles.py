@@ -0,0 +1,118 @@
+"""Load the logged-in user together with their doctor or patient profile.
+
+``load_user`` is Flask-Login's user loader. It fetches the user and both
+profile relationships in one query, and Flask-Login keeps the result on
+``g`` for the rest of the request, so ``current_doctor()`` and
+``current_patient()`` never go back to the database.
+
+With ``PROFILE_CACHE_TTL`` set, the loaded columns are also kept in
+process memory for that many seconds and later requests build the user
+from them without any query. Flushing a change to, or a delete of, a user
+or profile drops its entry. Other processes only see such a change when
+their entry expires, so keep the TTL short.
+"""
+import threading
+import time
+from flask import current_app
+from flask_login import current_user
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, joinedload, make_transient_to_detached
+from app.models import db, User, Doctor, Patient
+
+# Upper bound on cached users per process; the oldest entries are dropped first
+MAX_CACHED_USERS = 10000
+
+
+class ProfileCache:
+    """User id -> (expiry, column values of the user and of their profile)"""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, user_id):
+        entry = self.entries.get(user_id)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def put(self, user_id, values):
+        with self.lock:
+            self.entries.pop(user_id, None)
+            if len(self.entries) >= MAX_CACHED_USERS:
+                del self.entries[next(iter(self.entries))]
+            self.entries[user_id] = (time.monotonic() + self.ttl, values)
+
+    def discard(self, user_ids):
+        with self.lock:
+            for user_id in user_ids:
+                self.entries.pop(user_id, None)
+
+
+def _columns(obj):
+    return {attr.key: getattr(obj, attr.key) for attr in inspect(type(obj)).column_attrs}
+
+
+def _snapshot(user):
+    return (_columns(user),
+            _columns(user.doctor) if user.doctor else None,
+            _columns(user.patient) if user.patient else None)
+
+
+def _restore(snapshot):
+    """Attach a user rebuilt from cached values to the session without a query"""
+    user_values, doctor_values, patient_values = snapshot
+    user = User(**user_values)
+    # Assigning None as well marks both relationships as loaded
+    user.doctor = Doctor(**doctor_values) if doctor_values else None
+    user.patient = Patient(**patient_values) if patient_values else None
+    for obj in (user, user.doctor, user.patient):
+        if obj is not None:
+            make_transient_to_detached(obj)
+    return db.session.merge(user, load=False)
+
+
+def load_user(user_id):
+    """Flask-Login user loader: the user with their doctor and patient profiles in one query"""
+    user_id = int(user_id)
+    cache = current_app.extensions.get('profile_cache')
+    if cache is not None:
+        snapshot = cache.get(user_id)
+        if snapshot is not None:
+            return _restore(snapshot)
+    user = db.session.get(User, user_id, options=[joinedload(User.doctor), joinedload(User.patient)])
+    if user is not None and cache is not None:
+        cache.put(user_id, _snapshot(user))
+    return user
+
+
+def current_doctor():
+    return current_user.doctor
+
+
+def current_patient():
+    return current_user.patient
+
+
+def _invalidate(session, flush_context):
+    cache = current_app.extensions.get('profile_cache')
+    if cache is None:
+        return
+    user_ids = set()
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            user_ids.add(obj.id)
+        elif isinstance(obj, (Doctor, Patient)):
+            user_ids.add(obj.user_id)
+    if user_ids:
+        cache.discard(user_ids)
+
+
+def install(app):
+    """Set up the cross-request cache if PROFILE_CACHE_TTL is set"""
+    ttl = app.config.get('PROFILE_CACHE_TTL', 0)
+    if ttl > 0:
+        app.extensions['profile_cache'] = ProfileCache(ttl)
+        if not event.contains(Session, 'after_flush', _invalidate):
+            event.listen(Session, 'after_flush', _invalidate)
@@ -0,0 +1,184 @@
+"""Helpers for counting the SQL statements a block of code issues, and opt-in request instrumentation.
+
+Typical use when checking that a page stays free of N+1 queries::
+
+    with assert_max_queries(6):
+        client.get('/admin/appointments')
+
+With ``INSTRUMENTATION`` on, :func:`install` records for every request the
+endpoint, the number of SQL statements, time spent in the database and in
+template rendering. Each response gets a ``Server-Timing`` header with those
+numbers (shown in the browser's network panel). Statements slower than
+``SLOW_QUERY_MS`` and statements executed ``N_PLUS_ONE_THRESHOLD`` or more
+times in one request are logged as warnings. The last
+``INSTRUMENTATION_WINDOW`` requests of each endpoint are kept in memory for
+the percentiles on ``/admin/performance``, which also shows how often the
+fragments of app/fragments.py are served from cache.
+"""
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from flask import g, has_request_context, request, before_render_template, template_rendered, request_started
+from sqlalchemy import event
+from app.models import db
+
+
+class QueryCounter:
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+
+@contextmanager
+def count_queries(engine=None):
+    """Record every statement executed on ``engine`` inside the block"""
+    engine = engine or db.engine
+    counter = QueryCounter()
+    event.listen(engine, 'before_cursor_execute', counter)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', counter)
+
+
+@contextmanager
+def assert_max_queries(limit, engine=None):
+    """Fail with the offending statements if the block issues more than ``limit`` queries"""
+    with count_queries(engine) as counter:
+        yield counter
+    if counter.count > limit:
+        listing = '\n'.join(f'  {i + 1}. {sql}' for i, sql in enumerate(counter.statements))
+        raise AssertionError(f'Expected at most {limit} queries, got {counter.count}:\n{listing}')
+
+
+class RequestStats:
+    """SQL and template timings collected during one request"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.statements = Counter()
+        self.render_starts = []
+        self.fragment_hits = 0
+        self.fragment_misses = 0
+
+
+def _percentile(ordered, pct):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class EndpointStats:
+    """The last ``window`` requests of every endpoint as
+    (total ms, db ms, template ms, queries, fragment hits, fragment misses)"""
+
+    def __init__(self, window):
+        self.window = window
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def add(self, endpoint, sample):
+        samples = self.samples.get(endpoint)
+        if samples is None:
+            with self.lock:
+                samples = self.samples.setdefault(endpoint, deque(maxlen=self.window))
+        samples.append(sample)
+
+    def summary(self):
+        """One row per endpoint, slowest p95 first"""
+        rows = []
+        for endpoint, samples in list(self.samples.items()):
+            samples = list(samples)
+            totals = sorted(sample[0] for sample in samples)
+            fragments = sum(sample[4] + sample[5] for sample in samples)
+            rows.append({
+                'endpoint': endpoint,
+                'requests': len(samples),
+                'p50': _percentile(totals, 50),
+                'p95': _percentile(totals, 95),
+                'p99': _percentile(totals, 99),
+                'db_ms': sum(sample[1] for sample in samples) / len(samples),
+                'template_ms': sum(sample[2] for sample in samples) / len(samples),
+                'queries': sum(sample[3] for sample in samples) / len(samples),
+                'max_queries': max(sample[3] for sample in samples),
+                'fragment_hit_rate': sum(sample[4] for sample in samples) / fragments if fragments else None,
+            })
+        return sorted(rows, key=lambda row: row['p95'], reverse=True)
+
+
+def request_stats():
+    """The stats of the current request, or None outside a request or with instrumentation off"""
+    return g.get('_request_stats') if has_request_context() else None
+
+
+def install(app):
+    """Instrument ``app`` if INSTRUMENTATION is on"""
+    if not app.config['INSTRUMENTATION']:
+        return
+    slow_query = app.config['SLOW_QUERY_MS'] / 1000
+    repeat_threshold = app.config['N_PLUS_ONE_THRESHOLD']
+    endpoints = app.extensions['instrumentation'] = EndpointStats(app.config['INSTRUMENTATION_WINDOW'])
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._query_start = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._query_start
+        stats = request_stats()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_time += elapsed
+            stats.statements[statement] += 1
+        if elapsed >= slow_query:
+            app.logger.warning('Slow query (%.1f ms) in %s: %s', elapsed * 1000,
+                               request.endpoint if has_request_context() else 'no request', statement)
+
+    def on_request_started(sender, **extra):
+        g._request_stats = RequestStats()
+
+    def on_before_render(sender, template, context, **extra):
+        stats = request_stats()
+        if stats is not None:
+            stats.render_starts.append(time.perf_counter())
+
+    def on_rendered(sender, template, context, **extra):
+        stats = request_stats()
+        if stats is not None and stats.render_starts:
+            stats.template_time += time.perf_counter() - stats.render_starts.pop()
+
+    # weak=False: the receivers are closures that would otherwise be garbage collected
+    request_started.connect(on_request_started, app, weak=False)
+    before_render_template.connect(on_before_render, app, weak=False)
+    template_rendered.connect(on_rendered, app, weak=False)
+
+    @app.after_request
+    def record_request(response):
+        stats = request_stats()
+        if stats is None:
+            return response
+        total = time.perf_counter() - stats.start
+        endpoint = request.endpoint or 'unmatched'
+        response.headers.add('Server-Timing', f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries"')
+        response.headers.add('Server-Timing', f'tpl;dur={stats.template_time * 1000:.1f}')
+        response.headers.add('Server-Timing', f'app;dur={total * 1000:.1f}')
+        if stats.fragment_hits or stats.fragment_misses:
+            response.headers.add('Server-Timing', f'frag;desc="{stats.fragment_hits} hits, '
+                                                  f'{stats.fragment_misses} misses"')
+        for statement, count in stats.statements.items():
+            if count >= repeat_threshold:
+                app.logger.warning('Possible N+1 in %s: statement executed %d times: %s', endpoint, count, statement)
+        endpoints.add(endpoint, (total * 1000, stats.db_time * 1000, stats.template_time * 1000, stats.queries,
+                                 stats.fragment_hits, stats.fragment_misses))
+        return response
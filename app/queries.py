@@ -0,0 +1,87 @@
+"""Reusable query builders that eager-load what the templates render.
+
+Listing templates touch ``apt.patient``, ``apt.doctor``, ``apt.treatment`` and
+``doctor.department`` for every row. Without eager loading each of those is a
+separate lazy SELECT per row, so the builders below load them up front.
+All of them are many-to-one or one-to-one, so joined loading adds columns
+to the same SELECT without multiplying rows and the statement count stays
+constant however many rows a page renders.
+
+Builders used for history take ``model`` to read the archive tier
+(``ArchivedAppointment``, see app/archive.py) instead of ``Appointment``.
+
+The ``*_filters`` helpers apply the listing filters shared by the HTML pages
+and the JSON API.
+"""
+from datetime import datetime
+from sqlalchemy.orm import joinedload
+from app.models import Appointment, Doctor
+from app.search import search_appointments, search_doctors
+
+
+def appointment_listing(query=None, model=Appointment):
+    """Appointments with patient, doctor and department preloaded"""
+    query = query if query is not None else model.query
+    return query.options(
+        joinedload(model.patient),
+        joinedload(model.doctor).joinedload(Doctor.department),
+    )
+
+
+def prescription(query=None, model=Appointment):
+    """Appointments with everything a prescription renders preloaded"""
+    return appointment_listing(query, model).options(joinedload(model.treatment))
+
+
+def patient_appointments(query=None, model=Appointment):
+    """Appointments for patient pages: doctor, department and treatment preloaded"""
+    query = query if query is not None else model.query
+    return query.options(
+        joinedload(model.doctor).joinedload(Doctor.department),
+        joinedload(model.treatment),
+    )
+
+
+def doctor_appointments(query=None):
+    """Appointments for doctor schedules: patient preloaded"""
+    query = query if query is not None else Appointment.query
+    return query.options(joinedload(Appointment.patient))
+
+
+def visit_history(query=None, model=Appointment):
+    """Completed visits for history views: treatment and doctor preloaded"""
+    query = query if query is not None else model.query
+    return query.options(
+        joinedload(model.doctor),
+        joinedload(model.treatment),
+    )
+
+
+def doctor_listing(query=None):
+    """Doctors with their department preloaded"""
+    query = query if query is not None else Doctor.query
+    return query.options(joinedload(Doctor.department))
+
+
+def appointment_filters(query, search='', status='', date_from='', model=Appointment):
+    """Apply the admin appointment filters; an unparseable ``date_from`` is ignored"""
+    if search:
+        query = search_appointments(query, search, model)
+    if status:
+        query = query.filter(model.status == status)
+    if date_from:
+        try:
+            from_date = datetime.strptime(date_from, '%Y-%m-%d').date()
+            query = query.filter(model.appointment_date >= from_date)
+        except ValueError:
+            pass
+    return query
+
+
+def doctor_filters(query, search='', department_id='', ranked=False):
+    """Apply the doctor search and department filters"""
+    if search:
+        query = search_doctors(query, search, ranked=ranked)
+    if department_id:
+        query = query.filter(Doctor.department_id == department_id)
+    return query
@@ -0,0 +1,251 @@
+"""Appointment volume and outcome rollups for the analytics page.
+
+Reports read ``appointment_daily_stats`` (one row per doctor and day) and
+``department_daily_stats`` (one row per department and day) instead of
+grouping the live ``appointments`` table, so they do not compete with
+booking traffic and answer a date range from a few hundred rows.
+
+:func:`refresh` keeps the rollups current. It finds the (day, doctor)
+pairs of appointments whose ``updated_at`` is past the stored watermark,
+recomputes only those rows and re-sums the department rows of the days
+involved. Appointments never move to another day or doctor, so a change
+only affects its own row. Rows carry the doctor's department at the time
+they were computed; moving a doctor to another department goes through
+:func:`reassign_doctor` (the admin edit page does), or else needs
+``flask refresh-reports --full``. Rows are computed from hot and archived
+appointments alike (app/archive.py), and changed pairs are looked up in
+both tiers, since an appointment changed after one refresh may be archived
+before the next. Reads refresh first when the last refresh is older than
+``REPORTS_MAX_AGE`` seconds, and ``flask refresh-reports`` does the same
+from cron (``--full`` rebuilds).
+
+No-shows are not stored: they are appointments still ``Booked`` on a day
+that has passed, which changes with the calendar rather than with a row.
+"""
+from datetime import date, datetime, timedelta
+from flask import current_app
+from sqlalchemy import Integer, case, cast, func, insert, tuple_, union_all
+from sqlalchemy.exc import IntegrityError
+from app.models import (db, AppointmentDailyStat, Department, DepartmentDailyStat, Doctor,
+                        ReportWatermark)
+from app.archive import TIERS
+
+WATERMARK = 'appointments'
+
+# Changes stamped up to this long before the watermark are read again: a transaction can commit
+# after a refresh with an updated_at from before it
+OVERLAP = timedelta(minutes=5)
+
+# (day, doctor) pairs per statement, below SQLite's bound parameter limit
+CHUNK_SIZE = 400
+
+# Longest range a report covers, and the default one
+MAX_RANGE_DAYS = 366
+DEFAULT_RANGE_DAYS = 30
+
+COUNTS = ['booked', 'completed', 'cancelled', 'pending', 'lead_days']
+
+
+def _lead_days(model):
+    """Days from booking to appointment, per appointment"""
+    if db.engine.dialect.name == 'sqlite':
+        return cast(func.julianday(model.appointment_date) - func.julianday(func.date(model.created_at)), Integer)
+    return model.appointment_date - cast(model.created_at, db.Date)
+
+
+def _with_status(model, status):
+    return func.count(case((model.status == status, 1)))
+
+
+def _doctor_rows(where):
+    """``(day, doctor_id, department_id, *COUNTS)`` over both tiers, for the appointments matching ``where(model)``"""
+    tiers = union_all(*(
+        db.select(model.appointment_date.label('day'), model.doctor_id, Doctor.department_id,
+                  func.count(model.id).label('booked'), _with_status(model, 'Completed').label('completed'),
+                  _with_status(model, 'Cancelled').label('cancelled'), _with_status(model, 'Booked').label('pending'),
+                  func.coalesce(func.sum(_lead_days(model)), 0).label('lead_days'))
+        .join(Doctor, Doctor.id == model.doctor_id, isouter=True)
+        .where(where(model))
+        .group_by(model.appointment_date, model.doctor_id, Doctor.department_id)
+        for model, _ in TIERS
+    )).subquery()
+    return (db.select(tiers.c.day, tiers.c.doctor_id, tiers.c.department_id,
+                      *(func.sum(tiers.c[name]) for name in COUNTS))
+            .group_by(tiers.c.day, tiers.c.doctor_id, tiers.c.department_id))
+
+
+def _department_rows(where):
+    stat = AppointmentDailyStat
+    return (db.select(stat.day, stat.department_id, *(func.sum(getattr(stat, name)) for name in COUNTS))
+            .where(where, stat.department_id.isnot(None))
+            .group_by(stat.day, stat.department_id))
+
+
+def _rebuild(where_appointments, where_days):
+    db.session.execute(insert(AppointmentDailyStat).from_select(
+        ['day', 'doctor_id', 'department_id', *COUNTS], _doctor_rows(where_appointments)))
+    db.session.execute(insert(DepartmentDailyStat).from_select(
+        ['day', 'department_id', *COUNTS], _department_rows(where_days)))
+
+
+def _resum_departments(days):
+    for start in range(0, len(days), CHUNK_SIZE):
+        chunk = days[start:start + CHUNK_SIZE]
+        db.session.execute(db.delete(DepartmentDailyStat).where(DepartmentDailyStat.day.in_(chunk)))
+        db.session.execute(insert(DepartmentDailyStat).from_select(
+            ['day', 'department_id', *COUNTS], _department_rows(AppointmentDailyStat.day.in_(chunk))))
+
+
+def reassign_doctor(doctor_id):
+    """Move a doctor's rows to their current department and re-sum the departments of those days.
+
+    Call after changing ``Doctor.department_id``; the caller commits.
+    """
+    stat = AppointmentDailyStat
+    days = db.session.execute(db.select(stat.day).where(stat.doctor_id == doctor_id)).scalars().all()
+    db.session.execute(db.update(stat).where(stat.doctor_id == doctor_id).values(
+        department_id=db.select(Doctor.department_id).where(Doctor.id == doctor_id).scalar_subquery()))
+    _resum_departments(sorted(days))
+
+
+def refresh(full=False):
+    """Fold appointments changed since the last refresh into the rollups and commit.
+
+    Returns the number of (day, doctor) rows recomputed, or None after a full rebuild.
+    """
+    mark = db.session.get(ReportWatermark, WATERMARK)
+    if mark is None:
+        mark = ReportWatermark(name=WATERMARK)
+        db.session.add(mark)
+    # The refresh's own start rather than max(updated_at), so rows stamped ahead of the clock
+    # cannot move the watermark past changes made in the meantime
+    started = datetime.utcnow()
+
+    recomputed = None
+    if full or mark.value is None:
+        db.session.execute(db.delete(AppointmentDailyStat))
+        db.session.execute(db.delete(DepartmentDailyStat))
+        _rebuild(lambda model: db.true(), db.true())
+    else:
+        # Both tiers: an appointment changed since the last refresh may have been archived since
+        keys = sorted({key for model, _ in TIERS for key in db.session.execute(
+            db.select(model.appointment_date, model.doctor_id).distinct()
+            .where(model.updated_at > mark.value - OVERLAP)
+        ).tuples()})
+        recomputed = len(keys)
+        for start in range(0, len(keys), CHUNK_SIZE):
+            chunk = keys[start:start + CHUNK_SIZE]
+            db.session.execute(db.delete(AppointmentDailyStat).where(
+                tuple_(AppointmentDailyStat.day, AppointmentDailyStat.doctor_id).in_(chunk)))
+            db.session.execute(insert(AppointmentDailyStat).from_select(
+                ['day', 'doctor_id', 'department_id', *COUNTS],
+                _doctor_rows(lambda model: tuple_(model.appointment_date, model.doctor_id).in_(chunk))))
+        _resum_departments(sorted({day for day, _ in keys}))
+
+    mark.value = started
+    mark.refreshed_at = datetime.utcnow()
+    db.session.commit()
+    return recomputed
+
+
+def refresh_if_stale():
+    """Refresh when the last refresh is older than ``REPORTS_MAX_AGE`` seconds"""
+    max_age = timedelta(seconds=current_app.config['REPORTS_MAX_AGE'])
+    mark = db.session.get(ReportWatermark, WATERMARK)
+    if mark is not None and mark.refreshed_at is not None and datetime.utcnow() - mark.refreshed_at <= max_age:
+        return
+    try:
+        refresh()
+    except IntegrityError:
+        # A concurrent refresh wrote the same rows; its result is just as current
+        db.session.rollback()
+
+
+def parse_range(args):
+    """``(start, end, department_id)`` from ``from``, ``to`` and ``department`` query arguments.
+
+    Raises ValueError for malformed dates or a range longer than :data:`MAX_RANGE_DAYS`.
+    """
+    try:
+        end = date.fromisoformat(args['to']) if args.get('to') else date.today()
+        start = (date.fromisoformat(args['from']) if args.get('from')
+                 else end - timedelta(days=DEFAULT_RANGE_DAYS - 1))
+    except ValueError:
+        raise ValueError('dates must be YYYY-MM-DD')
+    if start > end:
+        raise ValueError('from must not be after to')
+    if (end - start).days >= MAX_RANGE_DAYS:
+        raise ValueError(f'ranges are limited to {MAX_RANGE_DAYS} days')
+    return start, end, args.get('department', type=int)
+
+
+def _summary(booked, completed, cancelled, no_shows, due, lead_days):
+    return {
+        'booked': booked,
+        'completed': completed,
+        'cancelled': cancelled,
+        'no_shows': no_shows,
+        # Share of past appointments that were neither completed nor cancelled
+        'no_show_rate': round(no_shows / due, 4) if due else None,
+        'avg_lead_days': round(lead_days / booked, 1) if booked else None,
+    }
+
+
+def report(start, end, department_id=None, top_doctors=10):
+    """Totals, a row per day, per department and for the busiest doctors between two dates (inclusive)"""
+    today = date.today()
+
+    department_rows = db.session.execute(
+        db.select(DepartmentDailyStat, Department.name)
+        .join(Department, Department.id == DepartmentDailyStat.department_id, isouter=True)
+        .where(DepartmentDailyStat.day >= start, DepartmentDailyStat.day <= end,
+               *([DepartmentDailyStat.department_id == department_id] if department_id else []))
+    ).all()
+
+    fields = ('booked', 'completed', 'cancelled', 'no_shows', 'due', 'lead_days')
+    totals = dict.fromkeys(fields, 0)
+    days = {start + timedelta(days=i): dict.fromkeys(fields, 0) for i in range((end - start).days + 1)}
+    departments = {}
+    for stat, name in department_rows:
+        past = stat.day < today
+        values = {'booked': stat.booked, 'completed': stat.completed, 'cancelled': stat.cancelled,
+                  'no_shows': stat.pending if past else 0, 'due': stat.booked - stat.cancelled if past else 0,
+                  'lead_days': stat.lead_days}
+        department = departments.setdefault(stat.department_id, dict(dict.fromkeys(fields, 0), name=name))
+        for field, value in values.items():
+            totals[field] += value
+            days[stat.day][field] += value
+            department[field] += value
+
+    stat = AppointmentDailyStat
+    past = stat.day < today
+    booked = func.sum(stat.booked)
+    doctor_rows = db.session.execute(
+        db.select(stat.doctor_id, Doctor.full_name, booked, func.sum(stat.completed), func.sum(stat.cancelled),
+                  func.sum(case((past, stat.pending), else_=0)),
+                  func.sum(case((past, stat.booked - stat.cancelled), else_=0)),
+                  func.sum(stat.lead_days))
+        .join(Doctor, Doctor.id == stat.doctor_id, isouter=True)
+        .where(stat.day >= start, stat.day <= end,
+               *([stat.department_id == department_id] if department_id else []))
+        .group_by(stat.doctor_id, Doctor.full_name)
+        .order_by(booked.desc(), stat.doctor_id)
+        .limit(top_doctors)
+    ).all()
+
+    mark = db.session.get(ReportWatermark, WATERMARK)
+    return {
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'department_id': department_id,
+        'refreshed_at': mark.refreshed_at.isoformat() if mark and mark.refreshed_at else None,
+        'totals': _summary(*(totals[field] for field in fields)),
+        'days': [dict(_summary(*(values[field] for field in fields)), date=day.isoformat())
+                 for day, values in days.items()],
+        'departments': sorted(
+            (dict(_summary(*(values[field] for field in fields)), id=department_id, name=values['name'])
+             for department_id, values in departments.items()),
+            key=lambda row: -row['booked']),
+        'doctors': [dict(_summary(*(int(value or 0) for value in counts)), id=doctor_id, name=name)
+                    for doctor_id, name, *counts in doctor_rows],
+    }
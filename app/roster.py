@@ -0,0 +1,121 @@
+"""Per-doctor patient roster, maintained alongside appointments.
+
+The doctor dashboard lists the doctor's patients with the date of their
+last completed visit and the number of visits. Deriving that from
+``appointments`` on every view costs time proportional to the doctor's
+whole history; ``doctor_patients`` keeps one row per doctor and patient
+instead. Write paths that add an appointment or change its status call
+:func:`refresh` for the affected pairs in the same transaction, which
+recounts only those pairs' appointments, archived ones included.
+``flask rebuild-roster`` recomputes every row and is meant for after bulk
+loads or manual SQL.
+"""
+from sqlalchemy import and_, case, exists, insert, tuple_, union_all
+from sqlalchemy.exc import IntegrityError
+from app.models import db, DoctorPatient
+from app.archive import TIERS
+
+# Keyset order of a doctor's roster: most recent appointment first, then by patient
+ORDER = [DoctorPatient.last_appointment_date, DoctorPatient.patient_id]
+
+# Pairs per statement, well below SQLite's bound parameter limit
+CHUNK_SIZE = 400
+
+# Columns computed from appointments
+COLUMNS = ['last_appointment_date', 'last_visit_date', 'visit_count']
+
+
+def _aggregates(model):
+    """Roster columns over the appointments of one tier (see app.archive)"""
+    completed = model.status == 'Completed'
+    return {
+        'last_appointment_date': db.func.max(model.appointment_date),
+        'last_visit_date': db.func.max(case((completed, model.appointment_date))),
+        'visit_count': db.func.count(case((completed, model.id))),
+    }
+
+
+def _later(first, second):
+    """The later of two dates, either of which may be NULL"""
+    if db.engine.dialect.name == 'sqlite':
+        # SQLite's two-argument max() is NULL if either argument is
+        return db.func.coalesce(db.func.max(first, second), first, second)
+    return db.func.greatest(first, second)
+
+
+def _grouped(where):
+    """``(doctor_id, patient_id, aggregates...)`` over both tiers, for the appointments matching ``where(model)``"""
+    tiers = union_all(*(
+        db.select(model.doctor_id, model.patient_id,
+                  *(aggregate.label(name) for name, aggregate in _aggregates(model).items()))
+        .where(where(model))
+        .group_by(model.doctor_id, model.patient_id)
+        for model, _ in TIERS
+    )).subquery()
+    return (db.select(tiers.c.doctor_id, tiers.c.patient_id, db.func.max(tiers.c.last_appointment_date),
+                      db.func.max(tiers.c.last_visit_date), db.func.sum(tiers.c.visit_count))
+            .group_by(tiers.c.doctor_id, tiers.c.patient_id))
+
+
+def _update(pairs):
+    def per_tier(name):
+        return [db.select(_aggregates(model)[name])
+                .where(model.doctor_id == DoctorPatient.doctor_id, model.patient_id == DoctorPatient.patient_id)
+                .scalar_subquery()
+                for model, _ in TIERS]
+
+    hot, archived = per_tier('visit_count')
+    values = {'last_appointment_date': _later(*per_tier('last_appointment_date')),
+              'last_visit_date': _later(*per_tier('last_visit_date')),
+              'visit_count': hot + archived}
+    return db.session.execute(
+        db.update(DoctorPatient)
+        .where(tuple_(DoctorPatient.doctor_id, DoctorPatient.patient_id).in_(pairs))
+        .values(values)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+
+def _insert_missing(pairs):
+    def where(model):
+        missing = ~exists().where(DoctorPatient.doctor_id == model.doctor_id,
+                                  DoctorPatient.patient_id == model.patient_id)
+        return and_(tuple_(model.doctor_id, model.patient_id).in_(pairs), missing)
+
+    db.session.execute(insert(DoctorPatient).from_select(
+        ['doctor_id', 'patient_id', *COLUMNS], _grouped(where)))
+
+
+def refresh(pairs):
+    """Recompute the roster rows of ``(doctor_id, patient_id)`` pairs as part of the current transaction.
+
+    Call after adding appointments or changing their status; the caller commits.
+    """
+    pairs = sorted(set(pairs))
+    db.session.flush()
+    for start in range(0, len(pairs), CHUNK_SIZE):
+        chunk = pairs[start:start + CHUNK_SIZE]
+        if _update(chunk) == len(chunk):
+            continue
+        try:
+            with db.session.begin_nested():
+                _insert_missing(chunk)
+        except IntegrityError:
+            # Another request added one of the pairs first, without our appointments
+            _update(chunk)
+            _insert_missing(chunk)
+
+
+def page_query(doctor_id):
+    """The doctor's roster rows with their patients, to paginate by :data:`ORDER`"""
+    return DoctorPatient.query.filter(DoctorPatient.doctor_id == doctor_id).options(
+        db.joinedload(DoctorPatient.patient))
+
+
+def rebuild():
+    """Recompute the whole roster from hot and archived appointments; returns the number of rows"""
+    db.session.execute(db.delete(DoctorPatient))
+    db.session.execute(insert(DoctorPatient).from_select(
+        ['doctor_id', 'patient_id', *COLUMNS], _grouped(lambda model: db.true())))
+    db.session.commit()
+    return db.session.query(db.func.count()).select_from(DoctorPatient).scalar()
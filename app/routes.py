@@ -1,8 +1,23 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import (Blueprint, Response, render_template, redirect, url_for, flash, request, current_app, abort,
+                   stream_with_context)
 from flask_login import login_user, logout_user, login_required, current_user
-from app.models import db, User, Patient, Doctor, Department, Appointment, Treatment, DoctorAvailability
+from app.models import db, User, Patient, Doctor, Department, Appointment, DoctorPatient, Treatment
+from app.queries import (appointment_listing, patient_appointments, doctor_appointments, doctor_listing,
+                         prescription, appointment_filters, doctor_filters)
+from app.pagination import keyset_paginate
+from app import archive, jobs, prescriptions, reports, roster, schedules, stats, serializers, timeline
+from app.archive import TIERS
+from app.exports import stream_export, FORMATS
+from app.importer import import_records, format_for, KINDS as IMPORT_KINDS
+from app.slots import free_slots, is_bookable
+from app.search import search_doctors, search_patients
+from app.profiles import current_doctor, current_patient
+from app.fragments import Deferred
+from app.http_cache import conditional, latest
 from datetime import datetime, timedelta, date, time
+import codecs
 from functools import wraps
+from sqlalchemy.exc import IntegrityError
 
 # Create blueprints
 auth_bp = Blueprint('auth', __name__)
@@ -16,6 +31,9 @@ def register_blueprints(app):
     app.register_blueprint(doctor_bp)
     app.register_blueprint(patient_bp)
 
+    from app.api import api_bp
+    app.register_blueprint(api_bp)
+
 # Role-based access control decorators
 def admin_required(f):
     @wraps(f)
@@ -74,6 +92,8 @@ def login():
                 return redirect(url_for('auth.login'))
             
             login_user(user)
+            if db.session.is_modified(user):
+                db.session.commit()  # password re-hashed with the current parameters
             flash(f'Welcome back, {user.username}!', 'success')
             
             if user.role == 'admin':
@@ -131,6 +151,7 @@ def register():
             emergency_contact=emergency_contact
         )
         db.session.add(patient)
+        stats.increment(stats.PATIENTS)
         db.session.commit()
         
         flash('Registration successful! Please login.', 'success')
@@ -151,20 +172,28 @@ def logout():
 @login_required
 @admin_required
 def dashboard():
-    total_doctors = Doctor.query.count()
-    total_patients = Patient.query.count()
-    total_appointments = Appointment.query.count()
-    today_appointments = Appointment.query.filter_by(appointment_date=date.today()).count()
-
-    recent_appointments = Appointment.query.order_by(Appointment.created_at.desc()).limit(10).all()
-
-    return render_template('admin/dashboard.html',
-                         total_doctors=total_doctors,
-                         total_patients=total_patients,
-                         total_appointments=total_appointments,
-                         today_appointments=today_appointments,
-                         recent_appointments=recent_appointments,
-                         current_date=datetime.now())
+    # Precomputed counters, see app/stats.py
+    today_key = stats.appointments_on(date.today())
+    counts = stats.read([stats.DOCTORS, stats.PATIENTS, stats.APPOINTMENTS, today_key])
+    total_doctors = counts[stats.DOCTORS]
+    total_patients = counts[stats.PATIENTS]
+    total_appointments = counts[stats.APPOINTMENTS]
+    today_appointments = counts[today_key]
+
+    recent_appointments = appointment_listing().order_by(Appointment.created_at.desc()).limit(10).all()
+
+    def render():
+        return render_template('admin/dashboard.html',
+                             total_doctors=total_doctors,
+                             total_patients=total_patients,
+                             total_appointments=total_appointments,
+                             today_appointments=today_appointments,
+                             recent_appointments=recent_appointments,
+                             current_date=datetime.now())
+
+    # The counters and the rows shown are already loaded; only rendering is skipped on a match
+    return conditional(render, counts, [(apt.id, apt.updated_at, apt.patient.updated_at, apt.doctor.updated_at,
+                                         apt.doctor.department.updated_at) for apt in recent_appointments])
 
 @admin_bp.route('/departments')
 @login_required
@@ -230,15 +259,15 @@ def delete_department(dept_id):
 @admin_required
 def doctors():
     search_query = request.args.get('search', '')
+    query = doctor_listing()
     if search_query:
-        doctors = Doctor.query.filter(
-            (Doctor.full_name.ilike(f'%{search_query}%')) |
-            (Doctor.specialization.ilike(f'%{search_query}%'))
-        ).all()
-    else:
-        doctors = Doctor.query.all()
-    
-    return render_template('admin/doctors.html', doctors=doctors, search_query=search_query)
+        query = search_doctors(query, search_query)
+
+    page = keyset_paginate(query, [Doctor.id],
+                           cursor=request.args.get('cursor'),
+                           per_page=current_app.config['ITEMS_PER_PAGE'])
+
+    return render_template('admin/doctors.html', doctors=page.items, page=page, search_query=search_query)
 
 @admin_bp.route('/doctors/add', methods=['GET', 'POST'])
 @login_required
@@ -281,6 +310,7 @@ def add_doctor():
             experience_years=int(experience_years) if experience_years else 0
         )
         db.session.add(doctor)
+        stats.increment(stats.DOCTORS)
         db.session.commit()
         
         flash('Doctor added successfully!', 'success')
@@ -296,12 +326,17 @@ def edit_doctor(doctor_id):
     doctor = Doctor.query.get_or_404(doctor_id)
     
     if request.method == 'POST':
+        department_id = request.form.get('department_id', type=int)
+        moved = department_id != doctor.department_id
         doctor.full_name = request.form.get('full_name')
-        doctor.department_id = request.form.get('department_id')
+        doctor.department_id = department_id
         doctor.specialization = request.form.get('specialization')
         doctor.phone = request.form.get('phone')
         doctor.qualification = request.form.get('qualification')
         doctor.experience_years = int(request.form.get('experience_years', 0))
+        if moved:
+            # Rollup rows are tagged with the doctor's department
+            reports.reassign_doctor(doctor.id)
         
         db.session.commit()
         flash('Doctor updated successfully!', 'success')
@@ -319,6 +354,7 @@ def delete_doctor(doctor_id):
     
     db.session.delete(doctor)
     db.session.delete(user)
+    stats.increment(stats.DOCTORS, -1)
     db.session.commit()
     
     flash('Doctor deleted successfully!', 'success')
@@ -329,17 +365,16 @@ def delete_doctor(doctor_id):
 @admin_required
 def patients():
     search_query = request.args.get('search', '')
+    query = Patient.query
     if search_query:
         # Search by name, ID, or phone
-        patients = Patient.query.filter(
-            (Patient.full_name.ilike(f'%{search_query}%')) |
-            (Patient.phone.ilike(f'%{search_query}%')) |
-            (Patient.id == int(search_query) if search_query.isdigit() else False)
-        ).all()
-    else:
-        patients = Patient.query.all()
+        query = search_patients(query, search_query)
+
+    page = keyset_paginate(query, [Patient.id],
+                           cursor=request.args.get('cursor'),
+                           per_page=current_app.config['ITEMS_PER_PAGE'])
 
-    return render_template('admin/patients.html', patients=patients, search_query=search_query)
+    return render_template('admin/patients.html', patients=page.items, page=page, search_query=search_query)
 
 @admin_bp.route('/patients/edit/<int:patient_id>', methods=['GET', 'POST'])
 @login_required
@@ -369,6 +404,7 @@ def delete_patient(patient_id):
     
     db.session.delete(patient)
     db.session.delete(user)
+    stats.increment(stats.PATIENTS, -1)
     db.session.commit()
     
     flash('Patient deleted successfully!', 'success')
@@ -383,43 +419,130 @@ def appointments():
     status_filter = request.args.get('status', '')
     date_from = request.args.get('date_from', '')
 
-    # Base query
-    query = Appointment.query
+    # Base query with search, status and date filters
+    query = appointment_filters(appointment_listing(), search_query, status_filter, date_from)
 
-    # Apply search filter
-    if search_query:
-        query = query.join(Patient).join(Doctor).filter(
-            (Patient.full_name.ilike(f'%{search_query}%')) |
-            (Doctor.full_name.ilike(f'%{search_query}%'))
-        )
-
-    # Apply status filter
-    if status_filter:
-        query = query.filter(Appointment.status == status_filter)
-
-    # Apply date filter
-    if date_from:
-        try:
-            from_date = datetime.strptime(date_from, '%Y-%m-%d').date()
-            query = query.filter(Appointment.appointment_date >= from_date)
-        except ValueError:
-            pass
-
-    # Get appointments
-    appointments = query.order_by(Appointment.appointment_date.desc(), Appointment.appointment_time.desc()).all()
+    # Get one page of appointments, newest first
+    page = keyset_paginate(query,
+                           [Appointment.appointment_date, Appointment.appointment_time, Appointment.id],
+                           cursor=request.args.get('cursor'),
+                           per_page=current_app.config['ITEMS_PER_PAGE'],
+                           descending=True)
 
     return render_template('admin/appointments.html',
-                         appointments=appointments,
+                         appointments=page.items,
+                         page=page,
                          search_query=search_query,
                          status_filter=status_filter,
                          date_from=date_from)
 
+@admin_bp.route('/export/<dataset>')
+@login_required
+@admin_required
+def export(dataset):
+    """Stream appointments, patients or treatments as CSV or NDJSON, honoring the list filters"""
+    fmt = request.args.get('format', 'csv')
+    if fmt not in FORMATS:
+        abort(400)
+    search_query = request.args.get('search', '')
+
+    if dataset == 'appointments':
+        # Newest first: the hot tier, then the archive
+        query = []
+        for archived, (model, _) in enumerate(TIERS):
+            tier = appointment_filters(serializers.appointments_query(archived=archived),
+                                       search_query, request.args.get('status', ''),
+                                       request.args.get('date_from', ''), model=model)
+            query.append(tier.order_by(model.appointment_date.desc(), model.appointment_time.desc(),
+                                       model.id.desc()))
+        serializer = serializers.appointment
+    elif dataset == 'patients':
+        query = serializers.patients_query()
+        if search_query:
+            query = search_patients(query, search_query)
+        query = query.order_by(Patient.id)
+        serializer = serializers.patient
+    elif dataset == 'treatments':
+        # By id: the archive, which holds the older treatments, then the hot tier
+        query = []
+        for archived, (model, treatment_model) in reversed(list(enumerate(TIERS))):
+            tier = appointment_filters(serializers.treatments_query(archived=archived),
+                                       search_query, date_from=request.args.get('date_from', ''), model=model)
+            query.append(tier.order_by(treatment_model.id))
+        serializer = serializers.treatment
+    else:
+        abort(404)
+
+    return stream_export(query, serializer, dataset, fmt)
+
+@admin_bp.route('/export/prescriptions.zip')
+@login_required
+@admin_required
+def export_prescriptions():
+    """Stream the prescriptions of completed visits as PDFs in a ZIP; ``from``, ``to``, ``doctor``, ``patient`` filter"""
+    try:
+        filters = prescriptions.parse_filters(request.args)
+    except ValueError as e:
+        flash(f'Invalid filter: {e}', 'danger')
+        return redirect(url_for('admin.appointments'))
+    export = prescriptions.BatchExport(**filters)
+    return Response(stream_with_context(export.chunks()), mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename="{export.filename()}"'})
+
+@admin_bp.route('/import', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def import_data():
+    report = None
+    if request.method == 'POST':
+        kind = request.form.get('kind')
+        upload = request.files.get('file')
+        if kind not in IMPORT_KINDS or not upload or not upload.filename:
+            flash('Choose what to import and a CSV or JSONL file.', 'danger')
+            return redirect(url_for('admin.import_data'))
+
+        lines = codecs.iterdecode(upload.stream, 'utf-8-sig')
+        report = import_records(lines, kind, format_for(upload.filename))
+        flash(report.summary(), 'success' if not report.errors else 'warning')
+
+    return render_template('admin/import.html', report=report, kinds=IMPORT_KINDS)
+
+@admin_bp.route('/performance')
+@login_required
+@admin_required
+def performance():
+    # Filled by app/profiling.py when INSTRUMENTATION is on
+    endpoints = current_app.extensions.get('instrumentation')
+    fragments = current_app.extensions.get('fragment_cache')
+    return render_template('admin/performance.html',
+                           rows=endpoints.summary() if endpoints else None,
+                           fragments=fragments.summary() if fragments else None,
+                           window=current_app.config['INSTRUMENTATION_WINDOW'],
+                           slow_query_ms=current_app.config['SLOW_QUERY_MS'])
+
+@admin_bp.route('/analytics')
+@login_required
+@admin_required
+def analytics():
+    # Reads the rollups in app/reports.py only, never the appointments table
+    try:
+        start, end, department_id = reports.parse_range(request.args)
+    except ValueError as e:
+        flash(f'Invalid range: {e}', 'danger')
+        return redirect(url_for('admin.analytics'))
+    reports.refresh_if_stale()
+    return render_template('admin/analytics.html',
+                           report=reports.report(start, end, department_id),
+                           departments=Department.query.order_by(Department.name).all())
+
 @admin_bp.route('/appointments/<int:appointment_id>/cancel')
 @login_required
 @admin_required
 def cancel_appointment(appointment_id):
     appointment = Appointment.query.get_or_404(appointment_id)
     appointment.status = 'Cancelled'
+    roster.refresh([(appointment.doctor_id, appointment.patient_id)])
+    jobs.enqueue('notify_appointments', {'appointment_id': appointment.id, 'event': 'cancelled'})
     db.session.commit()
     flash('Appointment cancelled successfully!', 'success')
     return redirect(url_for('admin.appointments'))
@@ -430,44 +553,63 @@ def cancel_appointment(appointment_id):
 @login_required
 @doctor_required
 def dashboard():
-    doctor = Doctor.query.filter_by(user_id=current_user.id).first()
-    
-    # Get today's appointments
-    today = date.today()
-    today_appointments = Appointment.query.filter_by(
-        doctor_id=doctor.id,
-        appointment_date=today
-    ).all()
-    
-    # Get week's appointments
-    week_end = today + timedelta(days=7)
-    week_appointments = Appointment.query.filter(
-        Appointment.doctor_id == doctor.id,
-        Appointment.appointment_date >= today,
-        Appointment.appointment_date <= week_end
-    ).order_by(Appointment.appointment_date).all()
-    
-    # Get all patients assigned
-    patient_ids = [apt.patient_id for apt in Appointment.query.filter_by(doctor_id=doctor.id).all()]
-    patients = Patient.query.filter(Patient.id.in_(patient_ids)).all() if patient_ids else []
+    doctor = current_doctor()
     
-    return render_template('doctor/dashboard.html',
-                         doctor=doctor,
-                         today_appointments=today_appointments,
-                         week_appointments=week_appointments,
-                         patients=patients)
+    def render():
+        # Get today's appointments
+        today = date.today()
+        today_appointments = doctor_appointments().filter_by(
+            doctor_id=doctor.id,
+            appointment_date=today
+        ).all()
+        
+        # Get week's appointments
+        week_end = today + timedelta(days=7)
+        week_appointments = doctor_appointments().filter(
+            Appointment.doctor_id == doctor.id,
+            Appointment.appointment_date >= today,
+            Appointment.appointment_date <= week_end
+        ).order_by(Appointment.appointment_date).all()
+        
+        # One page of the doctor's patients, most recently seen first
+        patients = keyset_paginate(roster.page_query(doctor.id), roster.ORDER,
+                                   cursor=request.args.get('cursor'),
+                                   per_page=current_app.config['ITEMS_PER_PAGE'],
+                                   descending=True)
+        
+        return render_template('doctor/dashboard.html',
+                             doctor=doctor,
+                             today_appointments=today_appointments,
+                             week_appointments=week_appointments,
+                             patients=patients)
+    
+    # Changes to the doctor's appointments or to the details of the patients on their roster
+    version = latest(
+        db.select(db.func.max(Appointment.updated_at)).where(Appointment.doctor_id == doctor.id),
+        db.select(db.func.count(Appointment.id)).where(Appointment.doctor_id == doctor.id),
+        db.select(db.func.max(Patient.updated_at))
+        .join(DoctorPatient, DoctorPatient.patient_id == Patient.id)
+        .where(DoctorPatient.doctor_id == doctor.id),
+    )
+    return conditional(render, doctor.updated_at, version)
 
 @doctor_bp.route('/appointments/<int:appointment_id>/complete', methods=['GET', 'POST'])
 @login_required
 @doctor_required
 def complete_appointment(appointment_id):
     appointment = Appointment.query.get_or_404(appointment_id)
-    doctor = Doctor.query.filter_by(user_id=current_user.id).first()
+    doctor = current_doctor()
     
     if appointment.doctor_id != doctor.id:
         flash('Unauthorized access', 'danger')
         return redirect(url_for('doctor.dashboard'))
     
+    # Only booked appointments can be completed; a stale form may point at one already completed or
+    # cancelled, and a cancelled one's slot may have been booked again since
+    if appointment.status != 'Booked':
+        flash(f'This appointment is already {appointment.status.lower()}.', 'warning')
+        return redirect(url_for('doctor.dashboard'))
+    
     if request.method == 'POST':
         diagnosis = request.form.get('diagnosis')
         prescription = request.form.get('prescription')
@@ -475,6 +617,7 @@ def complete_appointment(appointment_id):
         
         # Update appointment status
         appointment.status = 'Completed'
+        appointment.updated_at = datetime.utcnow()
         
         # Create or update treatment
         if appointment.treatment:
@@ -490,16 +633,21 @@ def complete_appointment(appointment_id):
             )
             db.session.add(treatment)
         
-        db.session.commit()
+        try:
+            roster.refresh([(appointment.doctor_id, appointment.patient_id)])
+            # The prescription PDF is rendered by the job worker, ready for exports
+            jobs.enqueue('prerender_prescriptions', {'appointment_id': appointment.id})
+            db.session.commit()
+        except IntegrityError:
+            # Another request changed the appointment, or took its slot, in between
+            db.session.rollback()
+            flash('This appointment was changed by someone else. Please try again.', 'danger')
+            return redirect(url_for('doctor.dashboard'))
         flash('Appointment marked as completed!', 'success')
         return redirect(url_for('doctor.dashboard'))
     
-    # Fetch patient history (completed appointments, excluding current)
-    history = Appointment.query.filter(
-        Appointment.patient_id == appointment.patient_id,
-        Appointment.status == 'Completed',
-        Appointment.id != appointment.id
-    ).order_by(Appointment.appointment_date.desc()).all()
+    # Latest completed visits of the patient, excluding this one; the full timeline is a link away
+    history = timeline.visits(appointment.patient_id, exclude_id=appointment.id)
     
     return render_template('doctor/complete_appointment.html', appointment=appointment, history=history)
 
@@ -508,13 +656,15 @@ def complete_appointment(appointment_id):
 @doctor_required
 def cancel_appointment(appointment_id):
     appointment = Appointment.query.get_or_404(appointment_id)
-    doctor = Doctor.query.filter_by(user_id=current_user.id).first()
+    doctor = current_doctor()
     
     if appointment.doctor_id != doctor.id:
         flash('Unauthorized access', 'danger')
         return redirect(url_for('doctor.dashboard'))
     
     appointment.status = 'Cancelled'
+    roster.refresh([(appointment.doctor_id, appointment.patient_id)])
+    jobs.enqueue('notify_appointments', {'appointment_id': appointment.id, 'event': 'cancelled'})
     db.session.commit()
     
     flash('Appointment cancelled!', 'info')
@@ -524,74 +674,66 @@ def cancel_appointment(appointment_id):
 @login_required
 @doctor_required
 def patient_history(patient_id):
-    doctor = Doctor.query.filter_by(user_id=current_user.id).first()
-    patient = Patient.query.get_or_404(patient_id)
+    # Completed visits of this patient (visible to any doctor), newest first a page at a time
+    page = timeline.visits(patient_id, cursor=request.args.get('cursor'))
+    if request.args.get('partial'):
+        # Older visits appended by the timeline as the doctor scrolls
+        return render_template('doctor/_timeline_page.html', patient_id=patient_id, page=page)
     
-    # Get all appointments for this patient (visible to any doctor)
-    appointments = Appointment.query.filter_by(
-        patient_id=patient_id,
-        status='Completed'
-    ).order_by(Appointment.appointment_date.desc()).all()
-    
-    return render_template('doctor/patient_history.html', patient=patient, appointments=appointments)
+    patient = Patient.query.get_or_404(patient_id)
+    return render_template('doctor/patient_history.html', patient=patient, page=page,
+                           summary=timeline.summary(patient_id))
 
 @doctor_bp.route('/availability', methods=['GET', 'POST'])
 @login_required
 @doctor_required
 def availability():
-    doctor = Doctor.query.filter_by(user_id=current_user.id).first()
+    doctor = current_doctor()
+    today = date.today()
+    date_list = [today + timedelta(days=i) for i in range(schedules.EDITABLE_DAYS)]
     
     if request.method == 'POST':
-        # Delete existing availability for next 7 days
-        today = date.today()
-        week_end = today + timedelta(days=7)
-        DoctorAvailability.query.filter(
-            DoctorAvailability.doctor_id == doctor.id,
-            DoctorAvailability.date >= today,
-            DoctorAvailability.date <= week_end
-        ).delete()
-        
-        # Add new availability
-        for i in range(7):
-            availability_date = today + timedelta(days=i)
-            is_available = request.form.get(f'available_{i}') == 'on'
-            
-            if is_available:
-                start_time_str = request.form.get(f'start_time_{i}', '09:00')
-                end_time_str = request.form.get(f'end_time_{i}', '17:00')
-                
-                availability = DoctorAvailability(
-                    doctor_id=doctor.id,
-                    date=availability_date,
-                    start_time=datetime.strptime(start_time_str, '%H:%M').time(),
-                    end_time=datetime.strptime(end_time_str, '%H:%M').time(),
-                    is_available=True
-                )
-                db.session.add(availability)
+        def posted_hours(suffix):
+            available = request.form.get(f'available_{suffix}') == 'on'
+            start = datetime.strptime(request.form.get(f'start_time_{suffix}', '09:00'), '%H:%M').time()
+            end = datetime.strptime(request.form.get(f'end_time_{suffix}', '17:00'), '%H:%M').time()
+            if available and start >= end:
+                raise ValueError('End time must be after start time')
+            return available, start, end
         
+        try:
+            if request.form.get('section') == 'weekly':
+                pattern = {}
+                for weekday, name in enumerate(schedules.WEEKDAYS):
+                    available, start, end = posted_hours(name.lower())
+                    pattern[weekday] = (start, end) if available else None
+                schedules.save_weekly(doctor.id, pattern)
+            else:
+                # Only dates still on the page; a form left open overnight must not shift days
+                days = {}
+                for value in request.form.getlist('date'):
+                    day = date.fromisoformat(value)
+                    if day in date_list:
+                        days[day] = posted_hours(value)
+                schedules.save_days(doctor.id, days)
+        except ValueError as exc:
+            flash(f'Invalid hours: {exc}', 'danger')
+            return redirect(url_for('doctor.availability'))
+        
+        # Only rows that changed are written
         db.session.commit()
         flash('Availability updated successfully!', 'success')
         return redirect(url_for('doctor.dashboard'))
     
-    # Get current availability
-    today = date.today()
-    week_end = today + timedelta(days=7)
-    availabilities = DoctorAvailability.query.filter(
-        DoctorAvailability.doctor_id == doctor.id,
-        DoctorAvailability.date >= today,
-        DoctorAvailability.date <= week_end
-    ).all()
-    
-    availability_dict = {av.date: av for av in availabilities}
-
-    # Create list of dates for the next 7 days
-    date_list = [(today + timedelta(days=i)) for i in range(7)]
+    pattern, days = schedules.day_hours(doctor.id, date_list[0], date_list[-1])
+    weekly = [(name, weekday in pattern, *pattern.get(weekday, schedules.DEFAULT_HOURS))
+              for weekday, name in enumerate(schedules.WEEKDAYS)]
 
     return render_template('doctor/availability.html',
                          doctor=doctor,
-                         availability_dict=availability_dict,
-                         today=today,
-                         date_list=date_list)
+                         weekly=weekly,
+                         days=days,
+                         today=today)
 
 # ============== PATIENT ROUTES ==============
 
@@ -599,30 +741,44 @@ def availability():
 @login_required
 @patient_required
 def dashboard():
-    patient = Patient.query.filter_by(user_id=current_user.id).first()
-    
-    # Get all departments
-    departments = Department.query.all()
+    patient = current_patient()
     
-    # Get upcoming appointments
-    today = date.today()
-    upcoming_appointments = Appointment.query.filter(
-        Appointment.patient_id == patient.id,
-        Appointment.appointment_date >= today,
-        Appointment.status == 'Booked'
-    ).order_by(Appointment.appointment_date).all()
-    
-    # Get past appointments with treatments
-    past_appointments = Appointment.query.filter(
-        Appointment.patient_id == patient.id,
-        Appointment.status == 'Completed'
-    ).order_by(Appointment.appointment_date.desc()).all()
-    
-    return render_template('patient/dashboard.html',
-                         patient=patient,
-                         departments=departments,
-                         upcoming_appointments=upcoming_appointments,
-                         past_appointments=past_appointments)
+    def render():
+        # Get all departments
+        departments = Department.query.all()
+        
+        # Get upcoming appointments
+        today = date.today()
+        upcoming_appointments = patient_appointments().filter(
+            Appointment.patient_id == patient.id,
+            Appointment.appointment_date >= today,
+            Appointment.status == 'Booked'
+        ).order_by(Appointment.appointment_date).all()
+        
+        # Get past appointments with treatments, from both tiers
+        past_appointments = []
+        for model, _ in TIERS:
+            past_appointments += patient_appointments(model=model).filter(
+                model.patient_id == patient.id,
+                model.status == 'Completed'
+            ).all()
+        past_appointments.sort(key=lambda apt: apt.appointment_date, reverse=True)
+        
+        return render_template('patient/dashboard.html',
+                             patient=patient,
+                             departments=departments,
+                             upcoming_appointments=upcoming_appointments,
+                             past_appointments=past_appointments)
+    
+    # Changes to the patient's appointments, or to the doctors and departments they show
+    version = latest(
+        db.select(db.func.max(Appointment.updated_at)).where(Appointment.patient_id == patient.id),
+        db.select(db.func.count(Appointment.id)).where(Appointment.patient_id == patient.id),
+        db.select(db.func.max(Doctor.updated_at)),
+        db.select(db.func.max(Department.updated_at)),
+        db.select(db.func.count(Department.id)),
+    )
+    return conditional(render, patient.updated_at, version)
 
 @patient_bp.route('/doctors')
 @login_required
@@ -631,67 +787,54 @@ def doctors():
     search_query = request.args.get('search', '')
     department_id = request.args.get('department', '')
     
-    query = Doctor.query.join(User).filter(User.is_active == True)
-    
-    if search_query:
-        query = query.filter(
-            (Doctor.full_name.ilike(f'%{search_query}%')) |
-            (Doctor.specialization.ilike(f'%{search_query}%'))
-        )
-    
-    if department_id:
-        query = query.filter(Doctor.department_id == department_id)
+    query = doctor_listing().join(User).filter(User.is_active == True)
+    # Best matches first when searching
+    query = doctor_filters(query, search_query, department_id, ranked=True)
     
     doctors = query.all()
-    departments = Department.query.all()
     
     # Get availability for next 7 days
     today = date.today()
     week_end = today + timedelta(days=7)
-    availabilities = DoctorAvailability.query.filter(
-        DoctorAvailability.date >= today,
-        DoctorAvailability.date <= week_end,
-        DoctorAvailability.is_available == True
-    ).all()
-    
-    availability_dict = {}
-    for av in availabilities:
-        if av.doctor_id not in availability_dict:
-            availability_dict[av.doctor_id] = []
-        availability_dict[av.doctor_id].append(av)
     
+    def load_availability():
+        # Working days of the listed doctors, weekly schedules and exceptions in one query
+        windows = schedules.load([doctor.id for doctor in doctors], today, week_end)
+        return {doctor_id: sorted({window.date for window in doctor_windows})
+                for doctor_id, doctor_windows in windows.items()}
+    
+    # Only read while rendering fragments that are not cached yet, see app/fragments.py
     return render_template('patient/doctors.html',
                          doctors=doctors,
-                         departments=departments,
-                         availability_dict=availability_dict,
+                         departments=Deferred(lambda: Department.query.all()),
+                         availability_dict=Deferred(load_availability),
+                         today=today,
                          search_query=search_query,
-                         selected_department=department_id)
+                         dept_filter=department_id)
 
 @patient_bp.route('/book-appointment/<int:doctor_id>', methods=['GET', 'POST'])
 @login_required
 @patient_required
 def book_appointment(doctor_id):
-    doctor = Doctor.query.get_or_404(doctor_id)
-    patient = Patient.query.filter_by(user_id=current_user.id).first()
+    doctor = doctor_listing().filter(Doctor.id == doctor_id).first_or_404()
+    patient = current_patient()
     
     if request.method == 'POST':
-        appointment_date_str = request.form.get('appointment_date')
-        appointment_time_str = request.form.get('appointment_time')
+        # The slot picker posts "YYYY-MM-DDTHH:MM"; separate date/time fields are still accepted
+        appointment_slot = request.form.get('appointment_slot')
+        if appointment_slot:
+            appointment_date_str, _, appointment_time_str = appointment_slot.partition('T')
+        else:
+            appointment_date_str = request.form.get('appointment_date')
+            appointment_time_str = request.form.get('appointment_time')
         reason = request.form.get('reason')
         
         appointment_date = datetime.strptime(appointment_date_str, '%Y-%m-%d').date()
         appointment_time = datetime.strptime(appointment_time_str, '%H:%M').time()
         
-        # Check if slot is already booked (excluding cancelled appointments)
-        existing = Appointment.query.filter(
-            Appointment.doctor_id == doctor_id,
-            Appointment.appointment_date == appointment_date,
-            Appointment.appointment_time == appointment_time,
-            Appointment.status.in_(['Booked', 'Completed'])
-        ).first()
-
-        if existing:
-            flash('This time slot is already booked. Please choose another time.', 'danger')
+        # The slot must be inside the doctor's availability and not overlap an active booking
+        if not is_bookable(doctor_id, appointment_date, appointment_time):
+            flash('This time slot is not available. Please choose another time.', 'danger')
             return redirect(url_for('patient.book_appointment', doctor_id=doctor_id))
         
         # Create appointment
@@ -703,31 +846,38 @@ def book_appointment(doctor_id):
             reason=reason,
             status='Booked'
         )
-        db.session.add(appointment)
-        db.session.commit()
+        # uq_appointments_active_slot rejects a concurrent booking of the same slot
+        try:
+            db.session.add(appointment)
+            stats.increment(stats.APPOINTMENTS)
+            stats.increment(stats.appointments_on(appointment_date))
+            roster.refresh([(doctor_id, patient.id)])
+            # The confirmation is sent by the job worker; flush for the appointment id
+            db.session.flush()
+            jobs.enqueue('notify_appointments', {'appointment_id': appointment.id, 'event': 'booked'})
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            flash('This time slot was just booked by someone else. Please choose another time.', 'danger')
+            return redirect(url_for('patient.book_appointment', doctor_id=doctor_id))
         
         flash('Appointment booked successfully!', 'success')
         return redirect(url_for('patient.dashboard'))
     
-    # Get doctor's availability
+    # Get open slots for the next 7 days
     today = date.today()
     week_end = today + timedelta(days=7)
-    availabilities = DoctorAvailability.query.filter(
-        DoctorAvailability.doctor_id == doctor_id,
-        DoctorAvailability.date >= today,
-        DoctorAvailability.date <= week_end,
-        DoctorAvailability.is_available == True
-    ).all()
+    slots = free_slots(doctor_id, today, week_end)
     
     return render_template('patient/book_appointment.html',
                          doctor=doctor,
-                         availabilities=availabilities)
+                         slots=slots)
 
 @patient_bp.route('/appointments/<int:appointment_id>/cancel')
 @login_required
 @patient_required
 def cancel_appointment(appointment_id):
-    patient = Patient.query.filter_by(user_id=current_user.id).first()
+    patient = current_patient()
     appointment = Appointment.query.get_or_404(appointment_id)
     
     if appointment.patient_id != patient.id:
@@ -735,6 +885,8 @@ def cancel_appointment(appointment_id):
         return redirect(url_for('patient.dashboard'))
     
     appointment.status = 'Cancelled'
+    roster.refresh([(appointment.doctor_id, appointment.patient_id)])
+    jobs.enqueue('notify_appointments', {'appointment_id': appointment.id, 'event': 'cancelled'})
     db.session.commit()
     
     flash('Appointment cancelled!', 'info')
@@ -744,7 +896,7 @@ def cancel_appointment(appointment_id):
 @login_required
 @patient_required
 def profile():
-    patient = Patient.query.filter_by(user_id=current_user.id).first()
+    patient = current_patient()
     
     if request.method == 'POST':
         patient.full_name = request.form.get('full_name')
@@ -770,7 +922,9 @@ def profile():
 @auth_bp.route('/prescription/<int:appointment_id>/print')
 @login_required
 def print_prescription(appointment_id):
-    appointment = Appointment.query.get_or_404(appointment_id)
+    appointment = archive.get(appointment_id, load=lambda model: prescription(model=model))
+    if appointment is None:
+        abort(404)
     
     # Authorization Check
     is_authorized = False
@@ -778,11 +932,11 @@ def print_prescription(appointment_id):
     if current_user.role == 'admin':
         is_authorized = True
     elif current_user.role == 'doctor':
-        doctor = Doctor.query.filter_by(user_id=current_user.id).first()
+        doctor = current_doctor()
         if doctor and appointment.doctor_id == doctor.id:
             is_authorized = True
     elif current_user.role == 'patient':
-        patient = Patient.query.filter_by(user_id=current_user.id).first()
+        patient = current_patient()
         if patient and appointment.patient_id == patient.id:
             is_authorized = True
             
@@ -790,5 +944,11 @@ def print_prescription(appointment_id):
         flash('You are not authorized to view this prescription or it is not ready.', 'danger')
         return redirect(url_for('auth.index'))
     
-    return render_template('common/prescription_print.html', appointment=appointment, today=date.today())
+    # Everything the prescription prints is loaded by the query above, so a revalidation
+    # is answered from these timestamps without rendering
+    rows = (appointment, appointment.treatment, appointment.patient, appointment.doctor, appointment.doctor.department)
+    timestamps = [getattr(row, 'updated_at', None) or row.created_at for row in rows]
+    return conditional(lambda: render_template('common/prescription_print.html', appointment=appointment,
+                                               today=date.today()),
+                       appointment.id, timestamps, last_modified=max(filter(None, timestamps), default=None))
 
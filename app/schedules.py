@@ -0,0 +1,171 @@
+"""Weekly working hours with per-date exceptions, expanded on read.
+
+A doctor's hours come from two tables:
+
+* ``doctor_weekly_schedules`` holds at most one window per weekday that
+  repeats every week;
+* ``doctor_availability`` holds concrete dates. A row for a date replaces
+  the weekly window on that date, and ``is_available = False`` marks a day
+  off. Doctors without a weekly schedule only have these rows, as before.
+
+Nothing is generated ahead of time: :func:`load` reads both tables for a
+set of doctors and a date range in one ``UNION ALL`` query and expands the
+weekly pattern in Python, so bookings, open slots and the doctor listing
+work for any range. The save functions compare submitted hours with the
+stored rows and only insert, update or delete the rows that differ.
+"""
+from collections import namedtuple
+from datetime import time, timedelta
+from sqlalchemy import Date, Integer, cast, literal, null, union_all
+from app.models import db, DoctorAvailability, DoctorWeeklySchedule
+
+# Dates listed on the availability page for exceptions
+EDITABLE_DAYS = 14
+
+# Hours offered in the form for days that have none yet
+DEFAULT_HOURS = (time(9, 0), time(17, 0))
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+Window = namedtuple('Window', 'doctor_id date start_time end_time')
+# ``exception`` is True when a doctor_availability row sets the hours instead of the weekly schedule
+DayHours = namedtuple('DayHours', 'date available start_time end_time exception')
+
+
+def _rows(doctor_ids, start_date, end_date):
+    # Overrides carry a date, weekly rows a weekday; one round trip for both
+    overrides = db.select(
+        DoctorAvailability.doctor_id, DoctorAvailability.date, cast(null(), Integer).label('weekday'),
+        DoctorAvailability.start_time, DoctorAvailability.end_time, DoctorAvailability.is_available
+    ).where(
+        DoctorAvailability.doctor_id.in_(doctor_ids),
+        DoctorAvailability.date >= start_date,
+        DoctorAvailability.date <= end_date
+    )
+    weekly = db.select(
+        DoctorWeeklySchedule.doctor_id, cast(null(), Date), DoctorWeeklySchedule.weekday,
+        DoctorWeeklySchedule.start_time, DoctorWeeklySchedule.end_time, literal(True)
+    ).where(DoctorWeeklySchedule.doctor_id.in_(doctor_ids))
+    return db.session.execute(union_all(overrides, weekly)).all()
+
+
+def load(doctor_ids, start_date, end_date):
+    """Return ``{doctor_id: [Window, ...]}`` of working hours between two dates (inclusive), in date order"""
+    doctor_ids = list(doctor_ids)
+    if not doctor_ids:
+        return {}
+
+    weekly, overridden, windows = {}, set(), {}
+    for row in _rows(doctor_ids, start_date, end_date):
+        if row.date is None:
+            weekly.setdefault(row.doctor_id, {})[row.weekday] = (row.start_time, row.end_time)
+        else:
+            overridden.add((row.doctor_id, row.date))
+            if row.is_available:
+                windows.setdefault(row.doctor_id, []).append(
+                    Window(row.doctor_id, row.date, row.start_time, row.end_time))
+
+    for doctor_id, pattern in weekly.items():
+        day = start_date
+        while day <= end_date:
+            hours = pattern.get(day.weekday())
+            if hours and (doctor_id, day) not in overridden:
+                windows.setdefault(doctor_id, []).append(Window(doctor_id, day, *hours))
+            day += timedelta(days=1)
+
+    for doctor_windows in windows.values():
+        doctor_windows.sort()
+    return windows
+
+
+def day_hours(doctor_id, start_date, end_date):
+    """The weekly schedule and the hours of every date in the range, for editing.
+
+    Returns ``(pattern, days)``: ``{weekday: (start_time, end_time)}`` and a
+    list of :class:`DayHours`; days off show :data:`DEFAULT_HOURS`.
+    """
+    pattern, overrides = {}, {}
+    for row in _rows([doctor_id], start_date, end_date):
+        if row.date is None:
+            pattern[row.weekday] = (row.start_time, row.end_time)
+        else:
+            overrides.setdefault(row.date, row)
+
+    days = []
+    day = start_date
+    while day <= end_date:
+        override = overrides.get(day)
+        if override is not None:
+            days.append(DayHours(day, bool(override.is_available), override.start_time, override.end_time, True))
+        else:
+            hours = pattern.get(day.weekday())
+            days.append(DayHours(day, hours is not None, *(hours or DEFAULT_HOURS), False))
+        day += timedelta(days=1)
+    return pattern, days
+
+
+def weekly_pattern(doctor_id):
+    """``{weekday: (start_time, end_time)}`` of the doctor's weekly schedule"""
+    return {row.weekday: (row.start_time, row.end_time)
+            for row in DoctorWeeklySchedule.query.filter_by(doctor_id=doctor_id)}
+
+
+def save_weekly(doctor_id, pattern):
+    """Store ``{weekday: (start_time, end_time) or None}``; returns the number of rows changed.
+
+    The caller commits.
+    """
+    current = {row.weekday: row for row in DoctorWeeklySchedule.query.filter_by(doctor_id=doctor_id)}
+    changed = 0
+    for weekday, hours in pattern.items():
+        row = current.get(weekday)
+        if hours is None:
+            if row is not None:
+                db.session.delete(row)
+                changed += 1
+        elif row is None:
+            db.session.add(DoctorWeeklySchedule(doctor_id=doctor_id, weekday=weekday,
+                                                start_time=hours[0], end_time=hours[1]))
+            changed += 1
+        elif (row.start_time, row.end_time) != hours:
+            row.start_time, row.end_time = hours
+            changed += 1
+    return changed
+
+
+def save_days(doctor_id, days):
+    """Store ``{date: (available, start_time, end_time)}`` as exceptions to the weekly schedule.
+
+    A date whose hours match the weekly schedule keeps no row, any other date
+    keeps exactly one. Returns the number of rows changed; the caller commits.
+    """
+    if not days:
+        return 0
+    pattern = weekly_pattern(doctor_id)
+    existing = {}
+    for row in DoctorAvailability.query.filter(
+            DoctorAvailability.doctor_id == doctor_id,
+            DoctorAvailability.date.in_(list(days))).order_by(DoctorAvailability.id):
+        existing.setdefault(row.date, []).append(row)
+
+    changed = 0
+    for day, (available, start, end) in days.items():
+        rows = existing.get(day, [])
+        weekly_hours = pattern.get(day.weekday())
+        if ((start, end) == weekly_hours) if available else weekly_hours is None:
+            # The weekly schedule already says this
+            stale = rows
+        elif rows:
+            row, stale = rows[0], rows[1:]
+            if (row.is_available, row.start_time, row.end_time) != (available, start, end):
+                row.is_available, row.start_time, row.end_time = available, start, end
+                changed += 1
+        else:
+            db.session.add(DoctorAvailability(doctor_id=doctor_id, date=day, start_time=start,
+                                              end_time=end, is_available=available))
+            stale = []
+            changed += 1
+        for row in stale:
+            db.session.delete(row)
+            changed += 1
+    return changed
@@ -0,0 +1,76 @@
+from sqlalchemy import inspect, text
+from app.models import db
+
+
+def add_missing_columns(engine):
+    """Add declared columns that existing tables lack, and return their names.
+
+    ``db.create_all()`` never alters a table that already exists. Only
+    nullable columns can be added this way; existing rows get NULL.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    preparer = engine.dialect.identifier_preparer
+    added = []
+
+    with engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                if not column.nullable:
+                    raise RuntimeError(f'Cannot add NOT NULL column {table.name}.{column.name} to an existing table')
+                conn.execute(text(f'ALTER TABLE {preparer.format_table(table)} '
+                                  f'ADD COLUMN {preparer.format_column(column)} {column.type.compile(engine.dialect)}'))
+                added.append(f'{table.name}.{column.name}')
+
+    return added
+
+
+def missing_indexes(engine, unique=True):
+    """Return declared indexes that do not exist yet in the database, leaving out unique ones unless ``unique``"""
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    missing = []
+
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {ix['name'] for ix in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda ix: ix.name):
+            if index.name not in existing and (unique or not index.unique):
+                missing.append(index)
+
+    return missing
+
+
+def apply_indexes(engine, unique=True):
+    """Create declared indexes on databases built before they were added.
+
+    ``db.create_all()`` only creates indexes together with new tables, so
+    existing SQLite and Postgres databases need this pass. On Postgres the
+    indexes are built with CREATE INDEX CONCURRENTLY so that booking traffic
+    is not blocked while a large appointments table is indexed. Without
+    ``unique``, unique indexes, which existing rows may violate, are skipped.
+    """
+    created = []
+    is_postgres = engine.dialect.name == 'postgresql'
+
+    for index in missing_indexes(engine, unique):
+        if is_postgres:
+            # CONCURRENTLY cannot run inside a transaction block
+            index.dialect_kwargs['postgresql_concurrently'] = True
+            try:
+                with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                    index.create(conn, checkfirst=True)
+            finally:
+                index.dialect_kwargs['postgresql_concurrently'] = False
+        else:
+            with engine.begin() as conn:
+                index.create(conn, checkfirst=True)
+        created.append(index.name)
+
+    return created
@@ -0,0 +1,191 @@
+"""Indexed, ranked search for doctors, patients and appointments.
+
+``ILIKE '%term%'`` can never use a B-tree index, so search goes through a
+backend chosen when the app starts:
+
+* ``fts5`` (SQLite): external-content FTS5 tables ``doctors_fts`` and
+  ``patients_fts`` kept in sync with their source tables by triggers, with
+  prefix indexes for as-you-type queries and BM25 ranking.
+* ``trgm`` (Postgres): GIN ``pg_trgm`` indexes, which make the existing
+  ``ILIKE`` patterns indexable, ranked by ``word_similarity``.
+* ``like``: plain ``ILIKE`` if neither is available.
+
+``install`` runs from ``flask init-db``; other processes find the backend
+with one catalog lookup on their first search.
+
+Digit-only patient searches are an exact ID or a phone-number prefix, which
+is a range scan on the ``patients.phone`` B-tree index on every backend.
+"""
+import re
+from flask import current_app
+from sqlalchemy import text, or_, false
+from sqlalchemy.exc import DBAPIError
+from app.models import db, Doctor, Patient, Appointment
+
+# Searchable columns per source table
+FTS_TABLES = {
+    'doctors': ('full_name', 'specialization'),
+    'patients': ('full_name',),
+}
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _fts_ddl(table, columns):
+    fts = f'{table}_fts'
+    cols = ', '.join(columns)
+    new_values = ', '.join(f'new.{c}' for c in columns)
+    old_values = ', '.join(f'old.{c}' for c in columns)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({cols}, content='{table}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_values}); "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_values}); END",
+    ]
+
+
+def _install_fts5(conn):
+    existing = {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'"))}
+    for table, columns in FTS_TABLES.items():
+        fts = f'{table}_fts'
+        for statement in _fts_ddl(table, columns):
+            conn.execute(text(statement))
+        if fts not in existing:
+            # Index rows that were written before the shadow table existed
+            conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+
+
+def _install_trgm(conn):
+    conn.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+    for table, columns in FTS_TABLES.items():
+        for column in columns:
+            conn.execute(text(
+                f'CREATE INDEX IF NOT EXISTS ix_{table}_{column}_trgm ON {table} USING gin ({column} gin_trgm_ops)'
+            ))
+
+
+def install(app):
+    """Create the search structures for the app's database and record the backend in use"""
+    engine = db.engine
+    backend = 'like'
+    try:
+        with engine.begin() as conn:
+            if engine.dialect.name == 'sqlite':
+                _install_fts5(conn)
+                backend = 'fts5'
+            elif engine.dialect.name == 'postgresql':
+                _install_trgm(conn)
+                backend = 'trgm'
+    except DBAPIError as exc:
+        # e.g. SQLite built without FTS5, or no permission to create pg_trgm
+        app.logger.warning('Search indexes unavailable, falling back to ILIKE: %s', exc.orig)
+        backend = 'like'
+    app.extensions['search_backend'] = backend
+    return backend
+
+
+def rebuild(app):
+    """Re-index every row (SQLite only; Postgres indexes need no rebuild)"""
+    if (app.extensions.get('search_backend') or detect(app)) == 'fts5':
+        with db.engine.begin() as conn:
+            for table in FTS_TABLES:
+                conn.execute(text(f"INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')"))
+
+
+def detect(app):
+    """Find which backend ``install`` set up, without running any DDL"""
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        found = db.session.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'doctors_fts'")).first()
+        backend = 'fts5' if found else 'like'
+    elif dialect == 'postgresql':
+        found = db.session.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first()
+        backend = 'trgm' if found else 'like'
+    else:
+        backend = 'like'
+    app.extensions['search_backend'] = backend
+    return backend
+
+
+def _backend():
+    backend = current_app.extensions.get('search_backend')
+    return backend if backend is not None else detect(current_app)
+
+
+def _fts_query(term):
+    """Turn user input into an FTS5 query: every word must match as a prefix"""
+    tokens = _TOKEN_RE.findall(term)
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def _fts_matches(table, term):
+    """Subquery of ``(id, rank)`` for rows of ``table`` matching ``term``; lower rank is better"""
+    fts = f'{table}_fts'
+    return (
+        db.select(db.literal_column('rowid').label('id'), db.literal_column(f'bm25({fts})').label('rank'))
+        .select_from(db.table(fts))
+        .where(text(f'{fts} MATCH :match').bindparams(match=_fts_query(term)))
+        .subquery()
+    )
+
+
+def _like(columns, term):
+    return or_(*(column.ilike(f'%{term}%') for column in columns))
+
+
+def search_doctors(query, term, ranked=False):
+    """Filter a Doctor query by ``term``; ``ranked`` orders the best matches first"""
+    backend = _backend()
+    if backend == 'fts5':
+        if not _fts_query(term):
+            return query.filter(false())
+        matches = _fts_matches('doctors', term)
+        query = query.join(matches, matches.c.id == Doctor.id)
+        return query.order_by(matches.c.rank) if ranked else query
+
+    query = query.filter(_like([Doctor.full_name, Doctor.specialization], term))
+    if ranked and backend == 'trgm':
+        score = db.func.greatest(db.func.word_similarity(term, Doctor.full_name),
+                                 db.func.word_similarity(term, Doctor.specialization))
+        query = query.order_by(score.desc())
+    return query
+
+
+def _phone_prefix(term):
+    """``phone LIKE 'term%'`` as a range so that it uses the B-tree index"""
+    upper = term[:-1] + chr(ord(term[-1]) + 1)
+    return (Patient.phone >= term) & (Patient.phone < upper)
+
+
+def _patient_condition(term):
+    if term.isdigit():
+        return or_(Patient.id == int(term), _phone_prefix(term))
+    if _backend() == 'fts5':
+        if not _fts_query(term):
+            return false()
+        return Patient.id.in_(db.select(_fts_matches('patients', term).c.id))
+    return Patient.full_name.ilike(f'%{term}%')
+
+
+def search_patients(query, term):
+    """Filter a Patient query by name, phone or exact ID"""
+    return query.filter(_patient_condition(term))
+
+
+def search_appointments(query, term, model=Appointment):
+    """Filter an Appointment (or ``model``) query by patient name or doctor name/specialization"""
+    if _backend() == 'fts5':
+        if not _fts_query(term):
+            return query.filter(false())
+        patient_ids = db.select(_fts_matches('patients', term).c.id)
+        doctor_ids = db.select(_fts_matches('doctors', term).c.id)
+    else:
+        patient_ids = db.select(Patient.id).where(Patient.full_name.ilike(f'%{term}%'))
+        doctor_ids = db.select(Doctor.id).where(Doctor.full_name.ilike(f'%{term}%'))
+    return query.filter(or_(model.patient_id.in_(patient_ids), model.doctor_id.in_(doctor_ids)))
@@ -0,0 +1,165 @@
+"""Compact JSON serializers for the API.
+
+A serializer names the columns a response needs, so API queries select
+just those columns (joined across tables where needed) and never build
+full ORM objects. Field names double as result labels, which lets keyset
+pagination read the sort key straight off the rows.
+
+Appointment, visit and treatment serializers come in pairs, one per tier:
+``archived_*`` read the archive tables (app/archive.py) under the same
+field names, so rows of both tiers can be merged.
+"""
+from datetime import date, time, datetime
+from app.models import (db, User, Appointment, ArchivedAppointment, ArchivedTreatment, Doctor, Patient,
+                        Department, DoctorAvailability, Treatment)
+
+
+def _json_value(value):
+    if isinstance(value, time):
+        return value.strftime('%H:%M')
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+class Serializer:
+    def __init__(self, **fields):
+        self.fields = fields
+
+    def select(self):
+        """A query over exactly the serializer's columns"""
+        return db.session.query(*(column.label(name) for name, column in self.fields.items()))
+
+    def dump(self, row):
+        return {name: _json_value(getattr(row, name)) for name in self.fields}
+
+    def dump_all(self, rows):
+        return [self.dump(row) for row in rows]
+
+
+# Field names that are keyset sort keys must match the column key (e.g. ``appointment_date``)
+def _appointment_fields(model):
+    return dict(
+        id=model.id,
+        appointment_date=model.appointment_date,
+        appointment_time=model.appointment_time,
+        status=model.status,
+        reason=model.reason,
+        patient_id=model.patient_id,
+        patient_name=Patient.full_name,
+        doctor_id=model.doctor_id,
+        doctor_name=Doctor.full_name,
+        department=Department.name,
+    )
+
+
+appointment = Serializer(**_appointment_fields(Appointment))
+archived_appointment = Serializer(**_appointment_fields(ArchivedAppointment))
+
+doctor = Serializer(
+    id=Doctor.id,
+    full_name=Doctor.full_name,
+    specialization=Doctor.specialization,
+    qualification=Doctor.qualification,
+    experience_years=Doctor.experience_years,
+    department_id=Doctor.department_id,
+    department=Department.name,
+)
+
+availability = Serializer(
+    doctor_id=DoctorAvailability.doctor_id,
+    date=DoctorAvailability.date,
+    start_time=DoctorAvailability.start_time,
+    end_time=DoctorAvailability.end_time,
+)
+
+def _visit_fields(model, treatment_model):
+    return dict(
+        id=model.id,
+        appointment_date=model.appointment_date,
+        appointment_time=model.appointment_time,
+        reason=model.reason,
+        doctor_id=model.doctor_id,
+        doctor_name=Doctor.full_name,
+        diagnosis=treatment_model.diagnosis,
+        prescription=treatment_model.prescription,
+        notes=treatment_model.notes,
+    )
+
+
+visit = Serializer(**_visit_fields(Appointment, Treatment))
+archived_visit = Serializer(**_visit_fields(ArchivedAppointment, ArchivedTreatment))
+
+patient = Serializer(
+    id=Patient.id,
+    full_name=Patient.full_name,
+    username=User.username,
+    email=User.email,
+    date_of_birth=Patient.date_of_birth,
+    gender=Patient.gender,
+    phone=Patient.phone,
+    address=Patient.address,
+    blood_group=Patient.blood_group,
+    emergency_contact=Patient.emergency_contact,
+    created_at=Patient.created_at,
+)
+
+def _treatment_fields(model, treatment_model):
+    return dict(
+        id=treatment_model.id,
+        appointment_id=treatment_model.appointment_id,
+        appointment_date=model.appointment_date,
+        patient_id=model.patient_id,
+        patient_name=Patient.full_name,
+        doctor_id=model.doctor_id,
+        doctor_name=Doctor.full_name,
+        diagnosis=treatment_model.diagnosis,
+        prescription=treatment_model.prescription,
+        notes=treatment_model.notes,
+        created_at=treatment_model.created_at,
+    )
+
+
+treatment = Serializer(**_treatment_fields(Appointment, Treatment))
+archived_treatment = Serializer(**_treatment_fields(ArchivedAppointment, ArchivedTreatment))
+
+
+def appointments_query(archived=False):
+    """Appointment rows with patient, doctor and department names, from the archive with ``archived``"""
+    model, serializer = (ArchivedAppointment, archived_appointment) if archived else (Appointment, appointment)
+    return (serializer.select()
+            .select_from(model)
+            .join(Patient, model.patient_id == Patient.id)
+            .join(Doctor, model.doctor_id == Doctor.id)
+            .join(Department, Doctor.department_id == Department.id))
+
+
+def doctors_query():
+    """Doctor rows with their department name"""
+    return doctor.select().select_from(Doctor).join(Department, Doctor.department_id == Department.id)
+
+
+def visits_query(archived=False):
+    """Appointment rows with the doctor's name and the treatment, if any, from the archive with ``archived``"""
+    model, treatment_model, serializer = ((ArchivedAppointment, ArchivedTreatment, archived_visit) if archived
+                                          else (Appointment, Treatment, visit))
+    return (serializer.select()
+            .select_from(model)
+            .join(Doctor, model.doctor_id == Doctor.id)
+            .outerjoin(treatment_model, treatment_model.appointment_id == model.id))
+
+
+def patients_query():
+    """Patient rows with their login details"""
+    return patient.select().select_from(Patient).join(User, Patient.user_id == User.id)
+
+
+def treatments_query(archived=False):
+    """Treatment rows with the appointment date and patient and doctor names, from the archive with ``archived``"""
+    model, treatment_model, serializer = ((ArchivedAppointment, ArchivedTreatment, archived_treatment) if archived
+                                          else (Appointment, Treatment, treatment))
+    return (serializer.select()
+            .select_from(treatment_model)
+            .join(model, treatment_model.appointment_id == model.id)
+            .join(Patient, model.patient_id == Patient.id)
+            .join(Doctor, model.doctor_id == Doctor.id))
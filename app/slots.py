@@ -0,0 +1,90 @@
+"""Bookable slot generation.
+
+A doctor's availability windows are cut into fixed-length slots and the
+slots overlapping an active appointment are removed. The data for a whole
+date range comes from two indexed range queries (working hours, see
+app/schedules.py, and active appointments for the doctor), and the
+subtraction is a single sweep over both sorted lists, so the cost does not
+depend on how many slots are checked.
+"""
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from flask import current_app
+from app.models import db, Appointment
+from app import schedules
+
+# Appointments in these statuses occupy their slot
+ACTIVE_STATUSES = ('Booked', 'Completed')
+
+
+def slot_length(slot_minutes=None):
+    return timedelta(minutes=slot_minutes or current_app.config['APPOINTMENT_SLOT_MINUTES'])
+
+
+def _merge_windows(windows):
+    """Union overlapping ``(start, end)`` datetime windows"""
+    merged = []
+    for start, end in sorted(windows):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def compute_free_slots(windows, booked, length, not_before=None):
+    """Return sorted slot start datetimes inside ``windows`` that do not overlap ``booked``.
+
+    ``windows`` are ``(start, end)`` datetimes, ``booked`` are appointment
+    start datetimes; every appointment is assumed to last one slot.
+    """
+    booked = sorted(booked)
+    free = []
+    i = 0
+    for start, end in _merge_windows(windows):
+        slot = start
+        while slot + length <= end:
+            # Skip appointments that end before this slot starts
+            while i < len(booked) and booked[i] + length <= slot:
+                i += 1
+            overlaps = i < len(booked) and booked[i] < slot + length
+            if not overlaps and (not_before is None or slot > not_before):
+                free.append(slot)
+            slot += length
+    return free
+
+
+def load_windows(doctor_id, start_date, end_date):
+    windows = schedules.load([doctor_id], start_date, end_date).get(doctor_id, [])
+    return [(datetime.combine(w.date, w.start_time), datetime.combine(w.date, w.end_time)) for w in windows]
+
+
+def load_booked(doctor_id, start_date, end_date):
+    rows = db.session.query(Appointment.appointment_date, Appointment.appointment_time).filter(
+        Appointment.doctor_id == doctor_id,
+        Appointment.appointment_date >= start_date,
+        Appointment.appointment_date <= end_date,
+        Appointment.status.in_(ACTIVE_STATUSES)
+    )
+    return [datetime.combine(day, at) for day, at in rows]
+
+
+def free_slots(doctor_id, start_date, end_date, slot_minutes=None, now=None):
+    """Return ``{date: [time, ...]}`` of open slots for a doctor between two dates (inclusive)"""
+    now = now or datetime.now()
+    slots = compute_free_slots(
+        load_windows(doctor_id, start_date, end_date),
+        load_booked(doctor_id, start_date, end_date),
+        slot_length(slot_minutes),
+        not_before=now,
+    )
+
+    by_date = OrderedDict()
+    for slot in slots:
+        by_date.setdefault(slot.date(), []).append(slot.time())
+    return by_date
+
+
+def is_bookable(doctor_id, day, at, slot_minutes=None, now=None):
+    """True if ``at`` on ``day`` is one of the doctor's open slots"""
+    return at in free_slots(doctor_id, day, day, slot_minutes, now).get(day, [])
@@ -0,0 +1,121 @@
+"""Per-connection prepared statement cache for the pg8000 driver.
+
+pg8000 runs every parameterised statement through the unnamed statement:
+Parse, Describe, then Bind/Execute, three round trips to the server. The
+ORM sends the same few hundred SQL strings over and over, so once a
+statement has been prepared on a connection under a name, executing it
+again only needs Bind/Execute, a single round trip. Each connection keeps
+the ``DB_STATEMENT_CACHE_SIZE`` most recently used statements and closes
+the ones it evicts.
+
+Named statements live in the server session. Keep the cache off behind
+PgBouncer in transaction mode, where consecutive transactions may land on
+different server connections.
+
+:func:`_execute` mirrors ``pg8000.legacy.Cursor.execute`` and relies on
+pg8000 internals, so the cache is off unless ``DB_STATEMENT_CACHE_SIZE`` is
+set, and only used with the pg8000 release it was written against
+(:data:`PG8000_VERSION`, pinned in requirements.txt); any other release
+runs pg8000's own code path.
+"""
+import weakref
+from collections import OrderedDict
+import pg8000
+from sqlalchemy import event
+from pg8000.legacy import (Cursor, DatabaseError, IntegrityError, InterfaceError, ProgrammingError,
+                           convert_paramstyle, make_params)
+from app.models import db
+
+# SQLSTATEs after which a cached statement cannot be used again: "cached plan must not change
+# result type" (after DDL) and "prepared statement does not exist" (the session was reset)
+STALE_STATEMENT_CODES = ('0A000', '26000')
+
+# The pg8000 release whose Cursor.execute _execute mirrors
+PG8000_VERSION = '1.31.1'
+
+# pg8000 connection -> OrderedDict of (SQL, parameter type oids) -> (name, columns, input_funcs)
+_caches = weakref.WeakKeyDictionary()
+
+
+def _statements(con):
+    cache = _caches.get(con)
+    if cache is None:
+        cache = _caches[con] = OrderedDict()
+    return cache
+
+
+def _prepare(con, cache, size, key):
+    prepared = cache.get(key)
+    if prepared is not None:
+        cache.move_to_end(key)
+        return prepared
+    prepared = cache[key] = con.prepare_statement(*key)
+    if len(cache) > size:
+        _, (name, _, _) = cache.popitem(last=False)
+        con.close_prepared_statement(name)
+    return prepared
+
+
+def _execute(cursor, operation, parameters, size):
+    """What ``pg8000.legacy.Cursor.execute`` does, with a named statement in place of the unnamed one"""
+    con = cursor._c
+    if con is None:
+        raise InterfaceError('Cursor closed')
+    statement, vals = convert_paramstyle(cursor.paramstyle, operation, parameters)
+    # Parameter types set through setinputsizes() are part of the prepared statement
+    key = (statement, tuple(cursor._input_oids))
+    cache = _statements(con)
+    try:
+        if not con._in_transaction and not con.autocommit:
+            con.execute_simple('begin transaction')
+        name, columns, input_funcs = _prepare(con, cache, size, key)
+        cursor._context = con.execute_named(name, make_params(con.py_types, vals), columns, input_funcs, statement)
+        cursor._input_oids = ()
+    except AttributeError:
+        if con._sock is None:
+            raise InterfaceError('connection is closed')
+        raise
+    except DatabaseError as e:
+        msg = e.args[0]
+        if not isinstance(msg, dict):
+            raise ProgrammingError(msg)
+        if msg['C'] in STALE_STATEMENT_CODES and key in cache:
+            # Only forget it locally: the server may no longer know the name
+            con._statement_nums.discard(cache.pop(key)[0])
+        cls = InterfaceError if msg['C'] == '28000' else IntegrityError if msg['C'] == '23505' else ProgrammingError
+        raise cls(msg)
+    cursor._row_iter = iter(cursor._context.rows or [])
+    cursor.input_types = []
+
+
+def install(app):
+    """Route parameterised statements through the cache when the app runs on pg8000"""
+    size = app.config.get('DB_STATEMENT_CACHE_SIZE', 0)
+    with app.app_context():
+        engine = db.engine
+    if size <= 0 or engine.dialect.driver != 'pg8000':
+        return
+    if pg8000.__version__ != PG8000_VERSION:
+        app.logger.warning('DB_STATEMENT_CACHE_SIZE ignored: written for pg8000 %s, found %s',
+                           PG8000_VERSION, pg8000.__version__)
+        return
+
+    @event.listens_for(engine, 'do_execute')
+    def do_execute(cursor, statement, parameters, context):
+        # Server-side cursors (yield_per) wrap the pg8000 cursor and declare a new name every time
+        if type(cursor) is not Cursor or not parameters:
+            return None
+        _execute(cursor, statement, parameters, size)
+        return True
+
+    @event.listens_for(engine, 'do_executemany')
+    def do_executemany(cursor, statement, parameters, context):
+        if type(cursor) is not Cursor:
+            return None
+        rowcounts = []
+        for params in parameters:
+            _execute(cursor, statement, params, size)
+            rowcounts.append(cursor._context.row_count)
+        if rowcounts:
+            cursor._context.row_count = -1 if -1 in rowcounts else sum(rowcounts)
+        return True
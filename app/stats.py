@@ -0,0 +1,135 @@
+"""Incrementally maintained dashboard counters.
+
+Write paths call :func:`increment` in the same transaction as the row they
+add or delete, so the admin dashboard reads a handful of primary-key rows
+instead of running ``COUNT(*)`` over whole tables. Any counter whose last
+full recount is older than ``STATS_MAX_AGE`` seconds is recounted on read,
+which bounds how long drift (manual SQL, failed requests, bulk loads) can
+stay visible. ``flask reconcile-stats`` recounts everything and is meant to
+run periodically from cron.
+"""
+from datetime import date, datetime, timedelta
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from app.models import db, Doctor, Patient, StatCounter
+from app.archive import TIERS
+
+DOCTORS = 'doctors'
+PATIENTS = 'patients'
+APPOINTMENTS = 'appointments'
+APPOINTMENTS_ON_PREFIX = 'appointments_on:'
+
+# Per-day counters older than this are dropped by reconcile_all()
+DAY_COUNTER_RETENTION = timedelta(days=7)
+
+_TOTALS = {
+    DOCTORS: lambda: db.session.query(db.func.count(Doctor.id)).scalar(),
+    PATIENTS: lambda: db.session.query(db.func.count(Patient.id)).scalar(),
+    # Archiving moves appointments between tiers without changing the total
+    APPOINTMENTS: lambda: sum(db.session.query(db.func.count(model.id)).scalar() for model, _ in TIERS),
+}
+
+
+def appointments_on(day):
+    """Counter key for the number of appointments on ``day``"""
+    return APPOINTMENTS_ON_PREFIX + day.isoformat()
+
+
+def compute(key):
+    """Count the true value of a counter from the source tables"""
+    if key.startswith(APPOINTMENTS_ON_PREFIX):
+        day = date.fromisoformat(key[len(APPOINTMENTS_ON_PREFIX):])
+        return sum(db.session.query(db.func.count(model.id)).filter(model.appointment_date == day).scalar()
+                   for model, _ in TIERS)
+    return _TOTALS[key]()
+
+
+def _recount(key):
+    """Store a fresh count of ``key``; returns ``(previous value or None, counter)``.
+
+    The counter row is locked before counting, so an :func:`increment` from a
+    transaction committed meanwhile is either counted or waits for the lock
+    and applies on top of the new value, instead of being overwritten.
+    """
+    counter = (StatCounter.query.filter(StatCounter.key == key)
+               .with_for_update().populate_existing().first())
+    old = counter.value if counter else None
+    if counter is None:
+        counter = StatCounter(key=key)
+        db.session.add(counter)
+    counter.value = compute(key)
+    counter.reconciled_at = datetime.utcnow()
+    return old, counter
+
+
+def increment(key, delta=1, create=True):
+    """Adjust a counter as part of the current transaction.
+
+    Call after adding or deleting the rows being counted; the caller commits.
+    A counter that does not exist yet is initialised from a full count, which
+    already includes the pending change, unless ``create`` is False, in which
+    case it is left to be counted on first read.
+    """
+    db.session.flush()
+    updated = db.session.execute(
+        db.update(StatCounter)
+        .where(StatCounter.key == key)
+        .values(value=StatCounter.value + delta)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if updated or not create:
+        return
+
+    try:
+        with db.session.begin_nested():
+            db.session.add(StatCounter(key=key, value=compute(key), reconciled_at=datetime.utcnow()))
+    except IntegrityError:
+        # Another request created the counter first; apply our change to it
+        db.session.execute(
+            db.update(StatCounter)
+            .where(StatCounter.key == key)
+            .values(value=StatCounter.value + delta)
+            .execution_options(synchronize_session=False)
+        )
+
+
+def read(keys):
+    """Return ``{key: value}``, recounting counters that are missing or stale"""
+    max_age = timedelta(seconds=current_app.config['STATS_MAX_AGE'])
+    now = datetime.utcnow()
+    counters = {c.key: c for c in StatCounter.query.filter(StatCounter.key.in_(keys))}
+
+    values = {key: counter.value for key, counter in counters.items()}
+    stale = [key for key in keys if key not in counters or counters[key].reconciled_at is None
+             or now - counters[key].reconciled_at > max_age]
+    # In key order, the order increment() callers lock counters in
+    for key in sorted(stale):
+        values[key] = _recount(key)[1].value
+
+    if stale:
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # A concurrent reader stored the same counter; the values we computed are still valid
+            db.session.rollback()
+    return values
+
+
+def reconcile_all():
+    """Recount every counter and drop expired per-day counters; returns ``{key: (old, new)}``"""
+    cutoff = date.today() - DAY_COUNTER_RETENTION
+    StatCounter.query.filter(
+        StatCounter.key.like(APPOINTMENTS_ON_PREFIX + '%'),
+        StatCounter.key < appointments_on(cutoff)
+    ).delete(synchronize_session=False)
+    db.session.commit()
+
+    keys = set(_TOTALS) | {key for (key,) in db.session.query(StatCounter.key)}
+    changes = {}
+    for key in sorted(keys):
+        old, counter = _recount(key)
+        if old != counter.value:
+            changes[key] = (old, counter.value)
+        # One counter at a time, so writers wait for one count at most
+        db.session.commit()
+    return changes
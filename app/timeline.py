@@ -0,0 +1,91 @@
+"""A patient's completed visits, a page at a time, and a cached summary.
+
+History views show the newest ``TIMELINE_PER_PAGE`` visits with their
+doctor and treatment joined in, and fetch older pages by keyset cursor as
+the doctor scrolls, so a chronic-care patient with hundreds of visits costs
+the same as a new one. The summary (visit count, last diagnosis, recent
+prescriptions) is kept in the fragment cache and rebuilt once any
+appointment of the patient changes.
+
+Visits are read from both tiers (app/archive.py): each page and summary
+queries the hot and archived tables on their own and merges the rows.
+"""
+from flask import current_app
+from sqlalchemy import func
+from app.models import db
+from app.archive import TIERS
+from app.queries import visit_history
+from app.pagination import keyset_paginate_merged
+from app.fragments import cached_value
+from app import serializers
+
+# Visits the summary lists prescriptions from
+RECENT_VISITS = 3
+
+
+def _order(model):
+    # Newest first, matching ix_appointments_patient_status_date and its archive twin
+    return [model.appointment_date, model.appointment_time, model.id]
+
+
+def _completed(model, patient_id):
+    return model.patient_id == patient_id, model.status == 'Completed'
+
+
+def _visit_queries(patient_id):
+    # serializers.visits_query per tier, with the tier's appointment model
+    return [(serializers.visits_query(archived=archived).filter(*_completed(model, patient_id)), model)
+            for archived, (model, _) in enumerate(TIERS)]
+
+
+def _per_page(per_page):
+    return per_page or current_app.config['TIMELINE_PER_PAGE']
+
+
+def visits(patient_id, cursor=None, per_page=None, exclude_id=None):
+    """A page of completed visits as Appointments with ``doctor`` and ``treatment`` loaded"""
+    sources = []
+    for model, _ in TIERS:
+        query = visit_history(model=model).filter(*_completed(model, patient_id))
+        if exclude_id is not None:
+            query = query.filter(model.id != exclude_id)
+        sources.append((query, _order(model)))
+    return keyset_paginate_merged(sources, cursor=cursor, per_page=_per_page(per_page), descending=True)
+
+
+def visit_rows(patient_id, cursor=None, per_page=None):
+    """A page of completed visits as ``serializers.visit`` rows, for the API"""
+    sources = [(query, _order(model)) for query, model in _visit_queries(patient_id)]
+    return keyset_paginate_merged(sources, cursor=cursor, per_page=_per_page(per_page), descending=True)
+
+
+def _load_summary(patient_id):
+    count, first_visit, recent = 0, None, []
+    for query, model in _visit_queries(patient_id):
+        tier_count, tier_first = db.session.query(
+            func.count(model.id), func.min(model.appointment_date)
+        ).filter(*_completed(model, patient_id)).one()
+        count += tier_count
+        if tier_first is not None and (first_visit is None or tier_first < first_visit):
+            first_visit = tier_first
+        recent += query.order_by(*(column.desc() for column in _order(model))).limit(RECENT_VISITS).all()
+    recent = sorted(recent, key=lambda row: (row.appointment_date, row.appointment_time, row.id),
+                    reverse=True)[:RECENT_VISITS]
+    return {
+        'visit_count': count,
+        'first_visit': first_visit.isoformat() if first_visit else None,
+        'last_visit': recent[0].appointment_date.isoformat() if recent else None,
+        'last_diagnosis': recent[0].diagnosis if recent else None,
+        'recent_prescriptions': [
+            {'appointment_id': row.id, 'date': row.appointment_date.isoformat(),
+             'doctor_name': row.doctor_name, 'prescription': row.prescription}
+            for row in recent if row.prescription
+        ],
+    }
+
+
+def summary(patient_id):
+    """Visit count, first and last visit (ISO dates), last diagnosis and the latest prescriptions"""
+    return cached_value('patient-summary', patient_id,
+                        depends=[f'appointments:patient_id:{patient_id}'],
+                        load=lambda: _load_summary(patient_id))
@@ -0,0 +1,113 @@
+"""Measure archiving throughput and its effect on everyday queries.
+
+Usage:
+    python -m benchmarks.archive_tiering [--appointments 200000] [--years 5] [--database-url URL]
+
+Generates ``--years`` of appointment history, times a set of admin pages
+and API calls, archives everything older than ``ARCHIVE_AFTER_DAYS``,
+reports the rows moved per second and the hot table size, and times the
+same requests again. Pages reading both tiers should cost about the same;
+pages reading the hot tier only should get faster as history grows.
+
+Finally it completes visits between archiving runs that empty the hot
+tables and checks that no appointment or treatment id is handed out twice.
+"""
+import argparse
+import statistics
+import time as timer
+from datetime import date, timedelta
+
+from app import archive
+from app.models import db, Appointment, ArchivedAppointment, ArchivedTreatment, Treatment, User
+from benchmarks.datagen import create_bench_app, login_as, populate
+
+
+def requests_for(patient_id):
+    return [
+        ('admin appointments (hot)', '/admin/appointments'),
+        ('admin appointments, Completed (hot)', '/admin/appointments?status=Completed'),
+        ('api appointments (hot)', '/api/v1/appointments'),
+        ('patient history (both)', f'/api/v1/patients/{patient_id}/history'),
+        ('dashboard stats (both)', '/api/v1/dashboard/stats'),
+    ]
+
+
+def measure(client, url, runs):
+    times = []
+    for _ in range(runs):
+        started = timer.perf_counter()
+        response = client.get(url)
+        times.append(timer.perf_counter() - started)
+        assert response.status_code == 200, (url, response.status_code)
+    return statistics.median(times) * 1000
+
+
+def _complete(appointment):
+    appointment.status = 'Completed'
+    db.session.add(Treatment(appointment_id=appointment.id, diagnosis='Routine checkup'))
+    db.session.commit()
+
+
+def check_ids_unique(batch_size):
+    """Complete visits between runs that archive everything closed; every id must stay unique across tiers"""
+    tomorrow = date.today() + timedelta(days=1)
+    for _ in range(2):
+        booked = (Appointment.query.filter(Appointment.status == 'Booked', Appointment.appointment_date < tomorrow)
+                  .order_by(Appointment.id).first())
+        if booked is None:
+            break
+        _complete(booked)
+        archive.run(batch_size=batch_size, before=tomorrow)
+    for hot, archived in ((Appointment, ArchivedAppointment), (Treatment, ArchivedTreatment)):
+        reused = db.session.query(hot.id).filter(hot.id.in_(db.select(archived.id))).count()
+        assert reused == 0, f'{reused} {hot.__tablename__} ids reused from the archive'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url')
+    parser.add_argument('--doctors', type=int, default=100)
+    parser.add_argument('--patients', type=int, default=20000)
+    parser.add_argument('--appointments', type=int, default=200000)
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    app = create_bench_app(args.database_url, ARCHIVE_AFTER_DAYS=365)
+    with app.app_context():
+        populate(doctors=args.doctors, patients=args.patients, appointments=args.appointments,
+                 days=args.years * 365)
+        admin_id = User.query.filter_by(username='admin').first().id
+        # The patient with the longest history
+        patient_id = db.session.execute(
+            db.select(Appointment.patient_id).where(Appointment.status == 'Completed')
+            .group_by(Appointment.patient_id).order_by(db.func.count().desc()).limit(1)
+        ).scalar()
+        db.session.remove()
+
+    client = login_as(app, admin_id)
+    urls = requests_for(patient_id)
+    before = [measure(client, url, args.runs) for _, url in urls]
+
+    with app.app_context():
+        started = timer.perf_counter()
+        moved = archive.run(batch_size=args.batch_size)
+        seconds = timer.perf_counter() - started
+        hot, archived = archive.counts()
+        db.session.remove()
+    print(f'Archived {moved} appointments in {seconds:.1f}s ({moved / seconds if seconds else 0:.0f} rows/s, '
+          f'batches of {args.batch_size}); appointments: {hot} hot, {archived} archived')
+
+    after = [measure(client, url, args.runs) for _, url in urls]
+    print(f'{"request":<40}{"before ms":>11}{"after ms":>10}')
+    for (name, _), first, second in zip(urls, before, after):
+        print(f'{name:<40}{first:>11.1f}{second:>10.1f}')
+
+    with app.app_context():
+        check_ids_unique(args.batch_size)
+    print('Ids unique across tiers: ok')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Hammer a small set of slots from many threads and check for double bookings.
+
+Usage:
+    python -m benchmarks.booking_stress [--threads 16] [--requests 200] [--database-url URL]
+    python -m benchmarks.booking_stress --no-precheck   # rely on the unique index alone
+
+Every thread logs in as a different patient and books random slots out of
+a deliberately small pool for one doctor, so most requests race for a slot
+somebody else is booking at the same moment. Run it against SQLite (the
+default) and against a local Postgres, e.g.::
+
+    docker run --rm -e POSTGRES_PASSWORD=pw -p 5432:5432 postgres:16
+    python -m benchmarks.booking_stress --database-url postgresql+pg8000://postgres:pw@localhost/postgres
+
+The script exits with status 1 if any slot ends up with more than one
+active appointment.
+"""
+import argparse
+import random
+import sys
+import threading
+import time as timer
+from collections import Counter
+from datetime import date, time, timedelta
+
+import app.routes
+from app.models import db, User, Doctor, Patient, Appointment, DoctorAvailability
+from benchmarks.datagen import PLACEHOLDER_HASH, create_bench_app, login_as
+
+
+def setup(app, threads, days):
+    with app.app_context():
+        doctor_user = User(username='stress_doctor', email='stress_doctor@example.com',
+                           password_hash=PLACEHOLDER_HASH, role='doctor')
+        db.session.add(doctor_user)
+        db.session.flush()
+        doctor = Doctor(user_id=doctor_user.id, department_id=1, full_name='Stress Doctor',
+                        specialization='General')
+        db.session.add(doctor)
+        db.session.flush()
+
+        tomorrow = date.today() + timedelta(days=1)
+        for offset in range(days):
+            db.session.add(DoctorAvailability(doctor_id=doctor.id, date=tomorrow + timedelta(days=offset),
+                                              start_time=time(9, 0), end_time=time(12, 0)))
+
+        patient_user_ids = []
+        for i in range(threads):
+            user = User(username=f'stress_patient_{i}', email=f'stress_patient_{i}@example.com',
+                        password_hash=PLACEHOLDER_HASH, role='patient')
+            db.session.add(user)
+            db.session.flush()
+            db.session.add(Patient(user_id=user.id, full_name=f'Stress Patient {i}'))
+            patient_user_ids.append(user.id)
+
+        db.session.commit()
+        slots = [f'{(tomorrow + timedelta(days=d)).isoformat()}T{h:02d}:{m:02d}'
+                 for d in range(days) for h in range(9, 12) for m in (0, 30)]
+        return doctor.id, patient_user_ids, slots
+
+
+def worker(app, user_id, doctor_id, slots, requests, seed, results):
+    rng = random.Random(seed)
+    client = login_as(app, user_id)
+    url = f'/patient/book-appointment/{doctor_id}'
+    outcome = Counter()
+    for _ in range(requests):
+        response = client.post(url, data={'appointment_slot': rng.choice(slots), 'reason': 'stress'})
+        if response.status_code != 302:
+            outcome['error'] += 1
+        elif response.location.endswith('/patient/dashboard'):
+            outcome['booked'] += 1
+        else:
+            outcome['rejected'] += 1
+    results.append(outcome)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=200, help='booking attempts per thread')
+    parser.add_argument('--days', type=int, default=3, help='days of availability in the slot pool')
+    parser.add_argument('--no-precheck', action='store_true',
+                        help='skip the slot availability check so only the database constraint prevents double booking')
+    args = parser.parse_args()
+
+    if args.no_precheck:
+        app.routes.is_bookable = lambda *a, **kw: True
+
+    flask_app = create_bench_app(args.database_url)
+    doctor_id, user_ids, slots = setup(flask_app, args.threads, args.days)
+
+    results = []
+    threads = [threading.Thread(target=worker,
+                                args=(flask_app, user_id, doctor_id, slots, args.requests, i, results))
+               for i, user_id in enumerate(user_ids)]
+    start = timer.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = timer.perf_counter() - start
+
+    totals = sum(results, Counter())
+    with flask_app.app_context():
+        duplicates = db.session.query(
+            Appointment.appointment_date, Appointment.appointment_time, db.func.count()
+        ).filter(
+            Appointment.doctor_id == doctor_id,
+            Appointment.status.in_(['Booked', 'Completed'])
+        ).group_by(Appointment.appointment_date, Appointment.appointment_time).having(db.func.count() > 1).all()
+        booked_rows = Appointment.query.filter_by(doctor_id=doctor_id, status='Booked').count()
+
+    attempts = args.threads * args.requests
+    print(f'{attempts} attempts on {len(slots)} slots from {args.threads} threads in {elapsed:.2f}s '
+          f'({attempts / elapsed:.0f} req/s)')
+    print(f'booked={totals["booked"]} rejected={totals["rejected"]} errors={totals["error"]} '
+          f'rows={booked_rows} double_booked_slots={len(duplicates)}')
+    sys.exit(1 if duplicates or totals['booked'] != booked_rows else 0)
+
+
+if __name__ == '__main__':
+    main()
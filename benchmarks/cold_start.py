@@ -0,0 +1,110 @@
+"""Measure cold start: importing ``run.py`` and serving the first requests in a fresh process.
+
+Usage:
+    python -m benchmarks.cold_start [--runs 5] [--budget-ms 1000] [--max-queries 1] [--database-url URL]
+
+Each run starts a new interpreter, the way a new serverless instance
+does, against a database that has already been initialised with
+``flask init-db`` (the normal production state). A run on a brand-new
+database, where the first request also creates and seeds the schema, is
+reported separately. The script exits with status 1 if, for the
+initialised case, the median import + first request time is over
+``--budget-ms`` or more than ``--max-queries`` statements run before the
+first response. The query count is the stable number: time on SQLite is
+mostly library imports, while against a remote database every statement
+is a network round trip.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child process; the database URL is passed in through the environment
+CHILD = '''
+import json, os, time
+start = time.perf_counter()
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+queries = {'import': 0, 'first': 0}
+phase = 'import'
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def count(*args):
+    queries[phase] += 1
+
+import config
+config.Config.SQLALCHEMY_DATABASE_URI = os.environ['COLD_START_DATABASE_URL']
+import run
+imported = time.perf_counter()
+phase = 'first'
+client = run.app.test_client()
+first = client.get('/login').status_code
+served = time.perf_counter()
+client.get('/login')
+second = time.perf_counter()
+print(json.dumps({'import_ms': (imported - start) * 1000, 'first_ms': (served - imported) * 1000,
+                  'second_ms': (second - served) * 1000, 'queries': queries['import'] + queries['first'],
+                  'status': first}))
+'''
+
+
+def cold_start(database_url):
+    env = dict(os.environ, COLD_START_DATABASE_URL=database_url)
+    output = subprocess.run([sys.executable, '-c', CHILD], cwd=ROOT, env=env, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def fresh_sqlite_url():
+    fd, path = tempfile.mkstemp(prefix='hms-cold-', suffix='.db')
+    os.close(fd)
+    os.remove(path)
+    return 'sqlite:///' + path
+
+
+def report(label, samples):
+    def median(key):
+        return statistics.median(sample[key] for sample in samples)
+    total = median('import_ms') + median('first_ms')
+    queries = max(sample['queries'] for sample in samples)
+    print(f'{label:<14}{median("import_ms"):>10.1f}{median("first_ms"):>12.1f}'
+          f'{median("second_ms"):>12.1f}{total:>10.1f}{queries:>9}')
+    return total, queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='an initialised database to start against (default: temporary SQLite)')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=1000)
+    parser.add_argument('--max-queries', type=int, default=1)
+    args = parser.parse_args()
+
+    database_url = args.database_url
+    if not database_url:
+        database_url = fresh_sqlite_url()
+        cold_start(database_url)  # the first process initialises it
+
+    print(f'{"median of " + str(args.runs):<14}{"import ms":>10}{"1st req ms":>12}{"2nd req ms":>12}{"total":>10}{"queries":>9}')
+    total, queries = report('initialised', [cold_start(database_url) for _ in range(args.runs)])
+    report('new database', [cold_start(fresh_sqlite_url()) for _ in range(args.runs)])
+
+    failed = False
+    if total > args.budget_ms:
+        print(f'FAIL  import + first request took {total:.1f} ms, budget {args.budget_ms:.0f} ms')
+        failed = True
+    if queries > args.max_queries:
+        print(f'FAIL  {queries} queries before the first response, budget {args.max_queries}')
+        failed = True
+    if failed:
+        sys.exit(1)
+    print(f'ok    import + first request within {args.budget_ms:.0f} ms and {args.max_queries} queries')
+
+
+if __name__ == '__main__':
+    main()
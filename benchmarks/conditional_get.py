@@ -0,0 +1,67 @@
+"""Compare full responses with 304 Not Modified answers for pages that send ETags.
+
+Usage:
+    python -m benchmarks.conditional_get [--doctors 20] [--patients 200] [--appointments 5000] [--requests 200]
+
+Every page is requested ``--requests`` times without a validator and
+``--requests`` times with the ETag of the previous response in
+``If-None-Match``, the way a polling browser revalidates. The report shows
+p50 latency, body bytes and SQL statements per request for both.
+"""
+import argparse
+import statistics
+import time
+
+from app.models import db, Appointment, Treatment, User
+from app.profiling import count_queries
+from benchmarks.datagen import create_bench_app, login_as, populate
+
+
+def measure(app, client, path, requests, conditional):
+    latencies, sizes, queries = [], [], []
+    etag = client.get(path).headers['ETag']
+    for _ in range(requests):
+        headers = {'If-None-Match': etag} if conditional else {}
+        with app.app_context(), count_queries() as counter:
+            start = time.perf_counter()
+            response = client.get(path, headers=headers)
+            latencies.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == (304 if conditional else 200), (path, response.status_code)
+        sizes.append(len(response.data))
+        queries.append(counter.count)
+    return statistics.median(latencies), statistics.mean(sizes), statistics.mean(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--doctors', type=int, default=20)
+    parser.add_argument('--patients', type=int, default=200)
+    parser.add_argument('--appointments', type=int, default=5000)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    app = create_bench_app()
+    with app.app_context():
+        populate(doctors=args.doctors, patients=args.patients, appointments=args.appointments)
+        admin_id = User.query.filter_by(role='admin').first().id
+        appointment = (db.session.query(Appointment).join(Treatment)
+                       .filter(Appointment.status == 'Completed').first())
+        pages = [
+            (admin_id, '/admin/dashboard'),
+            (appointment.doctor.user_id, '/doctor/dashboard'),
+            (appointment.patient.user_id, '/patient/dashboard'),
+            (appointment.patient.user_id, f'/prescription/{appointment.id}/print'),
+        ]
+
+    print(f'{args.requests} requests per page and mode')
+    print(f'{"page":<28}{"200 ms":>9}{"304 ms":>9}{"200 B":>9}{"304 B":>7}{"200 q":>7}{"304 q":>7}')
+    for user_id, path in pages:
+        client = login_as(app, user_id)
+        full_ms, full_bytes, full_queries = measure(app, client, path, args.requests, conditional=False)
+        hit_ms, hit_bytes, hit_queries = measure(app, client, path, args.requests, conditional=True)
+        print(f'{path:<28}{full_ms:>9.2f}{hit_ms:>9.2f}{full_bytes:>9.0f}{hit_bytes:>7.0f}'
+              f'{full_queries:>7.1f}{hit_queries:>7.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""Seeded synthetic data generator for benchmarks.
+
+Rows are written with bulk Core inserts so that millions of appointments can
+be generated in minutes. Password hashes are placeholders: generated users
+cannot log in unless a benchmark sets a real hash for them.
+"""
+import os
+import random
+import tempfile
+from array import array
+from datetime import date, datetime, time, timedelta
+
+from app import create_app, reports, roster
+from app.bootstrap import init_db, seed
+from config import Config
+from app.models import (db, User, Department, Doctor, Patient, DoctorAvailability,
+                        Appointment, Treatment)
+
+BATCH_SIZE = 5000
+STATUSES = ['Booked', 'Completed', 'Cancelled']
+PLACEHOLDER_HASH = 'benchmark:not-a-real-hash'
+
+# Names are combined at random so that search benchmarks see realistic token distributions
+FIRST_NAMES = ['James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda', 'David', 'Elizabeth',
+               'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah', 'Aarav', 'Priya',
+               'Wei', 'Mei', 'Hiroshi', 'Yuki', 'Mohammed', 'Fatima', 'Carlos', 'Sofia', 'Ivan', 'Olga']
+LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez', 'Martinez',
+              'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin',
+              'Lee', 'Perez', 'Thompson', 'White', 'Harris', 'Sharma', 'Patel', 'Wang', 'Tanaka', 'Khan', 'Silva',
+              'Ivanov', 'Nakamura', 'Kim', 'Nguyen', 'Clark', 'Lewis', 'Walker', 'Hall', 'Young']
+SPECIALIZATIONS = ['General', 'Cardiology', 'Neurology', 'Orthopedics', 'Pediatrics', 'Dermatology', 'Oncology']
+DIAGNOSES = [('Common cold', 'Rest and fluids'), ('Hypertension', 'Amlodipine 5mg daily'),
+             ('Migraine', 'Sumatriptan 50mg as needed'), ('Sprained ankle', 'Ice, compression, ibuprofen 400mg'),
+             ('Eczema', 'Hydrocortisone cream twice daily'), ('Type 2 diabetes', 'Metformin 500mg twice daily'),
+             ('Routine checkup', 'No medication')]
+
+
+def create_bench_app(database_url=None, **config):
+    """Create an app bound to ``database_url`` or to a fresh temporary SQLite file.
+
+    Keyword arguments override settings from ``Config``.
+    """
+    if not database_url:
+        fd, path = tempfile.mkstemp(prefix='hms-bench-', suffix='.db')
+        os.close(fd)
+        database_url = 'sqlite:///' + path
+
+    # Rendered prescriptions are named after treatment ids, which every bench database reuses
+    config.setdefault('PRESCRIPTION_CACHE_DIR', tempfile.mkdtemp(prefix='hms-bench-rx-'))
+    config.setdefault('NOTIFICATION_OUTBOX', os.path.join(tempfile.mkdtemp(prefix='hms-bench-outbox-'), 'outbox.jsonl'))
+    BenchConfig = type('BenchConfig', (Config,), dict(config, SQLALCHEMY_DATABASE_URI=database_url))
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        init_db(app)
+        seed()
+    return app
+
+
+def _insert_batches(model, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            db.session.execute(db.insert(model), batch)
+            batch = []
+    if batch:
+        db.session.execute(db.insert(model), batch)
+    db.session.commit()
+
+
+def _next_id(model):
+    return (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+
+
+def _sync_sequences(*models):
+    """Move Postgres id sequences past the explicit ids written by populate()"""
+    if db.engine.dialect.name != 'postgresql':
+        return
+    for model in models:
+        table = model.__tablename__
+        db.session.execute(db.text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                                   f"(SELECT COALESCE(MAX(id), 1) FROM {table}))"))
+    db.session.commit()
+
+
+def login_as(app, user_id):
+    """Return a test client with ``user_id`` already logged in (skips password checks)"""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    return client
+
+
+def populate(doctors=50, patients=5000, appointments=100000, days=365, seed=42):
+    """Populate the bound database and return the generated volumes.
+
+    Intended for a fresh database: active bookings are only kept unique
+    among the rows generated by this call. Appointments are spread over
+    ``days`` past days and the next two weeks, 16 half-hour slots a day per
+    doctor; pick ``days`` so that the slots are not oversubscribed, or most
+    rows end up Cancelled.
+    """
+    rng = random.Random(seed)
+    name = lambda: f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+    today = date.today()
+    department_ids = [d.id for d in Department.query.all()]
+
+    user_id = _next_id(User)
+    doctor_id = _next_id(Doctor)
+    patient_id = _next_id(Patient)
+    appointment_id = _next_id(Appointment)
+
+    doctor_ids = list(range(doctor_id, doctor_id + doctors))
+    patient_ids = list(range(patient_id, patient_id + patients))
+
+    _insert_batches(User, (
+        {'id': user_id + i, 'username': f'bench_user_{user_id + i}',
+         'email': f'bench_user_{user_id + i}@example.com', 'password_hash': PLACEHOLDER_HASH,
+         'role': 'doctor' if i < doctors else 'patient', 'is_active': True,
+         'created_at': datetime.utcnow()}
+        for i in range(doctors + patients)
+    ))
+    _insert_batches(Doctor, (
+        {'id': doc_id, 'user_id': user_id + i, 'department_id': rng.choice(department_ids),
+         'full_name': name(), 'specialization': rng.choice(SPECIALIZATIONS), 'experience_years': rng.randint(1, 30),
+         'created_at': datetime.utcnow()}
+        for i, doc_id in enumerate(doctor_ids)
+    ))
+    _insert_batches(Patient, (
+        {'id': pat_id, 'user_id': user_id + doctors + i, 'full_name': name(),
+         'phone': str(rng.randrange(2000000000, 9999999999)), 'gender': rng.choice(['Male', 'Female']),
+         'created_at': datetime.utcnow()}
+        for i, pat_id in enumerate(patient_ids)
+    ))
+    _insert_batches(DoctorAvailability, (
+        {'doctor_id': doc_id, 'date': today + timedelta(days=d),
+         'start_time': time(9, 0), 'end_time': time(17, 0), 'is_available': True}
+        for doc_id in doctor_ids for d in range(7)
+    ))
+
+    # Slot occupancy per doctor (16 half-hour slots a day) keeps active bookings unique
+    span = days + 15
+    occupied = {doc_id: bytearray(span * 16) for doc_id in doctor_ids}
+    completed_ids = array('q')
+
+    def appointment_rows():
+        for i in range(appointments):
+            doc_id = rng.choice(doctor_ids)
+            day_offset, slot = rng.randrange(span), rng.randrange(16)
+            appointment_date = today + timedelta(days=day_offset - days)
+            status = 'Booked' if appointment_date >= today else rng.choice(STATUSES)
+            if status != 'Cancelled':
+                if occupied[doc_id][day_offset * 16 + slot]:
+                    status = 'Cancelled'
+                else:
+                    occupied[doc_id][day_offset * 16 + slot] = 1
+            created = datetime.combine(appointment_date, time(8, 0)) - timedelta(days=rng.randint(0, 30))
+            if status == 'Completed':
+                completed_ids.append(appointment_id + i)
+            yield {'id': appointment_id + i, 'patient_id': rng.choice(patient_ids),
+                   'doctor_id': doc_id, 'appointment_date': appointment_date,
+                   'appointment_time': time(9 + slot // 2, 30 * (slot % 2)),
+                   'status': status, 'reason': 'Checkup', 'created_at': created, 'updated_at': created}
+
+    _insert_batches(Appointment, appointment_rows())
+
+    def treatment_rows():
+        for apt_id in completed_ids:
+            diagnosis, prescription = rng.choice(DIAGNOSES)
+            yield {'appointment_id': apt_id, 'diagnosis': diagnosis, 'prescription': prescription,
+                   'created_at': datetime.utcnow()}
+
+    _insert_batches(Treatment, treatment_rows())
+    _sync_sequences(User, Doctor, Patient, DoctorAvailability, Appointment, Treatment)
+    # Bulk inserts bypass the write paths that maintain the roster; rollups are rebuilt the same way
+    roster.rebuild()
+    reports.refresh(full=True)
+
+    return {'doctors': doctors, 'patients': patients, 'appointments': appointments}
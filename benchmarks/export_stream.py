@@ -0,0 +1,67 @@
+"""Measure time to first byte, throughput and peak memory of the streaming exports.
+
+Usage:
+    python -m benchmarks.export_stream [--appointments 1000000] [--database-url URL]
+
+Peak Python heap usage (tracemalloc) should stay flat as ``--appointments``
+grows; compare e.g. 100000 and 1000000.
+"""
+import argparse
+import time as timer
+import tracemalloc
+
+from app.models import db, User
+from benchmarks.datagen import create_bench_app, login_as, populate
+
+EXPORTS = [
+    '/admin/export/appointments?format=csv',
+    '/admin/export/appointments?format=ndjson',
+    '/admin/export/appointments?format=csv&status=Completed',
+    '/admin/export/patients?format=csv',
+    '/admin/export/treatments?format=ndjson',
+]
+
+
+def measure(client, url):
+    tracemalloc.start()
+    start = timer.perf_counter()
+    response = client.get(url, buffered=False)
+    chunks = iter(response.response)
+    first = next(chunks, b'')
+    first_byte = timer.perf_counter() - start
+    size, lines = len(first), first.count(b'\n')
+    for chunk in chunks:
+        size += len(chunk)
+        lines += chunk.count(b'\n')
+    elapsed = timer.perf_counter() - start
+    response.close()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return first_byte, elapsed, lines, size, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url')
+    parser.add_argument('--doctors', type=int, default=100)
+    parser.add_argument('--patients', type=int, default=20000)
+    parser.add_argument('--appointments', type=int, default=200000)
+    args = parser.parse_args()
+
+    app = create_bench_app(args.database_url)
+    with app.app_context():
+        populate(doctors=args.doctors, patients=args.patients, appointments=args.appointments)
+        admin_id = User.query.filter_by(username='admin').first().id
+        db.session.remove()
+
+    client = login_as(app, admin_id)
+    print(f'{"export":<58}{"TTFB ms":>9}{"rows":>10}{"rows/s":>10}{"MB":>8}{"peak MB":>9}')
+    for url in EXPORTS:
+        first_byte, elapsed, lines, size, peak = measure(client, url)
+        rows = max(lines - 1, 0) if 'csv' in url else lines
+        print(f'{url:<58}{first_byte * 1000:>9.1f}{rows:>10}{rows / elapsed:>10.0f}'
+              f'{size / 1e6:>8.1f}{peak / 1e6:>9.2f}')
+
+
+if __name__ == '__main__':
+    main()
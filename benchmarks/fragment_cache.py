@@ -0,0 +1,87 @@
+"""Compare page latency with the template fragment cache off, in memory and on disk.
+
+Usage:
+    python -m benchmarks.fragment_cache [--doctors 200] [--requests 200] [--backends null lru filesystem]
+
+For every ``FRAGMENT_CACHE`` backend the doctor search page, the landing
+page and the patient dashboard are requested ``--requests`` times each
+after one warm-up request. The report shows p50/p95 latency, template
+rendering time and SQL statements per request as recorded by
+app/profiling.py, and the fragment hit rate. Every 20th request is preceded
+by an edit of one doctor, so the numbers include invalidation.
+"""
+import argparse
+import re
+import statistics
+import tempfile
+import time
+
+from app.models import db, Doctor, Patient
+from benchmarks.datagen import create_bench_app, login_as, populate
+
+PAGES = ['/patient/doctors', '/', '/patient/dashboard']
+
+
+def server_timing(response):
+    """(template ms, queries, fragment hits, fragment misses) from the Server-Timing header"""
+    header = ', '.join(response.headers.getlist('Server-Timing'))
+    template = re.search(r'tpl;dur=([\d.]+)', header)
+    queries = re.search(r'desc="(\d+) queries"', header)
+    fragments = re.search(r'desc="(\d+) hits, (\d+) misses"', header)
+    return (float(template.group(1)) if template else 0.0, int(queries.group(1)) if queries else 0,
+            int(fragments.group(1)) if fragments else 0, int(fragments.group(2)) if fragments else 0)
+
+
+def run(backend, doctors, requests):
+    app = create_bench_app(INSTRUMENTATION=True, SLOW_QUERY_MS=float('inf'), FRAGMENT_CACHE=backend,
+                           FRAGMENT_CACHE_DIR=tempfile.mkdtemp(prefix='fragments-'))
+    with app.app_context():
+        populate(doctors=doctors, patients=1000, appointments=10000)
+        patient_user_id = Patient.query.first().user_id
+        doctor_ids = [doctor_id for (doctor_id,) in db.session.query(Doctor.id)]
+    patient = login_as(app, patient_user_id)
+    anonymous = app.test_client()
+    results = {}
+    for path in PAGES:
+        client = anonymous if path == '/' else patient
+        client.get(path)
+        latencies, templates, queries, hits, fragments = [], [], [], 0, 0
+        for i in range(requests):
+            if i % 20 == 19:
+                with app.app_context():
+                    doctor = db.session.get(Doctor, doctor_ids[i % len(doctor_ids)])
+                    doctor.experience_years = (doctor.experience_years or 0) + 1
+                    db.session.commit()
+            start = time.perf_counter()
+            response = client.get(path)
+            latencies.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200, response.status_code
+            template_ms, query_count, page_hits, page_misses = server_timing(response)
+            templates.append(template_ms)
+            queries.append(query_count)
+            hits += page_hits
+            fragments += page_hits + page_misses
+        latencies.sort()
+        results[path] = (statistics.median(latencies), latencies[int(len(latencies) * 0.95)],
+                         statistics.mean(templates), statistics.mean(queries), hits / fragments if fragments else None)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--doctors', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--backends', nargs='+', choices=['null', 'lru', 'filesystem'],
+                        default=['null', 'lru', 'filesystem'])
+    args = parser.parse_args()
+
+    print(f'{args.doctors} doctors, {args.requests} requests per page')
+    print(f'{"backend":<12}{"page":<20}{"p50 ms":>9}{"p95 ms":>9}{"tpl ms":>9}{"queries":>9}{"hit rate":>10}')
+    for backend in args.backends:
+        for path, (p50, p95, template_ms, queries, hit_rate) in run(backend, args.doctors, args.requests).items():
+            rate = f'{hit_rate:.1%}' if hit_rate is not None else '-'
+            print(f'{backend:<12}{path:<20}{p50:>9.1f}{p95:>9.1f}{template_ms:>9.1f}{queries:>9.1f}{rate:>10}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Measure bulk import throughput for patients and appointments.
+
+Usage:
+    python -m benchmarks.import_throughput [--patients 2000] [--appointments 200000] [--workers 1 4]
+
+Patient import time is dominated by password hashing, so it is reported
+for each ``--workers`` count (processes in the hashing pool). Appointment
+import involves no hashing and shows the raw batch insert rate.
+"""
+import argparse
+import csv
+import os
+import random
+import tempfile
+from datetime import date, timedelta
+
+from app.importer import import_records
+from app.models import db
+from benchmarks.datagen import FIRST_NAMES, LAST_NAMES, create_bench_app
+
+
+def write_patients(path, count, prefix):
+    with open(path, 'w', newline='') as out:
+        writer = csv.writer(out)
+        writer.writerow(['username', 'email', 'password', 'full_name', 'date_of_birth', 'phone'])
+        rng = random.Random(1)
+        for i in range(count):
+            writer.writerow([f'{prefix}{i}', f'{prefix}{i}@example.com', f'secret-{i}',
+                             f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                             (date(1950, 1, 1) + timedelta(days=rng.randrange(25000))).isoformat(),
+                             str(rng.randrange(2000000000, 9999999999))])
+
+
+def write_appointments(path, count, patients, doctor):
+    # Every row gets its own slot (the doctor "works" around the clock for a few years)
+    with open(path, 'w', newline='') as out:
+        writer = csv.writer(out)
+        writer.writerow(['patient_username', 'doctor_username', 'appointment_date', 'appointment_time',
+                         'status', 'diagnosis', 'prescription'])
+        rng = random.Random(2)
+        start = date.today() - timedelta(days=count // 48 + 1)
+        for i in range(count):
+            writer.writerow([rng.choice(patients), doctor, (start + timedelta(days=i // 48)).isoformat(),
+                             f'{(i % 48) // 2:02d}:{30 * (i % 2):02d}', 'Completed', 'Routine', 'Rest'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url')
+    parser.add_argument('--patients', type=int, default=2000)
+    parser.add_argument('--appointments', type=int, default=200000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, os.cpu_count() or 1])
+    parser.add_argument('--batch-size', type=int)
+    args = parser.parse_args()
+
+    app = create_bench_app(args.database_url)
+    workdir = tempfile.mkdtemp(prefix='hms-import-')
+    with app.app_context():
+        usernames = []
+        for workers in args.workers:
+            path = os.path.join(workdir, f'patients-{workers}.csv')
+            prefix = f'import_w{workers}_'
+            write_patients(path, args.patients, prefix)
+            usernames += [f'{prefix}{i}' for i in range(args.patients)]
+            with open(path, newline='') as lines:
+                report = import_records(lines, 'patients', 'csv', batch_size=args.batch_size, workers=workers)
+            print(f'workers={workers:<3} {report.summary()}')
+
+        doctors = os.path.join(workdir, 'doctors.csv')
+        with open(doctors, 'w') as out:
+            out.write('username,email,password,full_name,department,specialization\n'
+                      'import_doctor,import_doctor@example.com,secret,Import Doctor,General Medicine,General\n')
+        with open(doctors, newline='') as lines:
+            import_records(lines, 'doctors', 'csv', workers=1)
+
+        path = os.path.join(workdir, 'appointments.csv')
+        write_appointments(path, args.appointments, usernames, 'import_doctor')
+        with open(path, newline='') as lines:
+            report = import_records(lines, 'appointments', 'csv', batch_size=args.batch_size)
+        print(report.summary())
+        db.session.remove()
+
+
+if __name__ == '__main__':
+    main()
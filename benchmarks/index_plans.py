@@ -0,0 +1,122 @@
+"""Compare query plans and timings of the hot lookup paths without and with indexes.
+
+Usage:
+    python -m benchmarks.index_plans [--appointments 200000] [--database-url URL]
+
+Without ``--database-url`` a temporary SQLite database is generated. The
+declared indexes are dropped for the "before" run and recreated through
+``app.schema.apply_indexes`` for the "after" run, which is the same path the
+``flask apply-indexes`` command uses on existing deployments.
+"""
+import argparse
+import time as timer
+from datetime import date, time, timedelta
+
+from sqlalchemy import bindparam, text
+
+from app.models import db
+from app.schema import apply_indexes
+from benchmarks.datagen import create_bench_app, populate
+
+QUERIES = {
+    'doctor_day': (
+        "SELECT * FROM appointments WHERE doctor_id = :doctor_id AND appointment_date = :day",
+        lambda p: {'doctor_id': p['doctor_id'], 'day': p['today']},
+    ),
+    'doctor_slot': (
+        "SELECT id FROM appointments WHERE doctor_id = :doctor_id AND appointment_date = :day "
+        "AND appointment_time = :slot AND status IN ('Booked', 'Completed')",
+        lambda p: {'doctor_id': p['doctor_id'], 'day': p['today'], 'slot': time(10, 0)},
+    ),
+    'patient_upcoming': (
+        "SELECT * FROM appointments WHERE patient_id = :patient_id AND status = 'Booked' "
+        "AND appointment_date >= :day ORDER BY appointment_date",
+        lambda p: {'patient_id': p['patient_id'], 'day': p['today']},
+    ),
+    'availability_week': (
+        "SELECT * FROM doctor_availability WHERE doctor_id = :doctor_id AND date BETWEEN :day AND :week_end",
+        lambda p: {'doctor_id': p['doctor_id'], 'day': p['today'], 'week_end': p['today'] + timedelta(days=7)},
+    ),
+    'doctor_profile': (
+        "SELECT * FROM doctors WHERE user_id = :user_id",
+        lambda p: {'user_id': p['doctor_user_id']},
+    ),
+    'patient_profile': (
+        "SELECT * FROM patients WHERE user_id = :user_id",
+        lambda p: {'user_id': p['patient_user_id']},
+    ),
+    'recent_appointments': (
+        "SELECT * FROM appointments ORDER BY created_at DESC LIMIT 10",
+        lambda p: {},
+    ),
+}
+
+
+# Date/time parameters must go through the column types to match stored values
+PARAM_TYPES = {'day': db.Date, 'week_end': db.Date, 'slot': db.Time}
+
+
+def typed_text(sql):
+    stmt = text(sql)
+    types = [bindparam(name, type_=type_) for name, type_ in PARAM_TYPES.items() if f':{name}' in sql]
+    return stmt.bindparams(*types) if types else stmt
+
+
+def explain(conn, sql, params):
+    if conn.dialect.name == 'sqlite':
+        rows = conn.execute(typed_text('EXPLAIN QUERY PLAN ' + sql), params).fetchall()
+        return [row[-1] for row in rows]
+    rows = conn.execute(typed_text('EXPLAIN ' + sql), params).fetchall()
+    return [row[0] for row in rows]
+
+
+def measure(conn, sql, params, repeat):
+    stmt = typed_text(sql)
+    start = timer.perf_counter()
+    for _ in range(repeat):
+        conn.execute(stmt, params).fetchall()
+    return (timer.perf_counter() - start) / repeat * 1000
+
+
+def run(label, params, repeat):
+    print(f'\n=== {label} ===')
+    with db.engine.connect() as conn:
+        for name, (sql, make_params) in QUERIES.items():
+            bound = make_params(params)
+            plan = explain(conn, sql, bound)
+            elapsed = measure(conn, sql, bound, repeat)
+            print(f'{name:<20} {elapsed:9.3f} ms')
+            for line in plan:
+                print(f'    {line}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url')
+    parser.add_argument('--doctors', type=int, default=50)
+    parser.add_argument('--patients', type=int, default=5000)
+    parser.add_argument('--appointments', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    app = create_bench_app(args.database_url)
+    with app.app_context():
+        populate(doctors=args.doctors, patients=args.patients, appointments=args.appointments)
+
+        doctor = db.session.execute(text('SELECT id, user_id FROM doctors ORDER BY id DESC LIMIT 1')).first()
+        patient = db.session.execute(text('SELECT id, user_id FROM patients ORDER BY id DESC LIMIT 1')).first()
+        params = {'doctor_id': doctor.id, 'doctor_user_id': doctor.user_id,
+                  'patient_id': patient.id, 'patient_user_id': patient.user_id, 'today': date.today()}
+
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.drop(db.engine, checkfirst=True)
+        run('without indexes', params, args.repeat)
+
+        created = apply_indexes(db.engine)
+        print(f'\nCreated {len(created)} indexes: {", ".join(created)}')
+        run('with indexes', params, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Measure background job throughput and the reminder scan.
+
+Usage:
+    python -m benchmarks.job_queue [--jobs 5000] [--batch-sizes 1 100] [--database-url URL]
+
+Queues ``--jobs`` appointment notifications and drains them with
+``run-jobs --burst`` once per batch size, writing to a temporary outbox,
+then times a reminder scan over the generated appointments.
+"""
+import argparse
+import os
+import time
+
+from app import jobs
+from app.models import db, Appointment, Job
+from benchmarks.datagen import create_bench_app, populate
+
+
+def drain(batch_size):
+    started = time.perf_counter()
+    counts = jobs.work(burst=True, batch_size=batch_size)
+    return counts, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url')
+    parser.add_argument('--doctors', type=int, default=50)
+    parser.add_argument('--patients', type=int, default=5000)
+    parser.add_argument('--appointments', type=int, default=50000)
+    parser.add_argument('--jobs', type=int, default=5000)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 100])
+    args = parser.parse_args()
+
+    # Reminders are measured separately; keep them out of the drains
+    app = create_bench_app(args.database_url, REMINDER_LEAD_HOURS=0)
+    with app.app_context():
+        populate(doctors=args.doctors, patients=args.patients, appointments=args.appointments)
+        ids = db.session.execute(db.select(Appointment.id).order_by(Appointment.id).limit(args.jobs)).scalars().all()
+        # Periodic jobs scheduled by the first drain
+        drain(1)
+
+        print(f'{"batch":>6}{"jobs":>8}{"seconds":>9}{"jobs/s":>9}')
+        for batch_size in args.batch_sizes:
+            jobs.enqueue_many('notify_appointments', [{'appointment_id': id, 'event': 'booked'} for id in ids])
+            db.session.commit()
+            counts, seconds = drain(batch_size)
+            print(f'{batch_size:>6}{counts["done"]:>8}{seconds:>9.2f}{counts["done"] / seconds:>9.0f}')
+
+        # Every booked appointment of the coming week
+        app.config['REMINDER_LEAD_HOURS'] = 24 * 7
+        started = time.perf_counter()
+        jobs.scan_reminders([{}])
+        db.session.commit()
+        scanned = time.perf_counter() - started
+        queued = db.session.query(Job).filter(Job.status == 'pending', Job.kind == 'notify_appointments').count()
+        print(f'Reminder scan: {queued} reminders queued in {scanned:.2f}s')
+        counts, seconds = drain(max(args.batch_sizes))
+        print(f'Reminders sent: {counts["done"]} in {seconds:.2f}s; outbox {os.path.getsize(app.config["NOTIFICATION_OUTBOX"]) / 1e6:.1f} MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Measure login throughput while password hashing runs in the request thread or in the hashing pool.
+
+Usage:
+    python -m benchmarks.login_throughput [--threads 8] [--seconds 10] [--workers 1 4] \\
+        [--methods scrypt:32768:8:1 pbkdf2:sha256:600000]
+
+For every method and ``--workers`` count (``PASSWORD_HASH_WORKERS``; 1
+hashes in the request thread) ``--threads`` clients log in as fast as they
+can while one more client keeps loading a cheap page. The report shows
+logins per second, logins per second per core used, login latency, and the
+latency of the cheap page, which is what every other user sees during a
+login storm.
+"""
+import argparse
+import os
+import statistics
+import threading
+import time
+
+from app import passwords
+from app.models import db, User
+from benchmarks.datagen import create_bench_app
+
+PASSWORD = 'clinic-opens-at-8'
+
+
+def setup(app, users):
+    with app.app_context():
+        password_hash = passwords.hash_password(PASSWORD)
+        db.session.execute(db.insert(User), [
+            {'username': f'login_{i}', 'email': f'login_{i}@example.com', 'password_hash': password_hash,
+             'role': 'admin', 'is_active': True}
+            for i in range(users)])
+        db.session.commit()
+
+
+def p95(samples):
+    samples = sorted(samples)
+    return samples[int(len(samples) * 0.95)] * 1000 if samples else 0.0
+
+
+def run(method, workers, threads, seconds, users):
+    app = create_bench_app(PASSWORD_HASH_METHOD=method, PASSWORD_HASH_WORKERS=workers)
+    setup(app, users)
+    logins, pages = [], []
+    deadline = time.perf_counter() + seconds
+
+    def login(n):
+        i = n
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            response = app.test_client().post('/login', data={'username': f'login_{i % users}', 'password': PASSWORD})
+            assert response.status_code == 302 and '/admin/' in response.headers['Location'], response.status_code
+            logins.append(time.perf_counter() - start)
+            i += threads
+
+    def browse():
+        client = app.test_client()
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            client.get('/login')
+            pages.append(time.perf_counter() - start)
+            time.sleep(0.05)
+
+    clients = [threading.Thread(target=login, args=(n,)) for n in range(threads)]
+    clients.append(threading.Thread(target=browse))
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    return logins, pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, os.cpu_count() or 1])
+    parser.add_argument('--methods', nargs='+', default=['scrypt:32768:8:1', 'pbkdf2:sha256:600000'])
+    args = parser.parse_args()
+
+    cpus = os.cpu_count() or 1
+    print(f'{cpus} CPUs, {args.threads} login threads, {args.seconds:.0f}s per run')
+    print(f'{"method":<24}{"workers":>8}{"logins/s":>10}{"per core":>10}{"p50 ms":>9}{"p95 ms":>9}{"page p95 ms":>13}')
+    for method in args.methods:
+        for workers in args.workers:
+            logins, pages = run(method, workers, args.threads, args.seconds, args.users)
+            rate = len(logins) / args.seconds
+            cores = min(max(workers, 1), cpus)
+            print(f'{method:<24}{workers:>8}{rate:>10.1f}{rate / cores:>10.1f}'
+                  f'{statistics.median(logins) * 1000:>9.1f}{p95(logins):>9.1f}{p95(pages):>13.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""Compare requests/second across Postgres connection pool modes.
+
+Usage:
+    docker run --rm -e POSTGRES_PASSWORD=pw -p 5432:5432 postgres:16
+    DB_SSL=0 python -m benchmarks.pool_modes --database-url postgresql+pg8000://postgres:pw@localhost/postgres \\
+        [--threads 8] [--seconds 10] [--rtt-ms 5]
+
+Each mode gets its own app and engine and serves the same read-only pages
+from ``--threads`` threads:
+
+* ``null``: a new connection per request (``DB_POOL=null``)
+* ``queue``: a pooled connection, pinged on checkout (``DB_POOL=queue``)
+* ``queue+statements``: pooled, with the prepared statement cache
+  (``DB_STATEMENT_CACHE_SIZE``)
+
+A container on localhost answers in microseconds, which hides exactly the
+round trips pooling and statement caching save. ``--rtt-ms`` routes the
+connections through a local proxy that delays every packet by half the
+given round trip time in each direction, to approximate a managed database
+in another zone. The database is populated on the first run.
+"""
+import argparse
+import socket
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+from sqlalchemy import event
+
+from app.models import db, User, Doctor
+from benchmarks.datagen import create_bench_app, login_as, populate
+from config import postgres_engine_options
+
+MODES = {
+    'null': {'pool': 'null', 'statements': 0},
+    'queue': {'pool': 'queue', 'statements': 0},
+    'queue+statements': {'pool': 'queue', 'statements': 100},
+}
+
+PATHS = ['/api/v1/doctors', '/api/v1/appointments', '/admin/appointments', '/admin/doctors']
+
+
+class DelayProxy:
+    """Forward TCP connections to ``target``, holding each chunk for ``delay`` seconds"""
+
+    def __init__(self, target, delay):
+        self.target = target
+        self.delay = delay
+        self.server = socket.create_server(('127.0.0.1', 0))
+        self.port = self.server.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            client, _ = self.server.accept()
+            upstream = socket.create_connection(self.target)
+            for sock in (client, upstream):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self._pump, args=(client, upstream), daemon=True).start()
+            threading.Thread(target=self._pump, args=(upstream, client), daemon=True).start()
+
+    def _pump(self, source, sink):
+        try:
+            while True:
+                data = source.recv(65536)
+                if not data:
+                    break
+                time.sleep(self.delay)
+                sink.sendall(data)
+        except OSError:
+            pass
+        finally:
+            sink.close()
+
+
+def through_proxy(database_url, rtt_ms):
+    parts = urlsplit(database_url)
+    proxy = DelayProxy((parts.hostname, parts.port or 5432), rtt_ms / 2000)
+    credentials = parts.netloc.rpartition('@')[0]
+    netloc = f'{credentials}@127.0.0.1:{proxy.port}' if credentials else f'127.0.0.1:{proxy.port}'
+    return urlunsplit(parts._replace(netloc=netloc))
+
+
+def run_mode(database_url, mode, threads, seconds):
+    app = create_bench_app(database_url, SQLALCHEMY_ENGINE_OPTIONS=postgres_engine_options(mode['pool']),
+                           DB_STATEMENT_CACHE_SIZE=mode['statements'])
+    connects = []
+    with app.app_context():
+        admin_id = User.query.filter_by(username='admin').one().id
+        event.listen(db.engine, 'connect', lambda *args: connects.append(1))
+        db.session.remove()
+
+    latencies = []
+    deadline = time.perf_counter() + seconds
+
+    def worker():
+        client = login_as(app, admin_id)
+        i = 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            response = client.get(PATHS[i % len(PATHS)])
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.status_code
+            i += 1
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    with app.app_context():
+        db.engine.dispose()
+    return latencies, len(connects)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--rtt-ms', type=float, default=0)
+    parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES))
+    args = parser.parse_args()
+
+    app = create_bench_app(args.database_url)
+    with app.app_context():
+        if not Doctor.query.count():
+            print('volumes:', populate(doctors=50, patients=2000, appointments=20000))
+        db.session.remove()
+        db.engine.dispose()
+
+    database_url = through_proxy(args.database_url, args.rtt_ms) if args.rtt_ms else args.database_url
+    print(f'{args.threads} threads, {args.seconds:.0f}s per mode, added round trip {args.rtt_ms:.1f} ms')
+    print(f'{"mode":<18}{"req/s":>8}{"p50 ms":>9}{"p95 ms":>9}{"connects":>10}')
+    for name in args.modes:
+        latencies, connects = run_mode(database_url, MODES[name], args.threads, args.seconds)
+        latencies.sort()
+        print(f'{name:<18}{len(latencies) / args.seconds:>8.1f}{statistics.median(latencies) * 1000:>9.1f}'
+              f'{latencies[int(len(latencies) * 0.95)] * 1000:>9.1f}{connects:>10}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""Measure batch prescription export throughput in pages per second.
+
+Usage:
+    python -m benchmarks.prescription_export [--appointments 50000] [--workers 1 4] [--database-url URL]
+
+Each worker count exports every completed visit twice: once with an empty
+PDF cache (every document rendered) and once with the cache it filled.
+"""
+import argparse
+import io
+import os
+import shutil
+import tempfile
+import zipfile
+
+from app.prescriptions import BatchExport
+from benchmarks.datagen import create_bench_app, populate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url')
+    parser.add_argument('--doctors', type=int, default=50)
+    parser.add_argument('--patients', type=int, default=5000)
+    parser.add_argument('--appointments', type=int, default=50000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, os.cpu_count() or 1])
+    args = parser.parse_args()
+
+    app = create_bench_app(args.database_url)
+    with app.app_context():
+        populate(doctors=args.doctors, patients=args.patients, appointments=args.appointments)
+
+        print(f'{"workers":>8}{"cache":>7}{"documents":>11}{"pages":>8}{"seconds":>9}{"pages/s":>9}{"MB":>8}')
+        for workers in dict.fromkeys(args.workers):
+            cache_dir = tempfile.mkdtemp(prefix='hms-bench-rx-')
+            try:
+                for cache in ('cold', 'warm'):
+                    export = BatchExport(cache_dir=cache_dir, workers=workers)
+                    archive = b''.join(export.chunks())
+                    # The archive must be complete and readable
+                    with zipfile.ZipFile(io.BytesIO(archive)) as check:
+                        assert check.testzip() is None and len(check.namelist()) == export.documents
+                    print(f'{workers:>8}{cache:>7}{export.documents:>11}{export.pages:>8}{export.seconds:>9.2f}'
+                          f'{export.pages_per_second:>9.0f}{len(archive) / 1e6:>8.1f}')
+            finally:
+                shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
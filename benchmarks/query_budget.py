@@ -0,0 +1,96 @@
+"""Check that every listing page stays within its SQL statement budget.
+
+Usage:
+    python -m benchmarks.query_budget [--appointments 20000]
+
+A page that regresses to lazy loading issues one query per rendered row and
+blows through its budget; the offending statements are printed and the
+script exits with status 1.
+"""
+import argparse
+import sys
+
+from app.models import db, User, Doctor, Patient, Appointment
+from app.profiling import assert_max_queries
+from benchmarks.datagen import create_bench_app, login_as, populate
+
+# Budgets include the user + profile load issued by every authenticated request (app/profiles.py)
+PAGE_BUDGETS = {
+    'admin': {
+        '/admin/dashboard': 8,
+        '/admin/appointments': 4,
+        '/admin/appointments?status=Completed': 4,
+        '/admin/doctors': 3,
+        '/admin/patients': 3,
+        '/api/v1/appointments': 2,
+        '/api/v1/appointments?search=smith&status=Completed': 2,
+        '/api/v1/dashboard/stats': 2,
+        '/admin/analytics': 6,
+        '/api/v1/reports/appointments': 5,
+    },
+    'doctor': {
+        # One of these is the version lookup behind the dashboard's ETag (app/http_cache.py)
+        '/doctor/dashboard': 6,
+        # History pages read a page from each tier (app/archive.py)
+        '/doctor/patients/{patient_id}/history': 5,
+        '/doctor/availability': 3,
+        '/api/v1/appointments': 2,
+        '/api/v1/patients/{patient_id}/history': 4,
+    },
+    'patient': {
+        '/patient/dashboard': 6,
+        '/patient/doctors': 5,
+        '/patient/book-appointment/{doctor_id}': 4,
+        '/api/v1/doctors': 3,
+        '/api/v1/doctors/{doctor_id}/slots': 4,
+    },
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url')
+    parser.add_argument('--doctors', type=int, default=20)
+    parser.add_argument('--patients', type=int, default=200)
+    parser.add_argument('--appointments', type=int, default=20000)
+    args = parser.parse_args()
+
+    app = create_bench_app(args.database_url)
+    with app.app_context():
+        populate(doctors=args.doctors, patients=args.patients, appointments=args.appointments)
+
+        # The busiest doctor and patient give the worst case for their pages
+        doctor_id = db.session.query(Appointment.doctor_id).group_by(Appointment.doctor_id).order_by(
+            db.func.count().desc()).limit(1).scalar()
+        patient_id = db.session.query(Appointment.patient_id).group_by(Appointment.patient_id).order_by(
+            db.func.count().desc()).limit(1).scalar()
+        user_ids = {
+            'admin': User.query.filter_by(username='admin').first().id,
+            'doctor': db.session.get(Doctor, doctor_id).user_id,
+            'patient': db.session.get(Patient, patient_id).user_id,
+        }
+        engine = db.engine
+
+    # Requests run outside the setup context so each one gets a fresh ``g``
+    failures = 0
+    for role, pages in PAGE_BUDGETS.items():
+        client = login_as(app, user_ids[role])
+        for url, budget in pages.items():
+            url = url.format(doctor_id=doctor_id, patient_id=patient_id)
+            # Warm up once so one-off work (e.g. initialising counters) is not counted
+            client.get(url)
+            try:
+                with assert_max_queries(budget, engine) as counter:
+                    response = client.get(url)
+                if response.status_code != 200:
+                    raise AssertionError(f'Unexpected status {response.status_code}')
+                print(f'ok    {counter.count:3d}/{budget:<3d} {url}')
+            except AssertionError as exc:
+                failures += 1
+                print(f'FAIL  {url}\n{exc}')
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Measure as-you-type search latency against the ILIKE baseline.
+
+Usage:
+    python -m benchmarks.search_latency [--patients 1000000] [--database-url URL]
+
+Each search term is typed one character at a time, the way the search boxes
+are used, and every prefix runs the same query the admin and patient pages
+issue (first page only). The ILIKE baseline is the query the pages ran before
+``app.search`` existed.
+"""
+import argparse
+import statistics
+import time as timer
+
+from app.models import db, Doctor, Patient, Appointment
+from app.search import search_doctors, search_patients, search_appointments
+from benchmarks.datagen import create_bench_app, populate
+
+TERMS = ['john smi', 'patel', 'maria gar', 'card', 'nguyen', '4155550123']
+
+
+def like_baseline(kind, term):
+    pattern = f'%{term}%'
+    if kind == 'doctors':
+        return Doctor.query.filter(Doctor.full_name.ilike(pattern) | Doctor.specialization.ilike(pattern))
+    if kind == 'patients':
+        return Patient.query.filter(Patient.full_name.ilike(pattern) | Patient.phone.ilike(pattern))
+    return Appointment.query.join(Patient).join(Doctor).filter(
+        Patient.full_name.ilike(pattern) | Doctor.full_name.ilike(pattern))
+
+
+def indexed(kind, term):
+    if kind == 'doctors':
+        return search_doctors(Doctor.query, term, ranked=True)
+    if kind == 'patients':
+        return search_patients(Patient.query, term).order_by(Patient.id)
+    return search_appointments(Appointment.query, term).order_by(Appointment.id.desc())
+
+
+def measure(build, kind, per_page):
+    timings = []
+    for term in TERMS:
+        for end in range(2, len(term) + 1):
+            start = timer.perf_counter()
+            build(kind, term[:end]).limit(per_page).all()
+            timings.append((timer.perf_counter() - start) * 1000)
+            db.session.expunge_all()
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1], timings[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url')
+    parser.add_argument('--doctors', type=int, default=500)
+    parser.add_argument('--patients', type=int, default=200000)
+    parser.add_argument('--appointments', type=int, default=500000)
+    parser.add_argument('--per-page', type=int, default=24)
+    args = parser.parse_args()
+
+    app = create_bench_app(args.database_url)
+    with app.app_context():
+        start = timer.perf_counter()
+        populate(doctors=args.doctors, patients=args.patients, appointments=args.appointments)
+        print(f'Populated in {timer.perf_counter() - start:.1f}s, '
+              f'search backend: {app.extensions["search_backend"]}')
+
+        print(f'\n{"":<14}{"p50 ms":>10}{"p95 ms":>10}{"max ms":>10}')
+        for kind in ('doctors', 'patients', 'appointments'):
+            for label, build in (('ilike', like_baseline), ('indexed', indexed)):
+                p50, p95, worst = measure(build, kind, args.per_page)
+                print(f'{kind[:6] + " " + label:<14}{p50:>10.2f}{p95:>10.2f}{worst:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
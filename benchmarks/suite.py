@@ -0,0 +1,534 @@
+"""Drive every page of the app against a generated database and compare with stored baselines.
+
+Usage:
+    python -m benchmarks.suite [--scale small|medium|large] [--database-url URL]
+        [--iterations 20] [--write-iterations 5] [--threads 8] [--seconds 10]
+        [--save benchmarks/baselines/small-sqlite.json] [--compare benchmarks/baselines/small-sqlite.json]
+
+The database is populated by the seeded generator in benchmarks/datagen.py
+unless it already holds doctors, so a large database (``--scale large``:
+500 doctors, 1M patients, 10M appointments) is generated once and reused by
+pointing ``--database-url`` at it. ``--doctors``, ``--patients`` and
+``--appointments`` override the preset volumes.
+
+Every route of the auth, admin, doctor and patient blueprints has at least
+one scenario below; the suite refuses to run if a route is missing, so new
+pages get benchmarked from the start. Two drivers run the scenarios:
+
+* the Flask test client, one request at a time: reads ``--iterations``
+  times, writes (and full exports) ``--write-iterations`` times, each write
+  on rows created for it beforehand;
+* an HTTP driver: ``--threads`` keep-alive connections to a threaded local
+  server, cycling through the read scenarios for ``--seconds``.
+
+Both report p50/p95/p99 latency and SQL statements per request (taken from
+the ``Server-Timing`` header of app/profiling.py). ``--save`` writes the
+results as JSON; ``--compare`` checks them against a saved baseline and
+exits with status 1 if a page now issues more queries or, for scenarios
+timed at least 10 times, its median latency grew by more than
+``--tolerance``. Query counts are exact; latency comparisons need the same
+machine and a quiet one.
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from werkzeug.serving import make_server
+
+from app import passwords
+from app.schedules import EDITABLE_DAYS, WEEKDAYS
+from app.models import db, User, Department, Doctor, Patient, Appointment, Treatment, DoctorAvailability
+from benchmarks.datagen import PLACEHOLDER_HASH, create_bench_app, login_as, populate
+
+# (doctors, patients, appointments)
+SCALES = {
+    'small': (50, 5000, 100000),
+    'medium': (200, 100000, 1000000),
+    'large': (500, 1000000, 10000000),
+}
+BLUEPRINTS = ('auth', 'admin', 'doctor', 'patient')
+LOGIN_PASSWORD = 'bench-password'
+# Fewer timed requests than this only have their query counts compared with a baseline
+MIN_TIMED_REQUESTS = 10
+
+
+class Fixture:
+    """Ids of the rows the scenarios work on, and factories for rows that writes consume"""
+
+    def __init__(self):
+        self.admin_id = User.query.filter_by(username='admin').one().id
+        doctor = Doctor.query.order_by(Doctor.id).first()
+        visit = (db.session.query(Appointment).join(Treatment)
+                 .filter(Appointment.doctor_id == doctor.id, Appointment.status == 'Completed').first())
+        booked = Appointment.query.filter_by(doctor_id=doctor.id, status='Booked').first()
+        patient = db.session.get(Patient, visit.patient_id)
+        self.doctor_id, self.doctor_user_id = doctor.id, doctor.user_id
+        self.doctor_username = doctor.user.username
+        self.patient_id, self.patient_user_id = patient.id, patient.user_id
+        self.patient_username = patient.user.username
+        self.visit_id = visit.id
+        self.booked_id = booked.id
+        self.department_id = doctor.department_id
+        self.token = datetime.now().strftime('%Y%m%d%H%M%S')
+        self.counter = 0
+        # Past the rows earlier runs left in a reused database
+        last_days = [db.session.query(db.func.max(Appointment.appointment_date)).filter_by(doctor_id=doctor.id).scalar(),
+                     db.session.query(db.func.max(DoctorAvailability.date)).filter_by(doctor_id=doctor.id).scalar(),
+                     date.today() + timedelta(days=1000)]
+        self.first_free_day = max(day for day in last_days if day is not None)
+        self.login_username = f'bench_login_{self.token}'
+        db.session.add(User(username=self.login_username, email=f'{self.login_username}@example.com',
+                            password_hash=passwords.hash_password(LOGIN_PASSWORD), role='patient'))
+        db.session.commit()
+
+    def unique(self):
+        self.counter += 1
+        return f'{self.token}_{self.counter}'
+
+    def free_day(self):
+        """A day after every appointment and availability of the doctor"""
+        self.counter += 1
+        return self.first_free_day + timedelta(days=self.counter)
+
+    def new_department(self):
+        department = Department(name=f'Bench Department {self.unique()}')
+        db.session.add(department)
+        db.session.commit()
+        return department.id
+
+    def _new_user(self, role):
+        name = f'bench_{role}_{self.unique()}'
+        user = User(username=name, email=f'{name}@example.com', password_hash=PLACEHOLDER_HASH, role=role)
+        db.session.add(user)
+        db.session.flush()
+        return user
+
+    def new_doctor(self):
+        doctor = Doctor(user_id=self._new_user('doctor').id, department_id=self.department_id,
+                        full_name='Bench Doctor', specialization='General')
+        db.session.add(doctor)
+        db.session.commit()
+        return doctor.id
+
+    def new_patient(self):
+        patient = Patient(user_id=self._new_user('patient').id, full_name='Bench Patient')
+        db.session.add(patient)
+        db.session.commit()
+        return patient.id
+
+    def new_appointment(self):
+        appointment = Appointment(patient_id=self.patient_id, doctor_id=self.doctor_id, appointment_date=self.free_day(),
+                                  appointment_time=datetime.strptime('09:00', '%H:%M').time(), status='Booked')
+        db.session.add(appointment)
+        db.session.commit()
+        return appointment.id
+
+    def open_day(self):
+        day = self.free_day()
+        db.session.add(DoctorAvailability(doctor_id=self.doctor_id, date=day,
+                                          start_time=datetime.strptime('09:00', '%H:%M').time(),
+                                          end_time=datetime.strptime('17:00', '%H:%M').time()))
+        db.session.commit()
+        return day
+
+    def appointments_csv(self, rows=10):
+        day = self.free_day().isoformat()
+        lines = ['patient_username,doctor_username,appointment_date,appointment_time,status,diagnosis,prescription']
+        lines += [f'{self.patient_username},{self.doctor_username},{day},{9 + i // 2:02d}:{30 * (i % 2):02d},'
+                  f'Completed,Routine checkup,No medication' for i in range(rows)]
+        return '\n'.join(lines).encode()
+
+
+class Scenario:
+    """One request to benchmark.
+
+    ``path`` and ``data`` are either fixed (``path`` may use Fixture fields
+    as ``{doctor_id}``) or callables ``f(fixture)`` evaluated before every
+    request, for writes that need a fresh row each time. ``kind`` is
+    ``read``, ``write`` (repeated ``--write-iterations`` times and skipped
+    by the HTTP driver) or ``heavy`` (a read treated like a write).
+    """
+
+    def __init__(self, endpoint, role, path, method='GET', data=None, kind='read', label=None):
+        self.endpoint = endpoint
+        self.role = role
+        self.path = path
+        self.method = method
+        self.data = data
+        self.kind = kind
+        self.label = label or f'{method} {path if isinstance(path, str) else endpoint}'
+
+    def request(self, fixture):
+        path = self.path(fixture) if callable(self.path) else self.path.format(**vars(fixture))
+        data = self.data(fixture) if callable(self.data) else self.data
+        return path, data
+
+
+def _complete_form(fixture):
+    return {'diagnosis': 'Routine checkup', 'prescription': 'No medication', 'notes': 'Benchmark'}
+
+
+def _book(fixture):
+    return {'appointment_slot': f'{fixture.open_day().isoformat()}T09:00', 'reason': 'Benchmark'}
+
+
+def _register(fixture):
+    name = f'bench_register_{fixture.unique()}'
+    return {'username': name, 'email': f'{name}@example.com', 'password': LOGIN_PASSWORD, 'full_name': 'Bench Patient'}
+
+
+def _add_doctor(fixture):
+    name = f'bench_add_doctor_{fixture.unique()}'
+    return {'username': name, 'email': f'{name}@example.com', 'password': LOGIN_PASSWORD, 'full_name': 'Bench Doctor',
+            'department_id': fixture.department_id, 'specialization': 'General', 'experience_years': '3'}
+
+
+def _import(fixture):
+    from io import BytesIO
+    return {'kind': 'appointments', 'file': (BytesIO(fixture.appointments_csv()), 'appointments.csv')}
+
+
+DOCTOR_FORM = {'full_name': 'Bench Doctor', 'specialization': 'General', 'phone': '5550100',
+               'qualification': 'MBBS', 'experience_years': '10'}
+PATIENT_FORM = {'full_name': 'Bench Patient', 'phone': '5550101', 'address': '1 Bench Street',
+                'blood_group': 'O+', 'emergency_contact': '5550102'}
+def _weekly(fixture):
+    form = {'section': 'weekly'}
+    for weekday, name in enumerate(WEEKDAYS):
+        day = name.lower()
+        form.update({f'start_time_{day}': '09:00', f'end_time_{day}': '17:00'})
+        if weekday < 5:
+            form[f'available_{day}'] = 'on'
+    return form
+
+
+def _availability(fixture):
+    days = [(date.today() + timedelta(days=i)).isoformat() for i in range(EDITABLE_DAYS)]
+    form = {'section': 'dates', 'date': days}
+    for day in days:
+        form.update({f'available_{day}': 'on', f'start_time_{day}': '09:00', f'end_time_{day}': '17:00'})
+    return form
+
+SCENARIOS = [
+    # auth
+    Scenario('auth.index', 'anonymous', '/'),
+    Scenario('auth.login', 'anonymous', '/login'),
+    Scenario('auth.login', 'anonymous', '/login', 'POST', kind='write',
+             data=lambda fx: {'username': fx.login_username, 'password': LOGIN_PASSWORD}),
+    Scenario('auth.register', 'anonymous', '/register'),
+    Scenario('auth.register', 'anonymous', '/register', 'POST', data=_register, kind='write'),
+    Scenario('auth.logout', 'fresh_patient', '/logout', kind='write'),
+    Scenario('auth.print_prescription', 'patient', '/prescription/{visit_id}/print'),
+    # admin
+    Scenario('admin.dashboard', 'admin', '/admin/dashboard'),
+    Scenario('admin.departments', 'admin', '/admin/departments'),
+    Scenario('admin.add_department', 'admin', '/admin/departments/add'),
+    Scenario('admin.add_department', 'admin', '/admin/departments/add', 'POST', kind='write',
+             data=lambda fx: {'name': f'Bench Department {fx.unique()}', 'description': 'Benchmark'}),
+    Scenario('admin.edit_department', 'admin', '/admin/departments/edit/{department_id}'),
+    Scenario('admin.edit_department', 'admin', lambda fx: f'/admin/departments/edit/{fx.new_department()}', 'POST',
+             data=lambda fx: {'name': f'Bench Department {fx.unique()}', 'description': 'Edited'}, kind='write'),
+    Scenario('admin.delete_department', 'admin', lambda fx: f'/admin/departments/delete/{fx.new_department()}',
+             kind='write'),
+    Scenario('admin.doctors', 'admin', '/admin/doctors'),
+    Scenario('admin.doctors', 'admin', '/admin/doctors?search=smith'),
+    Scenario('admin.add_doctor', 'admin', '/admin/doctors/add'),
+    Scenario('admin.add_doctor', 'admin', '/admin/doctors/add', 'POST', data=_add_doctor, kind='write'),
+    Scenario('admin.edit_doctor', 'admin', '/admin/doctors/edit/{doctor_id}'),
+    Scenario('admin.edit_doctor', 'admin', '/admin/doctors/edit/{doctor_id}', 'POST', kind='write',
+             data=lambda fx: dict(DOCTOR_FORM, department_id=fx.department_id)),
+    Scenario('admin.delete_doctor', 'admin', lambda fx: f'/admin/doctors/delete/{fx.new_doctor()}', kind='write'),
+    Scenario('admin.patients', 'admin', '/admin/patients'),
+    Scenario('admin.patients', 'admin', '/admin/patients?search=mar'),
+    Scenario('admin.patients', 'admin', '/admin/patients?search=555'),
+    Scenario('admin.edit_patient', 'admin', '/admin/patients/edit/{patient_id}'),
+    Scenario('admin.edit_patient', 'admin', '/admin/patients/edit/{patient_id}', 'POST', data=PATIENT_FORM,
+             kind='write'),
+    Scenario('admin.delete_patient', 'admin', lambda fx: f'/admin/patients/delete/{fx.new_patient()}', kind='write'),
+    Scenario('admin.appointments', 'admin', '/admin/appointments'),
+    Scenario('admin.appointments', 'admin', '/admin/appointments?status=Completed'),
+    Scenario('admin.appointments', 'admin', '/admin/appointments?search=smith'),
+    Scenario('admin.cancel_appointment', 'admin',
+             lambda fx: f'/admin/appointments/{fx.new_appointment()}/cancel', kind='write'),
+    Scenario('admin.export', 'admin', '/admin/export/appointments?format=csv', kind='heavy'),
+    Scenario('admin.export', 'admin', '/admin/export/patients?format=ndjson', kind='heavy'),
+    Scenario('admin.export_prescriptions', 'admin', '/admin/export/prescriptions.zip?doctor={doctor_id}',
+             kind='heavy'),
+    Scenario('admin.import_data', 'admin', '/admin/import'),
+    Scenario('admin.import_data', 'admin', '/admin/import', 'POST', data=_import, kind='write'),
+    Scenario('admin.performance', 'admin', '/admin/performance'),
+    Scenario('admin.analytics', 'admin', '/admin/analytics'),
+    Scenario('admin.analytics', 'admin', '/admin/analytics?department=1'),
+    # doctor
+    Scenario('doctor.dashboard', 'doctor', '/doctor/dashboard'),
+    Scenario('doctor.availability', 'doctor', '/doctor/availability'),
+    Scenario('doctor.availability', 'doctor', '/doctor/availability', 'POST', data=_availability, kind='write'),
+    Scenario('doctor.availability', 'doctor', '/doctor/availability', 'POST', data=_weekly, kind='write',
+             label='POST /doctor/availability (weekly)'),
+    Scenario('doctor.patient_history', 'doctor', '/doctor/patients/{patient_id}/history'),
+    Scenario('doctor.patient_history', 'doctor', '/doctor/patients/{patient_id}/history?partial=1'),
+    Scenario('doctor.complete_appointment', 'doctor', '/doctor/appointments/{booked_id}/complete'),
+    Scenario('doctor.complete_appointment', 'doctor',
+             lambda fx: f'/doctor/appointments/{fx.new_appointment()}/complete', 'POST', data=_complete_form,
+             kind='write'),
+    Scenario('doctor.cancel_appointment', 'doctor',
+             lambda fx: f'/doctor/appointments/{fx.new_appointment()}/cancel', kind='write'),
+    # patient
+    Scenario('patient.dashboard', 'patient', '/patient/dashboard'),
+    Scenario('patient.doctors', 'patient', '/patient/doctors'),
+    Scenario('patient.doctors', 'patient', '/patient/doctors?search=cardio'),
+    Scenario('patient.book_appointment', 'patient', '/patient/book-appointment/{doctor_id}'),
+    Scenario('patient.book_appointment', 'patient', '/patient/book-appointment/{doctor_id}', 'POST', data=_book,
+             kind='write'),
+    Scenario('patient.cancel_appointment', 'patient',
+             lambda fx: f'/patient/appointments/{fx.new_appointment()}/cancel', kind='write'),
+    Scenario('patient.profile', 'patient', '/patient/profile'),
+    Scenario('patient.profile', 'patient', '/patient/profile', 'POST', data=PATIENT_FORM, kind='write'),
+]
+
+
+def uncovered_endpoints(app):
+    covered = {scenario.endpoint for scenario in SCENARIOS}
+    return sorted(rule.endpoint for rule in app.url_map.iter_rules()
+                  if rule.endpoint.split('.')[0] in BLUEPRINTS and rule.endpoint not in covered)
+
+
+def _timing(values):
+    """(queries, db ms) from Server-Timing header values"""
+    header = ', '.join(values)
+    queries = re.search(r'desc="(\d+) queries"', header)
+    db_time = re.search(r'db;dur=([\d.]+)', header)
+    return (int(queries.group(1)) if queries else 0), (float(db_time.group(1)) if db_time else 0.0)
+
+
+def summarize(samples, errors=0, seconds=None):
+    """samples: list of (latency s, queries, db ms)"""
+    latencies = sorted(sample[0] * 1000 for sample in samples)
+    if not latencies:
+        return {'requests': 0, 'errors': errors}
+
+    def pct(p):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))], 2)
+
+    summary = {
+        'requests': len(latencies), 'errors': errors,
+        'p50': pct(50), 'p95': pct(95), 'p99': pct(99),
+        'queries': round(statistics.mean(sample[1] for sample in samples), 1),
+        'max_queries': max(sample[1] for sample in samples),
+        'db_ms': round(statistics.mean(sample[2] for sample in samples), 2),
+    }
+    if seconds:
+        summary['rps'] = round(len(latencies) / seconds, 1)
+    return summary
+
+
+def client_for(app, fixture, role):
+    user_ids = {'admin': fixture.admin_id, 'doctor': fixture.doctor_user_id,
+                'patient': fixture.patient_user_id, 'fresh_patient': fixture.patient_user_id}
+    return app.test_client() if role == 'anonymous' else login_as(app, user_ids[role])
+
+
+def drive_client(app, fixture, iterations, write_iterations):
+    """Run every scenario through the test client, one request at a time"""
+    results = {}
+    clients = {}
+    for scenario in SCENARIOS:
+        repeat = iterations if scenario.kind == 'read' else write_iterations
+        samples, errors = [], 0
+        for i in range(repeat + (scenario.kind == 'read')):
+            # Logins, registrations and logouts need a client in a fresh state every time
+            if scenario.role in ('anonymous', 'fresh_patient'):
+                client = client_for(app, fixture, scenario.role)
+            else:
+                client = clients.setdefault(scenario.role, client_for(app, fixture, scenario.role))
+            with app.app_context():
+                path, data = scenario.request(fixture)
+            start = time.perf_counter()
+            response = client.open(path, method=scenario.method, data=data)
+            response.get_data()
+            elapsed = time.perf_counter() - start
+            response.close()
+            if response.status_code >= 400:
+                errors += 1
+            elif scenario.kind != 'read' or i > 0:  # the first read is a warm-up
+                samples.append((elapsed,) + _timing(response.headers.getlist('Server-Timing')))
+        results[scenario.label] = summarize(samples, errors)
+    return results
+
+
+def session_cookie(app, user_id):
+    value = app.session_interface.get_signing_serializer(app).dumps({'_user_id': str(user_id), '_fresh': True})
+    return f'{app.config["SESSION_COOKIE_NAME"]}={value}'
+
+
+def drive_http(app, fixture, threads, seconds):
+    """Cycle through the read scenarios over keep-alive connections from ``threads`` threads"""
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    cookies = {'admin': session_cookie(app, fixture.admin_id), 'doctor': session_cookie(app, fixture.doctor_user_id),
+               'patient': session_cookie(app, fixture.patient_user_id)}
+    reads = [scenario for scenario in SCENARIOS if scenario.kind == 'read']
+    with app.app_context():
+        requests = [(scenario, scenario.request(fixture)[0]) for scenario in reads]
+    samples = {scenario.label: [] for scenario in reads}
+    errors = {scenario.label: 0 for scenario in reads}
+    deadline = time.perf_counter() + seconds
+
+    def worker(offset):
+        conn = http.client.HTTPConnection('127.0.0.1', server.server_port)
+        i = offset
+        while time.perf_counter() < deadline:
+            scenario, path = requests[i % len(requests)]
+            i += 1
+            headers = {'Cookie': cookies[scenario.role]} if scenario.role in cookies else {}
+            start = time.perf_counter()
+            conn.request('GET', path, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            elapsed = time.perf_counter() - start
+            if response.status >= 400:
+                errors[scenario.label] += 1
+            else:
+                samples[scenario.label].append((elapsed,) + _timing(response.headers.get_all('Server-Timing') or []))
+        conn.close()
+
+    workers = [threading.Thread(target=worker, args=(n * len(requests) // threads,)) for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    server.shutdown()
+    results = {label: summarize(samples[label], errors[label]) for label in samples}
+    results['all reads'] = summarize([s for label in samples for s in samples[label]],
+                                     sum(errors.values()), seconds)
+    return results
+
+
+def print_results(title, results):
+    print(f'\n{title}')
+    print(f'{"scenario":<58}{"n":>5}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"queries":>9}{"max q":>7}{"err":>5}')
+    for label, row in results.items():
+        if not row['requests']:
+            print(f'{label:<58}{0:>5}{"":>43}{row["errors"]:>5}')
+            continue
+        print(f'{label:<58}{row["requests"]:>5}{row["p50"]:>9.1f}{row["p95"]:>9.1f}{row["p99"]:>9.1f}'
+              f'{row["queries"]:>9.1f}{row["max_queries"]:>7}{row["errors"]:>5}')
+    if 'rps' in results.get('all reads', {}):
+        print(f'throughput: {results["all reads"]["rps"]} requests/s')
+
+
+def compare(baseline, current, tolerance):
+    """Print differences against ``baseline``; return the list of regressions"""
+    regressions = []
+    print(f'\nCompared with baseline from {baseline["meta"].get("commit") or "unknown commit"} '
+          f'({baseline["meta"].get("created")})')
+    for driver in ('client', 'http'):
+        for label, now in current.get(driver, {}).items():
+            before = baseline.get(driver, {}).get(label)
+            if not before or not before.get('requests') or not now.get('requests'):
+                continue
+            notes = []
+            if now['max_queries'] > before['max_queries']:
+                notes.append(f'queries {before["max_queries"]} -> {now["max_queries"]}')
+            # The median is stable across runs where the tail of 20 samples is not; a couple
+            # of milliseconds on a fast page, or a handful of samples, is jitter too
+            if (min(now['requests'], before['requests']) >= MIN_TIMED_REQUESTS
+                    and now['p50'] > before['p50'] * (1 + tolerance) and now['p50'] - before['p50'] > 2):
+                notes.append(f'p50 {before["p50"]:.1f} -> {now["p50"]:.1f} ms '
+                             f'(p95 {before["p95"]:.1f} -> {now["p95"]:.1f} ms)')
+            if notes:
+                regressions.append(f'{driver}: {label}: {", ".join(notes)}')
+    for line in regressions:
+        print(f'REGRESSION  {line}')
+    if not regressions:
+        print('no regressions')
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url')
+    parser.add_argument('--scale', choices=list(SCALES), default='small')
+    parser.add_argument('--doctors', type=int)
+    parser.add_argument('--patients', type=int)
+    parser.add_argument('--appointments', type=int)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--write-iterations', type=int, default=5)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--no-http', action='store_true', help='skip the HTTP driver')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='allowed relative growth of median latency (default 0.5)')
+    args = parser.parse_args()
+
+    doctors, patients, appointments = SCALES[args.scale]
+    doctors, patients, appointments = args.doctors or doctors, args.patients or patients, args.appointments or appointments
+    # Quiet instrumentation: the suite reports queries itself
+    app = create_bench_app(args.database_url, INSTRUMENTATION=True, SLOW_QUERY_MS=float('inf'),
+                           N_PLUS_ONE_THRESHOLD=sys.maxsize)
+    missing = uncovered_endpoints(app)
+    if missing:
+        print('Routes without a benchmark scenario:', ', '.join(missing))
+        sys.exit(1)
+
+    with app.app_context():
+        if not Doctor.query.count():
+            # ~12 of 16 daily slots per doctor in use keeps most generated bookings valid
+            days = max(365, appointments // (doctors * 12))
+            start = time.perf_counter()
+            populate(doctors, patients, appointments, days=days, seed=args.seed)
+            print(f'populated {doctors} doctors, {patients} patients, {appointments} appointments '
+                  f'in {time.perf_counter() - start:.0f}s')
+        volumes = {'doctors': Doctor.query.count(), 'patients': Patient.query.count(),
+                   'appointments': Appointment.query.count()}
+        fixture = Fixture()
+        backend = db.engine.dialect.name
+        db.session.remove()
+
+    results = {
+        'meta': {'commit': git_commit(), 'created': datetime.now().isoformat(timespec='seconds'),
+                 'database': backend, 'volumes': volumes, 'python': platform.python_version(),
+                 'cpus': os.cpu_count(), 'iterations': args.iterations, 'write_iterations': args.write_iterations,
+                 'threads': args.threads, 'seconds': args.seconds},
+        'client': drive_client(app, fixture, args.iterations, args.write_iterations),
+    }
+    print(f'{backend}: {volumes}')
+    print_results('Test client (sequential)', results['client'])
+    if not args.no_http:
+        results['http'] = drive_http(app, fixture, args.threads, args.seconds)
+        print_results(f'HTTP driver ({args.threads} threads, {args.seconds:.0f}s)', results['http'])
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w') as out:
+            json.dump(results, out, indent=2)
+        print(f'\nsaved {args.save}')
+    if args.compare:
+        with open(args.compare) as baseline:
+            if compare(json.load(baseline), results, args.tolerance):
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,53 @@
 import os
 from urllib.parse import urlparse, urlunparse, urlencode, parse_qs
+from sqlalchemy.pool import NullPool
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 
+
+def env_flag(name, default):
+    """Read a boolean setting from the environment ('0', 'false' and 'no' are off)"""
+    return os.environ.get(name, '1' if default else '0').lower() not in ('0', 'false', 'no')
+
+
+def postgres_engine_options(pool):
+    """Engine options for the pg8000 driver, read from the environment.
+
+    ``pool`` is ``'queue'`` to keep a pool of connections per process, or
+    ``'null'`` to open a connection per checkout and close it afterwards
+    (serverless functions, or behind an external pooler such as PgBouncer).
+    """
+    options = {}
+    if env_flag('DB_SSL', True):
+        options['connect_args'] = {'ssl_context': True}  # enables SSL for Neon
+    if pool == 'null':
+        options['poolclass'] = NullPool
+    else:
+        options.update(
+            pool_size=int(os.environ.get('DB_POOL_SIZE', 5)),
+            max_overflow=int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+            pool_timeout=int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+            # Replace connections before the server or proxy drops them as idle (Neon: 5 minutes)
+            pool_recycle=int(os.environ.get('DB_POOL_RECYCLE', 280)),
+            # Test each connection on checkout so a dropped one is replaced instead of failing the request
+            pool_pre_ping=env_flag('DB_POOL_PRE_PING', True),
+        )
+    return options
+
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
     
     database_url = os.environ.get('DATABASE_URL', '')
-    
+
+    # Postgres connection pool mode, 'queue' or 'null' (see postgres_engine_options)
+    DB_POOL = os.environ.get('DB_POOL', 'queue').lower()
+
+    # Prepared statements kept per Postgres connection (0 = off, the default; e.g. 100). It relies on
+    # pg8000 internals (app/statement_cache.py), and named statements do not survive PgBouncer in
+    # transaction mode
+    DB_STATEMENT_CACHE_SIZE = int(os.environ.get('DB_STATEMENT_CACHE_SIZE', 0))
+
     if database_url:
         # Convert to pg8000 dialect
         if database_url.startswith('postgres://'):
@@ -25,13 +65,93 @@ class Config:
         ))
         
         SQLALCHEMY_DATABASE_URI = clean_url
-        SQLALCHEMY_ENGINE_OPTIONS = {
-            'connect_args': {
-                'ssl_context': True  # enables SSL for Neon
-            }
-        }
+        SQLALCHEMY_ENGINE_OPTIONS = postgres_engine_options(DB_POOL)
     else:
         SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(basedir, 'instance', 'hospital.db')
         SQLALCHEMY_ENGINE_OPTIONS = {}
     
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Create tables and seed defaults before the first request if the schema stamp is out of date;
+    # turn off when `flask init-db` runs at deploy time
+    AUTO_INIT_DB = env_flag('AUTO_INIT_DB', True)
+
+    # Seconds a logged-in user and their profile are reused across requests without a query (0 = off)
+    PROFILE_CACHE_TTL = int(os.environ.get('PROFILE_CACHE_TTL', 0))
+
+    # Request instrumentation (app/profiling.py): Server-Timing headers, slow-query and N+1 warnings
+    # and per-endpoint percentiles on /admin/performance. N_PLUS_ONE_THRESHOLD is how many executions
+    # of one statement in a request get logged; INSTRUMENTATION_WINDOW is requests kept per endpoint.
+    INSTRUMENTATION = env_flag('INSTRUMENTATION', False)
+    SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 100))
+    N_PLUS_ONE_THRESHOLD = int(os.environ.get('N_PLUS_ONE_THRESHOLD', 5))
+    INSTRUMENTATION_WINDOW = int(os.environ.get('INSTRUMENTATION_WINDOW', 1000))
+
+    # Rendered template fragments (app/fragments.py): 'lru' in each process's memory, 'filesystem' shared by
+    # the processes of one host under FRAGMENT_CACHE_DIR, or 'null' for none. FRAGMENT_CACHE_SIZE is the
+    # most fragments kept; FRAGMENT_CACHE_TIMEOUT bounds in seconds how long other 'lru' processes can
+    # show a fragment after the data behind it changed.
+    FRAGMENT_CACHE = os.environ.get('FRAGMENT_CACHE', 'lru').lower()
+    FRAGMENT_CACHE_DIR = os.environ.get('FRAGMENT_CACHE_DIR', os.path.join(basedir, 'instance', 'fragments'))
+    FRAGMENT_CACHE_SIZE = int(os.environ.get('FRAGMENT_CACHE_SIZE', 5000))
+    FRAGMENT_CACHE_TIMEOUT = int(os.environ.get('FRAGMENT_CACHE_TIMEOUT', 60))
+
+    # Maximum age in seconds of a dashboard counter before it is recounted on read
+    STATS_MAX_AGE = int(os.environ.get('STATS_MAX_AGE', 300))
+
+    # Maximum age in seconds of the appointment rollups before the analytics page refreshes them
+    REPORTS_MAX_AGE = int(os.environ.get('REPORTS_MAX_AGE', 300))
+
+    # Length of a bookable appointment slot in minutes
+    APPOINTMENT_SLOT_MINUTES = int(os.environ.get('APPOINTMENT_SLOT_MINUTES', 30))
+
+    # Rows per page on paginated listings
+    ITEMS_PER_PAGE = int(os.environ.get('ITEMS_PER_PAGE', 24))
+
+    # Visits per page of a patient's history timeline; older pages load as the doctor scrolls
+    TIMELINE_PER_PAGE = int(os.environ.get('TIMELINE_PER_PAGE', 10))
+
+    # Password hashing method and cost in Werkzeug notation; stored hashes made with other parameters
+    # are upgraded on login. Hashing runs in a pool of PASSWORD_HASH_WORKERS processes (0 = one per
+    # CPU, 1 = in the request thread), see app/passwords.py.
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 0))
+
+    # Bulk import: rows per batch (one commit each) and password hashing processes (0 = one per CPU)
+    IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', 5000))
+    IMPORT_HASH_WORKERS = int(os.environ.get('IMPORT_HASH_WORKERS', 0))
+
+    # Batch prescription export: PDF rendering processes (0 = one per CPU) and where rendered files are kept
+    PDF_WORKERS = int(os.environ.get('PDF_WORKERS', 0))
+    PRESCRIPTION_CACHE_DIR = os.environ.get('PRESCRIPTION_CACHE_DIR',
+                                            os.path.join(basedir, 'instance', 'prescriptions'))
+
+    # Background jobs (app/jobs.py, run by `flask run-jobs`): jobs claimed per batch, attempts before a job is
+    # marked failed, seconds before the first retry (doubled per attempt), seconds after which a job still
+    # running is presumed lost and retried, seconds between polls of an idle queue, and how long finished jobs
+    # are kept (pruned every JOB_PRUNE_INTERVAL seconds)
+    JOB_BATCH_SIZE = int(os.environ.get('JOB_BATCH_SIZE', 100))
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+    JOB_RETRY_DELAY = int(os.environ.get('JOB_RETRY_DELAY', 30))
+    JOB_TIMEOUT = int(os.environ.get('JOB_TIMEOUT', 600))
+    JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 2))
+    JOB_RETENTION_DAYS = int(os.environ.get('JOB_RETENTION_DAYS', 7))
+    JOB_PRUNE_INTERVAL = int(os.environ.get('JOB_PRUNE_INTERVAL', 86400))
+
+    # Appointment reminders: hours ahead of the appointment, and seconds between scans for due ones
+    REMINDER_LEAD_HOURS = int(os.environ.get('REMINDER_LEAD_HOURS', 24))
+    REMINDER_SCAN_INTERVAL = int(os.environ.get('REMINDER_SCAN_INTERVAL', 300))
+
+    # Archiving (app/archive.py): completed and cancelled appointments older than ARCHIVE_AFTER_DAYS days
+    # (0 = never) move to the archive tables, ARCHIVE_BATCH_SIZE per transaction, every ARCHIVE_INTERVAL seconds
+    ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 365))
+    ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', 500))
+    ARCHIVE_INTERVAL = int(os.environ.get('ARCHIVE_INTERVAL', 3600))
+
+    # Patient notifications (app/notifications.py): 'file' appends them to NOTIFICATION_OUTBOX, 'smtp' sends
+    # them through SMTP_HOST:SMTP_PORT, 'null' drops them, or 'package.module:factory' for another sender
+    NOTIFICATION_SENDER = os.environ.get('NOTIFICATION_SENDER', 'file')
+    NOTIFICATION_OUTBOX = os.environ.get('NOTIFICATION_OUTBOX', os.path.join(basedir, 'instance', 'outbox.jsonl'))
+    SMTP_HOST = os.environ.get('SMTP_HOST', 'localhost')
+    SMTP_PORT = int(os.environ.get('SMTP_PORT', 1025))
+    MAIL_FROM = os.environ.get('MAIL_FROM', 'HealthCare Plus <no-reply@hospital.com>')